@@ -0,0 +1,157 @@
+import gzip
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Boolean, Column, DateTime, Integer, select
+from sqlalchemy.orm import Session
+
+from .database import DB_DIR, SessionLocal
+from .models import LogEntry, Run
+from .storage import bulk_insert_entries, drop_run_rows, prepare_run_partition
+
+logger = logging.getLogger(__name__)
+
+
+# Холодное хранилище: строки старых запусков выносятся в файлы Parquet (zstd) и удаляются из БД.
+# С несколькими репликами ARCHIVE_DIR — общий том: восстановить запуск может любая из них.
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR") or DB_DIR / "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "0") or 0)  # 0 = archival disabled
+SEGMENT_ROWS = 10_000  # строк в row group
+COMPRESSION = "zstd"
+
+_rehydrate_lock = threading.Lock()
+
+# хранимые колонки log_entries по именам атрибутов модели
+_fields = [(key, col) for key, col in LogEntry.__mapper__.columns.items() if isinstance(col, Column)]
+_datetime_fields = {key for key, col in _fields if isinstance(col.type, DateTime)}
+
+
+def _arrow_type(col: Column) -> pa.DataType:
+    if isinstance(col.type, Boolean):
+        return pa.bool_()
+    if isinstance(col.type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(col.type, Integer):
+        return pa.int64()
+    return pa.string()
+
+
+ARCHIVE_SCHEMA = pa.schema([(key, _arrow_type(col)) for key, col in _fields])
+
+
+def _locked_run(db: Session, run_id: int, *criteria) -> Optional[int]:
+    # строка runs под блокировкой до конца транзакции (FOR UPDATE на PostgreSQL): вторая реплика
+    # дождётся её и перепроверит условие; на SQLite пишет один процесс, FOR UPDATE не нужен
+    return db.execute(select(Run.id).where(Run.id == run_id, *criteria).with_for_update()).scalar()
+
+
+def archive_run(db: Session, run: Run) -> Optional[Path]:
+    """Move the rows of a parsed run into ARCHIVE_DIR; None if the run is no longer a parsed,
+    unarchived one (archived, reprocessed or deleted meanwhile, possibly by another replica)."""
+    if _locked_run(db, run.id, Run.status == "parsed", Run.archived_path.is_(None)) is None:
+        db.rollback()
+        return None
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    path = ARCHIVE_DIR / f"run_{run.id}.parquet"
+    tmp = path.with_suffix(".tmp")
+
+    stmt = select(*(col for _key, col in _fields)).where(LogEntry.run_id == run.id).order_by(LogEntry.id)
+    result = db.execute(stmt.execution_options(yield_per=SEGMENT_ROWS))
+    with pq.ParquetWriter(tmp, ARCHIVE_SCHEMA, compression=COMPRESSION) as writer:
+        for rows in result.partitions():
+            columns = {key: [r[i] for r in rows] for i, (key, _col) in enumerate(_fields)}
+            writer.write_table(pa.table(columns, schema=ARCHIVE_SCHEMA), row_group_size=SEGMENT_ROWS)
+    tmp.replace(path)
+
+    # секция на PostgreSQL остаётся пустой: восстановление запуска пишет в неё же
+    run.archived_path = str(path)
+    run.status = "archived"
+    db.add(run)
+    drop_run_rows(db, run.id)
+    db.commit()
+    return path
+
+
+def _read_segments(path: Path) -> Iterator[List[Dict[str, Any]]]:
+    if path.suffix != ".gz":
+        archived = pq.ParquetFile(path)
+        for i in range(archived.num_row_groups):
+            yield archived.read_row_group(i).to_pylist()
+        return
+    # архивы прежнего формата: gzip JSONL, строка — колоночный сегмент {"column": [values...]}
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            segment = json.loads(line)
+            for key in _datetime_fields:
+                segment[key] = [datetime.fromisoformat(v) if v else None for v in segment[key]]
+            keys = list(segment)
+            yield [dict(zip(keys, values)) for values in zip(*segment.values())]
+
+
+def rehydrate_run(db: Session, run: Run) -> None:
+    path = Path(run.archived_path)
+    prepare_run_partition(db, run.id)
+    for rows in _read_segments(path):
+        bulk_insert_entries(db, rows)
+    run.archived_path = None
+    if run.status == "archived":
+        # reprocessing остаётся: задача перегона восстанавливает запуск перед чтением строк
+        run.status = "parsed"
+    db.add(run)
+    db.commit()
+    path.unlink(missing_ok=True)
+
+
+def ensure_hydrated(db: Session, run_id: int) -> None:
+    """Bring an archived run back into the database before it is queried."""
+    run = db.get(Run, run_id)
+    if run is None or not run.archived_path:
+        return
+    with _rehydrate_lock:
+        # одно восстановление на запуск и среди реплик: остальные ждут блокировку строки runs
+        locked = _locked_run(db, run_id, Run.archived_path.is_not(None))
+        db.refresh(run)
+        if locked is not None:
+            rehydrate_run(db, run)
+
+
+def archive_expired_runs(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS) -> List[int]:
+    if older_than_days <= 0:
+        return []
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    run_ids = db.execute(
+        select(Run.id).where(Run.created_at < cutoff, Run.status == "parsed", Run.archived_path.is_(None))
+    ).scalars().all()
+    archived = []
+    for run_id in run_ids:
+        run = db.get(Run, run_id)
+        try:
+            if run is not None and archive_run(db, run) is not None:
+                archived.append(run_id)
+        except Exception:
+            db.rollback()
+            logger.exception("Could not archive run %s", run_id)
+    return archived
+
+
+def _archive_expired() -> None:
+    db = SessionLocal()
+    try:
+        archived = archive_expired_runs(db)
+        if archived:
+            logger.info("Archived runs %s", archived)
+    finally:
+        db.close()
+
+
+def start_archive_worker() -> None:
+    """Startup: archive runs older than ARCHIVE_AFTER_DAYS in a background thread, without holding up boot."""
+    if ARCHIVE_AFTER_DAYS > 0:
+        threading.Thread(target=_archive_expired, name="archive-expired", daemon=True).start()
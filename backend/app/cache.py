@@ -0,0 +1,161 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models import Run, RunVersion
+from .storage import dialect_insert
+
+
+# Кэш готовых ответов read-эндпоинтов. Ответ по разобранному запуску зависит от run_id, версии
+# содержимого запуска (run_versions, её поднимают разбор и reprocess на любой реплике) и параметров
+# запроса; ETag строится из того же ключа, поэтому 304 отдаётся без построения ответа. 0 — кэш выключен.
+CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MB", "64")) * 1024 * 1024
+CACHEABLE_STATUSES = ("parsed", "archived")
+COUNT_CACHE_ENTRIES = 10_000
+
+# заголовки исходного ответа, которые сохраняются вместе с телом
+_KEPT_HEADERS = ("content-disposition",)
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    media_type: Optional[str]
+    headers: Dict[str, str]
+    etag: str
+
+
+class ResponseCache:
+    """Thread-safe LRU of response bodies, evicted by total body size."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: "OrderedDict[Tuple, CachedBody]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple, entry: CachedBody) -> None:
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self._items[key] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def invalidate_run(self, run_id: int) -> None:
+        with self._lock:
+            for key in [k for k in self._items if k[0] == run_id]:
+                self.size -= len(self._items.pop(key).body)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+_cache = ResponseCache(CACHE_MAX_BYTES)
+
+# итоговые счётчики /logs по сигнатуре фильтра: разные страницы одного фильтра считают COUNT один раз
+_counts: "OrderedDict[Tuple, int]" = OrderedDict()
+_counts_lock = threading.Lock()
+
+
+def bump_run_version(db: Session, run_id: int) -> None:
+    """Mark the rows of a run as changed for every replica; commits with the caller's transaction."""
+    t = RunVersion.__table__
+    stmt = dialect_insert(db, t).values(run_id=run_id, version=1)
+    db.execute(stmt.on_conflict_do_update(index_elements=[t.c.run_id], set_={"version": t.c.version + 1}))
+
+
+def run_version(db: Session, run_id: int) -> int:
+    return db.execute(select(RunVersion.version).where(RunVersion.run_id == run_id)).scalar() or 0
+
+
+def invalidate_run(run_id: int) -> None:
+    """Drop this process's cached responses and counts of a run (other replicas go by run_version)."""
+    _cache.invalidate_run(run_id)
+    with _counts_lock:
+        for key in [k for k in _counts if k[0] == run_id]:
+            del _counts[key]
+
+
+def cached_count(db: Session, run_id: int, signature: Tuple, compute: Callable[[], int]) -> int:
+    """compute() once per (run, filter signature) while the run is immutable."""
+    run = db.get(Run, run_id)
+    if run is None or run.status not in CACHEABLE_STATUSES:
+        return compute()
+    key = (run.id, run.created_at.isoformat(), run_version(db, run.id), signature)
+    with _counts_lock:
+        if key in _counts:
+            _counts.move_to_end(key)
+            return _counts[key]
+    total = compute()
+    with _counts_lock:
+        _counts[key] = total
+        while len(_counts) > COUNT_CACHE_ENTRIES:
+            _counts.popitem(last=False)
+    return total
+
+
+def _request_key(request: Request, run: Run, version: int) -> Tuple:
+    # created_at отличает новый запуск, получивший id удалённого (SQLite переиспользует id)
+    params = tuple(sorted((k, v) for k, v in request.query_params.multi_items() if v != ""))
+    return (run.id, run.created_at.isoformat(), version, request.url.path, params)
+
+
+def _etag(key: Tuple) -> str:
+    return '"' + hashlib.blake2b(repr(key).encode("utf-8"), digest_size=12).hexdigest() + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (t.strip().removeprefix("W/") for t in header.split(","))
+
+
+def cached_response(request: Request, db: Session, run_id: int, render: Callable[[], Response]) -> Response:
+    """Serve render()'s response from the cache when the run is immutable, with ETag revalidation."""
+    if CACHE_MAX_BYTES <= 0:
+        return render()
+    run = db.get(Run, run_id)
+    if run is None or run.status not in CACHEABLE_STATUSES:
+        return render()
+
+    key = _request_key(request, run, run_version(db, run.id))
+    etag = _etag(key)
+    # no-cache: браузер хранит ответ, но каждый раз сверяет ETag (304 без тела)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    entry = _cache.get(key)
+    if entry is None:
+        response = render()
+        if response.status_code != 200:
+            return response
+        if isinstance(response, StreamingResponse):
+            raise TypeError("cached_response needs a fully rendered Response")
+        body = bytes(response.body)
+        kept = {k: v for k, v in response.headers.items() if k in _KEPT_HEADERS}
+        entry = CachedBody(body, response.media_type, kept, etag)
+        _cache.put(key, entry)
+    return Response(entry.body, media_type=entry.media_type, headers={**entry.headers, **headers})
@@ -0,0 +1,121 @@
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy.orm import Session
+
+from .exporter import iter_export_batches
+
+
+# Колоночный экспорт (Parquet / Arrow IPC) для pandas, DuckDB и т.п.
+COMPRESSION = "zstd"
+
+_dict_string = pa.dictionary(pa.int32(), pa.string())
+
+LOG_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("us")),
+    ("level", _dict_string),
+    ("phase", _dict_string),
+    ("tf_req_id", _dict_string),
+    ("tf_resource_type", _dict_string),
+    ("tf_resource_name", pa.string()),
+    ("message", pa.string()),
+    ("is_error", pa.bool_()),
+    ("is_malformed", pa.bool_()),
+])
+
+TIMELINE_SCHEMA = pa.schema([
+    ("key", pa.string()),
+    ("start", pa.timestamp("us")),
+    ("end", pa.timestamp("us")),
+    ("count", pa.int64()),
+    ("errors", pa.int64()),
+    ("malformed", pa.int64()),
+])
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to the response generator."""
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self.chunks)
+        self.chunks = []
+        return out
+
+
+def _log_batches(db: Session, *criteria) -> Iterator[pa.RecordBatch]:
+    # level/phase/tf_req_id/tf_resource_type уже закодированы словарём в БД — так же и в Arrow.
+    # Словарь колонки один на весь поток и только дописывается: в Arrow IPC уходят дельты словаря,
+    # а не замены (замену в потоке понимает не всякий читатель, в IPC-файле её нет вовсе)
+    slots: List[Dict[int, int]] = [{} for _ in range(4)]  # id в dict_values -> индекс в словаре колонки
+    values: List[List[str]] = [[] for _ in range(4)]
+    for rows, names in iter_export_batches(db, *criteria):
+        cols = list(zip(*rows))
+        arrays = [pa.array(cols[0], type=pa.timestamp("us"))]
+        for ids, slot, vals in zip(cols[1:5], slots, values):
+            indices = []
+            for i in ids:
+                if i is None:
+                    indices.append(None)
+                    continue
+                k = slot.get(i)
+                if k is None:
+                    k = slot[i] = len(vals)
+                    vals.append(names.get(i))
+                indices.append(k)
+            arrays.append(pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), pa.array(vals, type=pa.string())))
+        arrays.append(pa.array(cols[5], type=pa.string()))
+        arrays.append(pa.array(cols[6], type=pa.string()))
+        arrays.append(pa.array(cols[7], type=pa.bool_()))
+        arrays.append(pa.array(cols[8], type=pa.bool_()))
+        yield pa.RecordBatch.from_arrays(arrays, schema=LOG_SCHEMA)
+
+
+def _timeline_batch(buckets: List[Tuple]) -> pa.RecordBatch:
+    cols = list(zip(*buckets)) or [[] for _ in TIMELINE_SCHEMA]
+    arrays = [pa.array(values, type=field.type) for values, field in zip(cols, TIMELINE_SCHEMA)]
+    return pa.RecordBatch.from_arrays(arrays, schema=TIMELINE_SCHEMA)
+
+
+def _stream(batches: Iterable[pa.RecordBatch], schema: pa.Schema, fmt: str) -> Iterator[bytes]:
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression=COMPRESSION)
+    else:
+        writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression=COMPRESSION, emit_dictionary_deltas=True))
+    for batch in batches:
+        writer.write_batch(batch)  # для parquet каждая пачка — отдельная row group
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
+
+
+def stream_logs(db: Session, fmt: str, *criteria) -> Iterator[bytes]:
+    return _stream(_log_batches(db, *criteria), LOG_SCHEMA, fmt)
+
+
+def stream_timeline(buckets: List[Tuple], fmt: str) -> Iterator[bytes]:
+    """Encode services.timeline_buckets() output."""
+    return _stream([_timeline_batch(buckets)], TIMELINE_SCHEMA, fmt)
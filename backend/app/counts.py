@@ -0,0 +1,60 @@
+from typing import List, Tuple
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from .cache import cached_count
+from .filters import LogFilters
+from .models import LogEntry, run_id_range
+
+
+# Стратегии подсчёта total для /logs:
+#   exact    — COUNT(*) по фильтру на каждый запрос (как раньше);
+#   cached   — точный COUNT один раз на сигнатуру фильтра для неизменяемого запуска;
+#   estimate — по выборке окон первичного ключа, для пейджера этого достаточно.
+ESTIMATE_WINDOWS = 16
+ESTIMATE_WINDOW_ROWS = 1000
+# на запусках меньше этого выборка не дешевле точного COUNT
+ESTIMATE_MIN_ROWS = 10 * ESTIMATE_WINDOWS * ESTIMATE_WINDOW_ROWS
+
+
+def filter_signature(filters: LogFilters) -> Tuple:
+    return tuple(sorted((k, v) for k, v in vars(filters).items() if v not in (None, "")))
+
+
+def exact_count(db: Session, criteria: List) -> int:
+    return db.execute(select(func.count()).select_from(LogEntry).where(*criteria)).scalar()
+
+
+def estimate_count(db: Session, run_id: int, criteria: List, filtered: bool) -> Tuple[int, bool]:
+    """(total, is_estimate). Row ids of a run are dense, so min/max id give the unfiltered size."""
+    lo, hi = run_id_range(run_id)
+    in_run = select(LogEntry.id).where(LogEntry.id.between(lo, hi)).limit(1)
+    # два поиска по краям диапазона первичного ключа; min()+max() в одном запросе SQLite сканирует
+    first = db.execute(in_run.order_by(LogEntry.id.asc())).scalar()
+    if first is None:
+        return 0, False
+    last = db.execute(in_run.order_by(LogEntry.id.desc())).scalar()
+    span = last - first + 1
+    if not filtered:
+        return span, False
+    if span < ESTIMATE_MIN_ROWS:
+        return exact_count(db, criteria), False
+    sampled = ESTIMATE_WINDOWS * ESTIMATE_WINDOW_ROWS
+    # равномерно разнесённые окна по id: в логе фазы и ошибки сосредоточены во времени
+    step = span // ESTIMATE_WINDOWS
+    windows = [
+        LogEntry.id.between(first + k * step, first + k * step + ESTIMATE_WINDOW_ROWS - 1)
+        for k in range(ESTIMATE_WINDOWS)
+    ]
+    hits = exact_count(db, [*criteria, or_(*windows)])
+    return round(hits * span / sampled), True
+
+
+def count_logs(db: Session, run_id: int, criteria: List, filters: LogFilters, strategy: str = "exact") -> Tuple[int, bool]:
+    """Total rows for /logs as (total, is_estimate)."""
+    if strategy == "estimate":
+        return estimate_count(db, run_id, criteria, filtered=bool(filter_signature(filters)))
+    if strategy == "cached":
+        return cached_count(db, run_id, filter_signature(filters), lambda: exact_count(db, criteria)), False
+    return exact_count(db, criteria), False
@@ -1,28 +1,68 @@
+import os
 from pathlib import Path
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 
-DB_DIR = Path(__file__).resolve().parent.parent / "storage"
+# Каталог данных сервера: SQLite по умолчанию, загруженные файлы, live-файлы, архив
+DB_DIR = Path(os.getenv("STORAGE_DIR") or Path(__file__).resolve().parent.parent / "storage")
 DB_DIR.mkdir(parents=True, exist_ok=True)
 DB_PATH = DB_DIR / "logviewer.sqlite3"
 
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+# Хранилище задаётся URL: по умолчанию локальный SQLite, для нескольких реплик API — PostgreSQL,
+# например DATABASE_URL=postgresql+psycopg://logviewer:logviewer@db:5432/logviewer
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL") or f"sqlite:///{DB_PATH}"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    future=True,
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+# Пул соединений общий для обоих диалектов; держать не меньше HEAVY_CONCURRENCY + запасом для /logs
+POOL_OPTIONS = dict(
+    pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
 )
 
+if IS_SQLITE:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        future=True,
+        **POOL_OPTIONS,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record) -> None:
+        # WAL: читатели не блокируются на время загрузки файла
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.close()
+else:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_pre_ping=True,
+        **POOL_OPTIONS,
+        future=True,
+    )
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
 
 Base = declarative_base()
 
 
+def get_db():
+    """FastAPI dependency shared by all routers: one session per request."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def init_db() -> None:
     from . import models  # noqa: F401
+    from .migrate import check_schema, migrate_legacy_rows, prepare_legacy_schema
 
+    prepare_legacy_schema(engine)
     Base.metadata.create_all(bind=engine)
-
-
+    migrate_legacy_rows(engine)
+    check_schema(engine)
@@ -0,0 +1,138 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import event, false, select
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import DictValue, LogEntry
+from .storage import insert_ignore
+
+
+# Низкокардинальные колонки log_entries хранятся как целочисленные ссылки на dict_values
+ENCODED_COLUMNS = {
+    "level": LogEntry.level_id,
+    "phase": LogEntry.phase_id,
+    "tf_req_id": LogEntry.tf_req_id_id,
+    "tf_resource_type": LogEntry.tf_resource_type_id,
+}
+
+MAX_CACHE_SIZE = 200_000
+
+# (kind, value) -> id, only values known to be committed
+_cache: Dict[tuple, int] = {}
+_cache_lock = threading.Lock()
+
+
+def _pending(db: Session) -> Dict[tuple, int]:
+    return db.info.setdefault("dict_pending", {})
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _promote_pending(db: Session) -> None:
+    pending = db.info.pop("dict_pending", None)
+    if not pending:
+        return
+    with _cache_lock:
+        if len(_cache) + len(pending) > MAX_CACHE_SIZE:
+            _cache.clear()
+        _cache.update(pending)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_pending(db: Session) -> None:
+    db.info.pop("dict_pending", None)
+
+
+def encode_values(db: Session, kind: str, values: Iterable[str]) -> Dict[str, int]:
+    """Map values of one kind to dictionary ids, inserting unknown values."""
+    pending = _pending(db)
+    result: Dict[str, int] = {}
+    missing = set()
+    for v in values:
+        key = (kind, v)
+        value_id = _cache.get(key) or pending.get(key)
+        if value_id is None:
+            missing.add(v)
+        else:
+            result[v] = value_id
+    if not missing:
+        return result
+
+    found = db.execute(
+        select(DictValue.value, DictValue.id).where(DictValue.kind == kind, DictValue.value.in_(missing))
+    ).all()
+    for value, value_id in found:
+        result[value] = value_id
+        pending[(kind, value)] = value_id
+        missing.discard(value)
+
+    if missing:
+        # ON CONFLICT DO NOTHING: несколько реплик API могут добавлять одно и то же значение
+        db.execute(insert_ignore(db, DictValue), [{"kind": kind, "value": v} for v in missing])
+        created = db.execute(
+            select(DictValue.value, DictValue.id).where(DictValue.kind == kind, DictValue.value.in_(missing))
+        ).all()
+        for value, value_id in created:
+            result[value] = value_id
+            pending[(kind, value)] = value_id
+    return result
+
+
+def encode_rows(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Replace string fields in normalized rows with their *_id dictionary references."""
+    for kind in ENCODED_COLUMNS:
+        # значения из JSON не обязательно строки (например, числовой level)
+        values = {str(r[kind]) for r in rows if r.get(kind)}
+        ids = encode_values(db, kind, values) if values else {}
+        for r in rows:
+            value = r.pop(kind, None)
+            r[f"{kind}_id"] = ids.get(str(value)) if value else None
+
+
+def lookup_id(db: Session, kind: str, value: str) -> Optional[int]:
+    value_id = _cache.get((kind, value)) or _pending(db).get((kind, value))
+    if value_id is not None:
+        return value_id
+    return db.execute(
+        select(DictValue.id).where(DictValue.kind == kind, DictValue.value == value)
+    ).scalar()
+
+
+def decode_ids(db: Session, ids: Iterable[Optional[int]]) -> Dict[int, str]:
+    wanted = {i for i in ids if i is not None}
+    if not wanted:
+        return {}
+    rows = db.execute(select(DictValue.id, DictValue.value).where(DictValue.id.in_(wanted))).all()
+    return {value_id: value for value_id, value in rows}
+
+
+def filter_eq(db: Session, kind: str, value: str):
+    """Equality filter on an encoded column that hits the integer index."""
+    value_id = lookup_id(db, kind, value)
+    if value_id is None:
+        return false()
+    return ENCODED_COLUMNS[kind] == value_id
+
+
+def filter_in(db: Session, kind: str, values: Iterable[str]):
+    values = {v for v in values if v}
+    if not values:
+        return false()
+    pending = _pending(db)
+    ids = []
+    missing = []
+    for v in values:
+        value_id = _cache.get((kind, v)) or pending.get((kind, v))
+        if value_id is None:
+            missing.append(v)
+        else:
+            ids.append(value_id)
+    if missing:
+        # неизвестные кэшу значения — одним запросом, а не по запросу на значение
+        ids.extend(db.execute(
+            select(DictValue.id).where(DictValue.kind == kind, DictValue.value.in_(missing))
+        ).scalars())
+    if not ids:
+        return false()
+    return ENCODED_COLUMNS[kind].in_(ids)
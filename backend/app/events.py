@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+import orjson
+
+
+# Подписки на события: канал — run_id (live tail) или ("job", id) (прогресс разбора).
+# Публикуют потоки разбора, читают SSE-ответы в event loop — поэтому доставка через call_soon_threadsafe.
+QUEUE_SIZE = 256
+
+# сообщение вместо переполненной очереди: клиент отстал и должен перечитать данные
+RESET = {"type": "reset"}
+
+_subscribers: Dict[Hashable, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+_lock = threading.Lock()
+
+
+def subscribe(channel: Hashable) -> asyncio.Queue:
+    """Call from the event loop; pair with unsubscribe()."""
+    queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(channel, set()).add((asyncio.get_running_loop(), queue))
+    return queue
+
+
+def unsubscribe(channel: Hashable, queue: asyncio.Queue) -> None:
+    with _lock:
+        subs = _subscribers.get(channel)
+        if not subs:
+            return
+        subs.difference_update({s for s in subs if s[1] is queue})
+        if not subs:
+            del _subscribers[channel]
+
+
+def _offer(queue: asyncio.Queue, message: Any) -> None:
+    if queue.full():
+        while not queue.empty():
+            queue.get_nowait()
+        message = RESET
+    queue.put_nowait(message)
+
+
+def publish(channel: Hashable, message: Dict[str, Any]) -> None:
+    """Deliver a message to every subscriber of the channel; safe to call from any thread."""
+    with _lock:
+        subs = list(_subscribers.get(channel, ()))
+    for loop, queue in subs:
+        try:
+            loop.call_soon_threadsafe(_offer, queue, message)
+        except RuntimeError:
+            # loop закрыт (остановка сервера)
+            unsubscribe(channel, queue)
+
+
+def has_subscribers(channel: Hashable) -> bool:
+    with _lock:
+        return bool(_subscribers.get(channel))
+
+
+def sse_frame(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    """One Server-Sent Events frame with a JSON payload."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\n".encode() + b"data: " + orjson.dumps(data) + b"\n\n"
@@ -0,0 +1,121 @@
+import json
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row, select
+from sqlalchemy.orm import Session
+
+from . import dictionary
+from .database import SessionLocal
+from .limits import limit_stream
+from .models import LogEntry
+
+
+# Потоковый экспорт: строки читаются пачками через yield_per, сериализуются в один буфер на пачку
+EXPORT_BATCH_ROWS = 5000
+
+EXPORT_COLUMNS = [
+    LogEntry.timestamp,
+    LogEntry.level_id,
+    LogEntry.phase_id,
+    LogEntry.tf_req_id_id,
+    LogEntry.tf_resource_type_id,
+    LogEntry.tf_resource_name,
+    LogEntry.message,
+    LogEntry.is_error,
+    LogEntry.is_malformed,
+]
+
+
+def iter_export_batches(db: Session, *criteria) -> Iterator[Tuple[List[Row], Dict[int, str]]]:
+    """Yield (rows of EXPORT_COLUMNS, dictionary id -> value) batches, ordered like /logs."""
+    stmt = (
+        select(*EXPORT_COLUMNS)
+        .where(*criteria)
+        .order_by(LogEntry.timestamp.asc(), LogEntry.id.asc())
+        .execution_options(yield_per=EXPORT_BATCH_ROWS)
+    )
+    names: Dict[int, str] = {}
+    for rows in db.execute(stmt).partitions():
+        unknown = {i for r in rows for i in r[1:5] if i is not None and i not in names}
+        if unknown:
+            names.update(dictionary.decode_ids(db, unknown))
+        yield rows, names
+
+
+def iter_export_rows(db: Session, *criteria) -> Iterator[Dict]:
+    """Yield export rows (decoded dicts) for the given WHERE criteria, ordered like /logs."""
+    for rows, names in iter_export_batches(db, *criteria):
+        for ts, level_id, phase_id, req_id, type_id, res_name, message, is_error, is_malformed in rows:
+            yield {
+                "timestamp": ts.isoformat() if ts else None,
+                "level": names.get(level_id),
+                "phase": names.get(phase_id),
+                "tf_req_id": names.get(req_id),
+                "tf_resource_type": names.get(type_id),
+                "tf_resource_name": res_name,
+                "message": message,
+                "is_error": is_error,
+                "is_malformed": is_malformed,
+            }
+
+
+def iter_ndjson(rows: Iterable[Dict], keep: Optional[Callable[[Dict], bool]] = None) -> Iterator[bytes]:
+    buf = []
+    for row in rows:
+        if keep is not None and not keep(row):
+            continue
+        buf.append(json.dumps(row, ensure_ascii=False))
+        if len(buf) >= EXPORT_BATCH_ROWS:
+            yield ("\n".join(buf) + "\n").encode("utf-8")
+            buf = []
+    if buf:
+        yield ("\n".join(buf) + "\n").encode("utf-8")
+
+
+def _gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        out = comp.compress(chunk)
+        if out:
+            yield out
+    yield comp.flush()
+
+
+def accepts_gzip(request: Request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+
+def session_chunks(produce: Callable[[Session], Iterable[bytes]]) -> Iterator[bytes]:
+    """Chunks of ``produce(db)`` read through a session of their own.
+
+    The body is streamed after get_db has already closed the request's session (FastAPI runs the
+    teardown of yield dependencies before the response is sent), so a stream must not use it.
+    """
+    db = SessionLocal()
+    try:
+        yield from produce(db)
+    finally:
+        db.close()
+
+
+def stream_response(
+    request: Request,
+    produce: Callable[[Session], Iterable[bytes]],
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> StreamingResponse:
+    """Stream the chunks of ``produce(db)``, gzip-compressed on the fly when the client accepts it.
+
+    Chunks are produced in the threadpool under a heavy-work slot (see limits.py), with a session
+    opened for the stream (session_chunks).
+    """
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    chunks = session_chunks(produce)
+    if accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        chunks = _gzip_chunks(chunks)
+    return StreamingResponse(limit_stream(chunks), media_type=media_type, headers=headers)
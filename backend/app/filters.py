@@ -0,0 +1,137 @@
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Set, Tuple
+
+from fastapi import Query
+from sqlalchemy import and_, false, or_, select, tuple_
+from sqlalchemy.orm import Session
+from typing_extensions import Annotated
+
+from . import dictionary
+from .keyindex import partial_key_filter
+from .models import ErrorRow, LogEntry
+
+
+class LogFilters:
+    """Query-string filters shared by /logs and every export endpoint (use as ``Depends()``)."""
+
+    def __init__(
+        self,
+        tf_req_id: Optional[str] = None,
+        tf_resource_type: Optional[str] = None,
+        tf_resource_name: Optional[str] = None,
+        phase: Optional[str] = None,
+        level: Optional[str] = None,
+        status: Annotated[Optional[str], Query(description="error|ok|malformed")] = None,
+        search: Optional[str] = None,
+        ts_from: Optional[datetime] = None,
+        ts_to: Optional[datetime] = None,
+        template_id: Annotated[Optional[int], Query(description="шаблон ошибки из /errors/top")] = None,
+    ) -> None:
+        self.tf_req_id = tf_req_id
+        self.tf_resource_type = tf_resource_type
+        self.tf_resource_name = tf_resource_name
+        self.phase = phase
+        self.level = level
+        self.status = status
+        self.search = search
+        self.ts_from = ts_from
+        self.ts_to = ts_to
+        self.template_id = template_id
+
+    def criteria(self, db: Session, run_id: int) -> List:
+        crit = []
+        if self.tf_req_id:
+            # Support partial matching for tf_req_id (e.g., '77' matches '778', '779', '776');
+            # шаблон раскрывается в точные id по ключам запуска (keyindex)
+            crit.append(partial_key_filter(db, run_id, "tf_req_id", self.tf_req_id))
+        if self.tf_resource_type:
+            # Support partial matching for tf_resource_type
+            crit.append(partial_key_filter(db, run_id, "tf_resource_type", self.tf_resource_type))
+        if self.tf_resource_name:
+            crit.append(LogEntry.tf_resource_name == self.tf_resource_name)
+        if self.phase:
+            crit.append(dictionary.filter_eq(db, "phase", self.phase))
+        if self.level:
+            crit.append(dictionary.filter_eq(db, "level", self.level))
+        if self.status == "error":
+            crit.append(LogEntry.is_error.is_(True))
+        elif self.status == "malformed":
+            crit.append(LogEntry.is_malformed.is_(True))
+        elif self.status == "ok":
+            crit.extend([LogEntry.is_error.is_(False), LogEntry.is_malformed.is_(False)])
+        if self.ts_from:
+            crit.append(LogEntry.timestamp >= self.ts_from)
+        if self.ts_to:
+            crit.append(LogEntry.timestamp <= self.ts_to)
+        if self.template_id is not None:
+            crit.append(LogEntry.id.in_(
+                select(ErrorRow.entry_id).where(ErrorRow.run_id == run_id, ErrorRow.template_id == self.template_id)
+            ))
+        if self.search:
+            like = f"%{self.search}%"
+            # message и json_str выводятся из raw, поэтому ищем по хранимым колонкам (индексируемым в PostgreSQL):
+            # текст ищется в строке как она записана в файле, а не в пересериализованном json_str
+            crit.append(or_(LogEntry.raw.like(like), LogEntry.json_extra.like(like), LogEntry.message_text.like(like)))
+        return crit
+
+
+def naive_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    # timestamp в БД — naive UTC (parser.parse_datetime)
+    if ts is not None and ts.tzinfo:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def run_criteria(db: Session, run_id: int, filters: Optional[LogFilters] = None) -> List:
+    """WHERE clauses for one run's log entries, optionally narrowed by /logs filters."""
+    crit = [LogEntry.run_id == run_id]
+    if filters is not None:
+        crit.extend(filters.criteria(db, run_id))
+    return crit
+
+
+ResourceKey = Tuple[Optional[str], Optional[str]]
+
+
+def parse_resource_key(key: str) -> ResourceKey:
+    """'type:name' (as produced by /logs/groups) -> (type or None, name or None)."""
+    res_type, _, res_name = key.partition(":")
+    return res_type or None, res_name or None
+
+
+def resource_branch(run_id: int, type_id: Optional[int], res_name: Optional[str]):
+    """Rows of one (encoded type, name) resource key; NULL parts match NULL."""
+    return and_(
+        LogEntry.run_id == run_id,
+        LogEntry.tf_resource_type_id == type_id if type_id is not None else LogEntry.tf_resource_type_id.is_(None),
+        LogEntry.tf_resource_name == res_name if res_name is not None else LogEntry.tf_resource_name.is_(None),
+    )
+
+
+def resource_keys_criterion(db: Session, run_id: int, keys: Iterable[ResourceKey]):
+    """Exact (tf_resource_type, tf_resource_name) matching pushed into SQL.
+
+    Every OR branch carries run_id, so SQLite resolves each key with a seek on
+    ix_log_entries_run_resource inside the id subquery and only matching rows are read.
+    """
+    keys: Set[ResourceKey] = set(keys)
+    type_ids = {t: dictionary.lookup_id(db, "tf_resource_type", t) for t, _ in keys if t}
+
+    full_keys = []
+    partial = []
+    for res_type, res_name in keys:
+        if res_type and type_ids[res_type] is None:
+            continue  # такого типа нет в словаре — совпадений быть не может
+        type_id = type_ids.get(res_type)
+        if type_id is not None and res_name is not None:
+            full_keys.append((run_id, type_id, res_name))
+            continue
+        partial.append(resource_branch(run_id, type_id, res_name))
+
+    clauses = []
+    if full_keys:
+        clauses.append(tuple_(LogEntry.run_id, LogEntry.tf_resource_type_id, LogEntry.tf_resource_name).in_(full_keys))
+    clauses.extend(partial)
+    if not clauses:
+        return false()
+    return LogEntry.id.in_(select(LogEntry.id).where(or_(*clauses)))
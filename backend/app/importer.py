@@ -0,0 +1,213 @@
+import hashlib
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import jobs
+from .cache import invalidate_run
+from .database import SessionLocal
+from .models import ImportedFile, Run
+from .parser import parse_range
+from .services import ingest_rows, run_summary
+
+
+# Серверный импорт каталога IMPORT_DIR (в docker-compose — ./Terraform Logs), без HTTP.
+# Файлы режутся на диапазоны по CHUNK_BYTES и разбираются в пуле процессов (json + нормализация —
+# основная нагрузка на CPU), запись в БД идёт одним потоком по порядку: SQLite допускает одного писателя.
+# Уже импортированные файлы пропускаются: path+size+mtime совпали, иначе сверяется sha256.
+IMPORT_DIR = os.getenv("IMPORT_DIR", "")
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "0") or 0) or os.cpu_count() or 1
+IMPORT_WATCH_SECONDS = float(os.getenv("IMPORT_WATCH_SECONDS", "0") or 0)  # 0 — без наблюдения за каталогом
+IMPORT_SETTLE_SECONDS = 5  # файл, изменённый позже, ещё дописывается — берём его следующим проходом
+IMPORT_EXTENSIONS = {".log", ".txt", ".jsonl", ".json"}
+CHUNK_BYTES = 4 * 1024 * 1024
+JOB_KIND = "server-import"
+
+_start_lock = threading.Lock()
+_watcher: Optional[threading.Thread] = None
+
+
+class SourceFile(NamedTuple):
+    rel: str
+    path: Path
+    size: int
+    mtime: float
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_dir(root: Path) -> List[SourceFile]:
+    files = []
+    for path in sorted(root.rglob("*")):
+        if path.suffix.lower() not in IMPORT_EXTENSIONS or not path.is_file():
+            continue
+        st = path.stat()
+        files.append(SourceFile(path.relative_to(root).as_posix(), path, st.st_size, st.st_mtime))
+    return files
+
+
+def _select_new(db: Session, job: jobs.IngestJob, pool: ProcessPoolExecutor, files: List[SourceFile]) -> List[SourceFile]:
+    """Files to import; the rest are marked skipped (unchanged, duplicate content, still written)."""
+    known = {f.path: f for f in db.execute(select(ImportedFile)).scalars()}
+    settle = time.time() - IMPORT_SETTLE_SECONDS
+    to_hash = []
+    for f in files:
+        job.set_file(f.rel, size=f.size, status="queued", bytes_done=0)
+        prev = known.get(f.rel)
+        if f.mtime > settle:
+            job.set_file(f.rel, status="skipped", reason="still being written")
+        elif not job.force and prev is not None and prev.size == f.size and prev.mtime == f.mtime:
+            job.set_file(f.rel, status="skipped", reason="unchanged", run_id=prev.run_id)
+        else:
+            to_hash.append(f)
+
+    # хэши считаются в том же пуле процессов, что и разбор
+    digests = dict(zip((f.rel for f in to_hash), pool.map(file_sha256, [str(f.path) for f in to_hash])))
+    by_digest: Dict[str, ImportedFile] = {}
+    for rec in known.values():
+        if rec.run_id is not None or rec.sha256 not in by_digest:
+            by_digest[rec.sha256] = rec
+    new_digests: Dict[str, str] = {}
+    selected = []
+    for f in to_hash:
+        digest = digests[f.rel]
+        prev = known.get(f.rel)
+        same = prev if prev is not None and prev.sha256 == digest else by_digest.get(digest)
+        if not job.force and same is not None:
+            # содержимое уже импортировано: этот же файл с новым mtime или копия под другим именем
+            db.merge(ImportedFile(path=f.rel, size=f.size, mtime=f.mtime, sha256=digest, run_id=same.run_id))
+            reason = "unchanged" if same.path == f.rel else f"duplicate of {same.path}"
+            job.set_file(f.rel, status="skipped", reason=reason, run_id=same.run_id)
+        elif not job.force and digest in new_digests:
+            # копия файла из этого же прохода; запишется следующим проходом, когда у оригинала будет run_id
+            job.set_file(f.rel, status="skipped", reason=f"duplicate of {new_digests[digest]}")
+        else:
+            new_digests[digest] = f.rel
+            job.set_file(f.rel, sha256=digest)
+            selected.append(f)
+    db.commit()
+    return selected
+
+
+def _import_files(db: Session, job: jobs.IngestJob, pool: ProcessPoolExecutor, files: List[SourceFile]) -> None:
+    tasks = ((f, lo, min(lo + CHUNK_BYTES, f.size)) for f in files for lo in range(0, max(f.size, 1), CHUNK_BYTES))
+    window: deque = deque()
+
+    def refill() -> None:
+        # разбор идёт впереди записи не больше чем на два диапазона на процесс
+        for f, lo, hi in itertools.islice(tasks, 2 * IMPORT_WORKERS - len(window)):
+            window.append((f, hi, pool.submit(parse_range, str(f.path), lo, hi)))
+
+    refill()
+    current: Optional[SourceFile] = None
+    run: Optional[Run] = None
+    failed = False
+    stats = [0, 0, set()]
+
+    def finish_file() -> None:
+        if current is None or failed:
+            return
+        run.status = "parsed"
+        run.summary = run_summary(*stats)
+        db.merge(ImportedFile(
+            path=current.rel, size=current.size, mtime=current.mtime,
+            sha256=job.files[current.rel]["sha256"], run_id=run.id, imported_at=datetime.utcnow(),
+        ))
+        db.commit()
+        invalidate_run(run.id)
+        job.set_file(current.rel, status="done", summary=run.summary)
+
+    while window:
+        f, hi, future = window.popleft()
+        refill()
+        if f is not current:
+            finish_file()
+            current, failed, stats = f, False, [0, 0, set()]
+            run = Run(filename=f.rel, stored_path=str(f.path), status="importing")
+            db.add(run)
+            db.commit()
+            job.set_file(f.rel, status="parsing", run_id=run.id)
+        if failed:
+            continue
+        try:
+            total, errors, phases = ingest_rows(
+                db, run, future.result(), lambda lines, plugin_seconds: job.add_batch(f.rel, lines, plugin_seconds)
+            )
+        except Exception as exc:
+            db.rollback()
+            failed = True
+            run.status = "error"
+            run.summary = f"import failed: {exc}"
+            db.commit()
+            job.set_file(f.rel, status="error", error=str(exc))
+            continue
+        stats[0] += total
+        stats[1] += errors
+        stats[2] |= phases
+        job.set_file(f.rel, bytes_done=hi)
+    finish_file()
+
+
+def _run_job(job: jobs.IngestJob) -> None:
+    db = SessionLocal()
+    try:
+        # spawn: рабочие процессы не наследуют потоки и соединения сервера
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=IMPORT_WORKERS, mp_context=ctx) as pool:
+            files = _select_new(db, job, pool, scan_dir(Path(job.root)))
+            job.set_status("running")
+            _import_files(db, job, pool, files)
+        job.finish("done")
+    except Exception as exc:
+        db.rollback()
+        job.finish("error", str(exc))
+    finally:
+        db.close()
+
+
+def start_import(force: bool = False) -> jobs.IngestJob:
+    """Start a pass over IMPORT_DIR in a background thread (or return the one already running)."""
+    with _start_lock:
+        job = jobs.running_job(JOB_KIND)
+        if job is not None:
+            return job
+        job = jobs.create_job(JOB_KIND, str(Path(IMPORT_DIR).resolve()), force)
+        job.status = "scanning"
+    threading.Thread(target=_run_job, args=(job,), name=f"import-{job.id[:8]}", daemon=True).start()
+    return job
+
+
+def _watch() -> None:
+    while True:
+        job = start_import()
+        while job.finished_at is None:
+            time.sleep(1)
+        time.sleep(IMPORT_WATCH_SECONDS)
+
+
+def start_import_worker() -> None:
+    """Startup: import IMPORT_DIR once, or keep watching it when IMPORT_WATCH_SECONDS > 0."""
+    global _watcher
+    if not IMPORT_DIR or not Path(IMPORT_DIR).is_dir():
+        return
+    if IMPORT_WATCH_SECONDS <= 0:
+        start_import()
+    elif _watcher is None:
+        _watcher = threading.Thread(target=_watch, name="import-watch", daemon=True)
+        _watcher.start()
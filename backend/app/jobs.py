@@ -0,0 +1,175 @@
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from . import events
+
+
+# Задачи разбора (загрузка файла, импорт каталога, серверный импорт IMPORT_DIR, перегон плагинов) и их прогресс.
+# Прогресс пишется из сбросов пачек ingest_rows и уходит подписчикам GET /jobs/{id}/events —
+# клиенту не нужно опрашивать сервер. Задачи живут в памяти процесса, последние JOBS_KEPT.
+JOBS_KEPT = 50
+PUSH_SECONDS = 0.25  # чаще строк/байтов не шлём; смена статуса файла уходит сразу
+JOB_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def channel(job_id: str):
+    return ("job", job_id)
+
+
+class IngestJob:
+    """Progress of one ingest job; ``files`` maps file name (relative path) -> per-file state."""
+
+    def __init__(self, job_id: str, kind: str, root: Optional[str] = None, force: bool = False) -> None:
+        self.id = job_id
+        self.kind = kind  # upload|import|server-import|reprocess
+        self.root = root
+        self.force = force
+        self.status = "pending"  # pending|scanning|running|done|error
+        self.error: Optional[str] = None
+        self.started_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.current: Optional[str] = None
+        self.plugin_seconds: Dict[str, float] = {}
+        self.batches = 0
+        self._pushed_at = 0.0
+        self._lock = threading.Lock()
+
+    def set_status(self, status: str) -> None:
+        self.status = status
+        self._push(force=True)
+
+    def set_file(self, name: str, **fields: Any) -> None:
+        with self._lock:
+            state = self.files.setdefault(name, {"path": name})
+            changed = "status" in fields and fields["status"] != state.get("status")
+            state.update(fields)
+            if fields.get("status") in ("parsing", "running"):
+                self.current = name
+        self._push(force=changed, name=name)
+
+    def add_batch(self, name: str, lines: int, plugin_seconds: Dict[str, float]) -> None:
+        """Called after every flushed batch of ingest_rows."""
+        with self._lock:
+            state = self.files.setdefault(name, {"path": name})
+            state["lines"] = state.get("lines", 0) + lines
+            self.batches += 1
+            for plugin, seconds in plugin_seconds.items():
+                self.plugin_seconds[plugin] = self.plugin_seconds.get(plugin, 0.0) + seconds
+        self._push(name=name)
+
+    def file_progress(self, name: str) -> Callable[[int, int, Dict[str, float]], None]:
+        """``progress`` callback for services.process_uploaded_file."""
+        def progress(bytes_done: int, lines: int, plugin_seconds: Dict[str, float]) -> None:
+            with self._lock:
+                self.files.setdefault(name, {"path": name})["bytes_done"] = bytes_done
+            self.add_batch(name, lines, plugin_seconds)
+        return progress
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        self.current = None
+        self.finished_at = datetime.utcnow()
+        events.publish(channel(self.id), {"type": "done", **self.snapshot()})
+
+    def _push(self, force: bool = False, name: Optional[str] = None) -> None:
+        now = time.monotonic()
+        if not force and now - self._pushed_at < PUSH_SECONDS:
+            return
+        if not events.has_subscribers(channel(self.id)):
+            return
+        self._pushed_at = now
+        message = {"type": "progress", **self.snapshot(with_files=False)}
+        if name is not None:
+            with self._lock:
+                message["file"] = dict(self.files[name])
+        events.publish(channel(self.id), message)
+
+    def snapshot(self, with_files: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            files = [dict(f) for f in self.files.values()]
+            plugins = {p: round(s * 1000, 1) for p, s in self.plugin_seconds.items()}
+            batches = self.batches
+        counts: Dict[str, int] = {}
+        for f in files:
+            counts[f.get("status", "queued")] = counts.get(f.get("status", "queued"), 0) + 1
+        out = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "root": self.root,
+            "status": self.status,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "current": self.current,
+            "counts": counts,
+            "bytes_total": sum(f.get("size", 0) for f in files if f.get("status") != "skipped"),
+            "bytes_done": sum(f.get("bytes_done", 0) for f in files),
+            "lines": sum(f.get("lines", 0) for f in files),
+            "batches": batches,
+            # суммарное время плагинов по адресам, мс
+            "plugin_ms": plugins,
+        }
+        if with_files:
+            out["files"] = files
+        return out
+
+
+def _register(job: IngestJob) -> None:
+    _jobs[job.id] = job
+    # вытесняются только завершённые задачи: в незавершённые ещё пишется прогресс
+    finished = [k for k, j in _jobs.items() if j.finished_at is not None]
+    for old in finished[: max(0, len(_jobs) - JOBS_KEPT)]:
+        del _jobs[old]
+
+
+def create_job(kind: str, root: Optional[str] = None, force: bool = False) -> IngestJob:
+    job = IngestJob(uuid.uuid4().hex, kind, root, force)
+    with _jobs_lock:
+        _register(job)
+    return job
+
+
+def get_or_create(job_id: Optional[str], kind: str) -> Optional[IngestJob]:
+    """Job with a client-chosen id: the client subscribes to its events before sending the upload.
+
+    None if an unfinished job already has that id (a second upload must not write into its progress).
+    """
+    if not job_id:
+        return create_job(kind)
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None and job.finished_at is None:
+            return None
+        job = IngestJob(job_id, kind)
+        _register(job)
+        return job
+
+
+def pending_snapshot(job_id: str) -> Dict[str, Any]:
+    """State of a job id nobody has started yet: subscribers wait for it without registering a job."""
+    return IngestJob(job_id, "upload").snapshot()
+
+
+def get_job(job_id: str) -> Optional[IngestJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs(kind: Optional[str] = None) -> List[IngestJob]:
+    with _jobs_lock:
+        return [j for j in reversed(_jobs.values()) if kind is None or j.kind == kind]
+
+
+def running_job(kind: str) -> Optional[IngestJob]:
+    with _jobs_lock:
+        return next((j for j in _jobs.values() if j.kind == kind and j.finished_at is None), None)
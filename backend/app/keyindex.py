@@ -0,0 +1,100 @@
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy import column, delete, false, select, table
+from sqlalchemy.orm import Session
+
+from . import dictionary
+from .models import RUN_ID_SHIFT, RUN_KEYS_FTS, DictValue, LogEntry, RunKey, run_id_range
+from .storage import insert_ignore_tuples, is_postgres
+
+
+# Частичные фильтры tf_req_id / tf_resource_type ('%77%'): шаблон сначала раскрывается
+# в точный набор id словаря по ключам запуска, затем log_entries читается через индекс
+# (run_id, key) с IN. Триграммы: FTS5 в SQLite, pg_trgm по dict_values.value в PostgreSQL.
+INDEXED_KINDS = ("tf_req_id", "tf_resource_type")
+MIN_GRAM_FRAGMENT = 3  # короче — триграммный индекс не помогает, перебираем ключи запуска
+MAX_IN_IDS = 1000  # больше совпадений — фильтр неселективен, отдаём подзапрос
+
+_fts = table(RUN_KEYS_FTS, column("rowid"), column("value"), column("kind"))
+
+
+def batch_keys(rows: List[Dict]) -> Dict[str, Set[str]]:
+    """Key values of normalized rows, taken before dictionary.encode_rows replaces them with ids."""
+    return {kind: {str(r[kind]) for r in rows if r.get(kind)} for kind in INDEXED_KINDS}
+
+
+def add_run_keys(db: Session, run_id: int, values_by_kind: Dict[str, Set[str]], seen: Set[Tuple[str, str]]) -> None:
+    """Record key values of a run (and their FTS rows on SQLite); ``seen`` skips values already added."""
+    for kind, values in values_by_kind.items():
+        fresh = {v for v in values if (kind, v) not in seen}
+        if not fresh:
+            continue
+        seen.update((kind, v) for v in fresh)
+        ids = dictionary.encode_values(db, kind, fresh)
+        known = set(db.execute(
+            select(RunKey.value_id).where(RunKey.run_id == run_id, RunKey.value_id.in_(ids.values()))
+        ).scalars())
+        new = [(v, value_id) for v, value_id in ids.items() if value_id not in known]
+        insert_ignore_tuples(db, RunKey.__table__, ["run_id", "kind", "value_id"], [
+            (run_id, kind, value_id) for _v, value_id in new
+        ])
+        if new and not is_postgres(db):
+            db.connection().exec_driver_sql(
+                f"INSERT INTO {RUN_KEYS_FTS} (rowid, value, kind) VALUES (?, ?, ?)",
+                [((run_id << RUN_ID_SHIFT) + value_id, v, kind) for v, value_id in new],
+            )
+
+
+def ensure_key_index(db: Session, run_id: int) -> None:
+    """Build the index for runs ingested before it existed."""
+    if db.execute(select(RunKey.run_id).where(RunKey.run_id == run_id).limit(1)).first():
+        return
+    values_by_kind = {}
+    for kind in INDEXED_KINDS:
+        key_col = dictionary.ENCODED_COLUMNS[kind]
+        ids = db.execute(
+            select(key_col).where(LogEntry.run_id == run_id, key_col.isnot(None)).distinct()
+        ).scalars().all()
+        values_by_kind[kind] = set(dictionary.decode_ids(db, ids).values())
+    if any(values_by_kind.values()):
+        add_run_keys(db, run_id, values_by_kind, set())
+        db.commit()
+
+
+def _matching_ids(db: Session, run_id: int, kind: str, fragment: str):
+    """SELECT of dictionary ids of the run's ``kind`` values that match LIKE '%fragment%'."""
+    pattern = f"%{fragment}%"
+    candidates = select(RunKey.value_id).where(RunKey.run_id == run_id, RunKey.kind == kind)
+    if len(fragment) >= MIN_GRAM_FRAGMENT and not is_postgres(db):
+        # FTS5 trigram отвечает на LIKE по индексу; диапазон rowid ограничивает запуском
+        lo, hi = run_id_range(run_id)
+        candidates = select((_fts.c.rowid - (run_id << RUN_ID_SHIFT)).label("value_id")).where(
+            _fts.c.value.like(pattern), _fts.c.rowid.between(lo, hi), _fts.c.kind == kind,
+        )
+    # значение проверяется тем же LIKE, что и раньше (регистр, '%' и '_' — как в диалекте)
+    candidates = candidates.subquery()
+    return (
+        select(DictValue.id)
+        .join_from(candidates, DictValue, DictValue.id == candidates.c.value_id)
+        .where(DictValue.value.like(pattern))
+    )
+
+
+def partial_key_filter(db: Session, run_id: int, kind: str, fragment: str):
+    """WHERE clause equivalent to ``kind LIKE '%fragment%'`` that hits the (run_id, key) index."""
+    ensure_key_index(db, run_id)
+    stmt = _matching_ids(db, run_id, kind, fragment)
+    ids = db.execute(stmt.limit(MAX_IN_IDS + 1)).scalars().all()
+    if not ids:
+        return false()
+    key_col = dictionary.ENCODED_COLUMNS[kind]
+    if len(ids) <= MAX_IN_IDS:
+        return key_col.in_(ids)
+    return key_col.in_(stmt)
+
+
+def drop_run_keys(db: Session, run_id: int) -> None:
+    if not is_postgres(db):
+        lo, hi = run_id_range(run_id)
+        db.execute(delete(_fts).where(_fts.c.rowid.between(lo, hi)))
+    db.execute(RunKey.__table__.delete().where(RunKey.run_id == run_id))
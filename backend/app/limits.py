@@ -0,0 +1,55 @@
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Iterable, Optional, TypeVar
+
+import anyio
+from anyio.to_thread import current_default_thread_limiter
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+
+# Синхронные эндпоинты выполняются в пуле потоков anyio. Тяжёлые операции (агрегации,
+# экспорт, разбор файлов) занимают не больше HEAVY_CONCURRENCY потоков,
+# остальные потоки пула остаются короткими запросам вроде /logs.
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+HEAVY_CONCURRENCY = int(os.getenv("HEAVY_CONCURRENCY", "4"))
+
+T = TypeVar("T")
+
+_heavy: Optional[anyio.CapacityLimiter] = None
+
+
+def configure_threadpool() -> None:
+    """Call from the startup hook (needs the running event loop)."""
+    current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+
+def _heavy_limiter() -> anyio.CapacityLimiter:
+    global _heavy
+    if _heavy is None:
+        _heavy = anyio.CapacityLimiter(HEAVY_CONCURRENCY)
+    return _heavy
+
+
+@asynccontextmanager
+async def heavy() -> AsyncIterator[None]:
+    async with _heavy_limiter():
+        yield
+
+
+async def heavy_slot() -> AsyncIterator[None]:
+    """Dependency for non-streaming heavy endpoints: the slot is held while the endpoint runs."""
+    async with heavy():
+        yield
+
+
+async def run_heavy(func: Callable[..., T], *args) -> T:
+    """Run blocking work from an async endpoint without stalling the event loop."""
+    async with heavy():
+        return await run_in_threadpool(func, *args)
+
+
+async def limit_stream(chunks: Iterable[bytes]) -> AsyncIterator[bytes]:
+    # слот держится всё время отдачи тела: зависимости с yield закрываются до начала стрима
+    async with heavy():
+        async for chunk in iterate_in_threadpool(chunks):
+            yield chunk
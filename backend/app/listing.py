@@ -0,0 +1,89 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+import orjson
+from sqlalchemy import Row, select
+from sqlalchemy.orm import Session
+
+from . import dictionary
+from .models import LogEntry
+
+
+# Строки для /logs выбираются кортежами и сразу превращаются в dict под orjson:
+# без ORM-объектов и без LogEntryOut на каждую строку (схема ответа — schemas.LogsPage).
+# raw/json_str сюда не входят: message читается срезом raw, сам JSON — только по запросу
+LIST_COLUMNS = [
+    LogEntry.id,
+    LogEntry.run_id,
+    LogEntry.timestamp,
+    LogEntry.level_id,
+    LogEntry.phase_id,
+    LogEntry.tf_req_id_id,
+    LogEntry.tf_resource_type_id,
+    LogEntry.tf_resource_name,
+    LogEntry.message,
+    LogEntry.is_error,
+    LogEntry.is_malformed,
+]
+
+
+def select_rows(*criteria):
+    return select(*LIST_COLUMNS).where(*criteria)
+
+
+def parse_json(text: str) -> Any:
+    """Stored JSON text -> object; malformed lines stay strings."""
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return text
+
+
+def json_text(raw: str, json_extra: Optional[str]) -> str:
+    """json_str of a row: stored when it is not derivable from raw, else the parser's json.dumps of raw."""
+    if json_extra is not None:
+        return json_extra
+    return json.dumps(json.loads(raw), ensure_ascii=False)
+
+
+def attach_json(db: Session, items: List[Dict]) -> None:
+    """Fill items' "json" with one PK lookup for the whole page (raw/json_str are not in LIST_COLUMNS)."""
+    if not items:
+        return
+    stored = {
+        entry_id: (raw, json_extra)
+        for entry_id, raw, json_extra in db.execute(
+            select(LogEntry.id, LogEntry.raw, LogEntry.json_extra).where(LogEntry.id.in_([i["id"] for i in items]))
+        )
+    }
+    for item in items:
+        row = stored.get(item["id"])
+        if row is None:
+            item["json"] = None
+            continue
+        raw, json_extra = row
+        # без json_extra json_str — json.dumps(json.loads(raw)): разбор raw даёт тот же объект
+        item["json"] = parse_json(raw if json_extra is None else json_extra)
+
+
+def rows_to_items(db: Session, rows: Sequence[Row], is_extra: bool = False) -> List[Dict]:
+    """LIST_COLUMNS rows -> dicts shaped like schemas.LogEntryOut; "json" stays null (see attach_json)."""
+    names = dictionary.decode_ids(db, (i for r in rows for i in r[3:7]))
+    return [
+        {
+            "id": r.id,
+            "run_id": r.run_id,
+            "timestamp": r.timestamp,
+            "level": names.get(r.level_id),
+            "phase": names.get(r.phase_id),
+            "tf_req_id": names.get(r.tf_req_id_id),
+            "tf_resource_type": names.get(r.tf_resource_type_id),
+            "tf_resource_name": r.tf_resource_name,
+            "message": r.message,
+            "is_error": r.is_error,
+            "is_malformed": r.is_malformed,
+            "json": None,
+            "is_extra": is_extra,
+        }
+        for r in rows
+    ]
@@ -4,8 +4,13 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pathlib import Path
 
-from .routers import uploads, runs, logs, export, timeline
-from .database import init_db
+from .routers import uploads, runs, logs, export, timeline, live, imports, jobs, spans, errors, search
+from .database import init_db, SessionLocal
+from .archive import start_archive_worker
+from .limits import configure_threadpool
+from .reprocess import release_interrupted_runs
+from .tail import resume_live_runs
+from .importer import start_import_worker
 
 
 def create_app() -> FastAPI:
@@ -24,6 +29,12 @@ def create_app() -> FastAPI:
     app.include_router(logs.router, prefix="/api")
     app.include_router(export.router, prefix="/api")
     app.include_router(timeline.router, prefix="/api")
+    app.include_router(spans.router, prefix="/api")
+    app.include_router(errors.router, prefix="/api")
+    app.include_router(search.router, prefix="/api")
+    app.include_router(live.router, prefix="/api")
+    app.include_router(imports.router, prefix="/api")
+    app.include_router(jobs.router, prefix="/api")
 
     # Static files serving
     frontend_path = Path(__file__).resolve().parent.parent.parent / "frontend"
@@ -45,7 +56,20 @@ def create_app() -> FastAPI:
 
     @app.on_event("startup")
     async def _startup() -> None:
+        configure_threadpool()
         init_db()
+        db = SessionLocal()
+        try:
+            # перегон плагинов, прерванный остановкой реплики (аренда истекла или своя), — запуски снова доступны
+            release_interrupted_runs(db)
+            # live-запуски продолжают разбор с сохранённых смещений
+            resume_live_runs(db)
+        finally:
+            db.close()
+        # перенос устаревших запусков в холодное хранилище (ARCHIVE_AFTER_DAYS), в фоне
+        start_archive_worker()
+        # серверный импорт IMPORT_DIR в фоне (IMPORT_WATCH_SECONDS — периодически)
+        start_import_worker()
 
     return app
 
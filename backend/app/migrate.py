@@ -0,0 +1,88 @@
+import logging
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+
+from .database import Base, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+# Схема без миграций (create_all создаёт только недостающие таблицы). Базу исходной версии,
+# где log_entries хранила строки level/phase/tf_req_id/json_str/message, переводим при старте:
+# старая таблица переименовывается, строки каждого запуска заново разбираются из raw в новую
+# log_entries (словарь, индексы) с фиксацией по запуску — прерванный перевод продолжается
+# со следующего старта. Недостающие nullable-колонки добавляются ALTER TABLE; прочие расхождения —
+# понятная ошибка вместо падения на первом запросе.
+LEGACY_LOG_TABLE = "log_entries_v0"
+MIGRATE_CHUNK = 5000
+
+
+class SchemaError(RuntimeError):
+    pass
+
+
+def _columns(insp, table: str) -> set:
+    return {c["name"] for c in insp.get_columns(table)}
+
+
+def prepare_legacy_schema(engine: Engine) -> None:
+    """Before create_all: move the legacy log table aside and add missing nullable columns."""
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        if insp.has_table("log_entries") and "level_id" not in _columns(insp, "log_entries"):
+            logger.warning("Legacy log_entries found: rows are re-parsed into the current schema")
+            # имена индексов заняты бы новой таблицей
+            for index in insp.get_indexes("log_entries"):
+                conn.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+            conn.execute(text(f"ALTER TABLE log_entries RENAME TO {LEGACY_LOG_TABLE}"))
+        for table in Base.metadata.sorted_tables:
+            if table.name == "log_entries" or not insp.has_table(table.name):
+                continue
+            existing = _columns(insp, table.name)
+            for column in table.columns:
+                if column.name not in existing and column.nullable and column.server_default is None:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def migrate_legacy_rows(engine: Engine) -> None:
+    """After create_all: re-ingest the raw lines of every run from the legacy log table, then drop it."""
+    if not inspect(engine).has_table(LEGACY_LOG_TABLE):
+        return
+    from .models import LogEntry, Run, run_id_range
+    from .services import ingest_lines
+
+    legacy = text(f"SELECT raw FROM {LEGACY_LOG_TABLE} WHERE run_id = :run_id ORDER BY id")
+    db = SessionLocal(bind=engine)
+    try:
+        for run in db.execute(select(Run).order_by(Run.id)).scalars().all():
+            lo, hi = run_id_range(run.id)
+            if db.execute(select(LogEntry.id).where(LogEntry.id.between(lo, hi)).limit(1)).first():
+                continue  # перенесён до прерванного старта
+            raws = db.execute(legacy.execution_options(yield_per=MIGRATE_CHUNK), {"run_id": run.id}).scalars()
+            total, _errors, _phases = ingest_lines(db, run, raws)
+            db.commit()
+            logger.info("Migrated run %s: %s lines", run.id, total)
+        db.execute(text(f"DROP TABLE {LEGACY_LOG_TABLE}"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def check_schema(engine: Engine) -> None:
+    """Fail at startup with a clear message when existing tables lack columns of the models."""
+    insp = inspect(engine)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if insp.has_table(table.name):
+            lacks = sorted({c.name for c in table.columns} - _columns(insp, table.name))
+            if lacks:
+                missing.append(f"{table.name} ({', '.join(lacks)})")
+    if missing:
+        raise SchemaError(
+            f"Database {engine.url.render_as_string(hide_password=True)} has an outdated schema, "
+            f"missing columns: {'; '.join(missing)}. Point DATABASE_URL (or STORAGE_DIR) at a new database "
+            "or remove the old one and upload the logs again."
+        )
@@ -1,6 +1,6 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, DDL, Float, Integer, String, DateTime, Text, ForeignKey, Boolean, Index, UniqueConstraint, event, func, select
+from sqlalchemy.orm import relationship, column_property, mapped_column
 
 from .database import Base
 
@@ -13,27 +13,333 @@ class Run(Base):
     created_at = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
     status = Column(String(64), default="uploaded", index=True)
     summary = Column(Text, default="")
+    archived_path = Column(String(1024), nullable=True)  # set while log rows live in cold storage
 
     logs = relationship("LogEntry", back_populates="run", cascade="all, delete-orphan")
 
+class DictValue(Base):
+    """Словарь повторяющихся строковых значений (level, phase, tf_req_id, tf_resource_type)."""
+
+    __tablename__ = "dict_values"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(32), nullable=False)
+    value = Column(String(256), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("kind", "value", name="uq_dict_values_kind_value"),
+        # PostgreSQL: частичные фильтры по ключам ('%77%') через pg_trgm
+        Index("ix_dict_values_value_trgm", "value", postgresql_using="gin", postgresql_ops={"value": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
+
+
+class RunKey(Base):
+    """Различные значения ключей (tf_req_id, tf_resource_type) одного запуска — для частичных фильтров."""
+
+    __tablename__ = "run_keys"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    kind = Column(String(32), primary_key=True)
+    value_id = Column(Integer, ForeignKey("dict_values.id"), primary_key=True)
+
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+class IngestCheckpoint(Base):
+    """Live tail: сколько байт файла запуска уже разобрано (коммитится вместе со строками)."""
+
+    __tablename__ = "ingest_checkpoints"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    offset = Column(BigInteger, nullable=False, default=0)  # до конца последней целой строки
+    lines = Column(Integer, nullable=False, default=0)
+    malformed = Column(Integer, nullable=False, default=0)
+    phases = Column(Text, nullable=False, default="")  # через запятую
+    follow = Column(Boolean, nullable=False, default=False)  # файл дописывается на сервере, читает поток-наблюдатель
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class ImportedFile(Base):
+    """Файлы IMPORT_DIR, уже разобранные серверным импортом: повторно не читаются."""
+
+    __tablename__ = "imported_files"
+
+    path = Column(String(1024), primary_key=True)  # относительно IMPORT_DIR
+    size = Column(BigInteger, nullable=False)
+    mtime = Column(Float, nullable=False)
+    sha256 = Column(String(64), nullable=False, index=True)
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="SET NULL"), nullable=True)
+    imported_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class TimelineBucket(Base):
+    """Многоуровневый индекс времени: число строк запуска по интервалам LOD_BASE_MS * LOD_FACTOR**level."""
+
+    __tablename__ = "timeline_buckets"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    level = Column(Integer, primary_key=True)
+    bucket = Column(BigInteger, primary_key=True)  # мс от эпохи // ширина интервала уровня
+    count = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    malformed = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+class TimelineSpan(Base):
+    """Полосы /timeline, посчитанные при разборе: ключ группировки -> первый/последний timestamp и счётчики."""
+
+    __tablename__ = "timeline_spans"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    kind = Column(String(32), primary_key=True)  # группировка: tf_req_id|resource|phase
+    key = Column(Text, primary_key=True)
+    start = Column("start_ts", DateTime, nullable=True)  # NULL — у строк ключа нет timestamp
+    end = Column("end_ts", DateTime, nullable=True)
+    count = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    malformed = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # самые заметные полосы окна (errors, count по убыванию) — обратным проходом по индексу
+        Index("ix_timeline_spans_top", "run_id", "kind", "errors", "count", "key"),
+    )
+
+
+class Span(Base):
+    """Вызов (tf_req_id) или ресурс запуска целиком: время, длительность, строки, ошибки — считаются при разборе."""
+
+    __tablename__ = "spans"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    kind = Column(String(32), primary_key=True)  # tf_req_id|resource
+    key = Column(Text, primary_key=True)  # значение tf_req_id или "тип:имя"
+    tf_resource_type = Column(String(256), nullable=True)  # у tf_req_id — первый встреченный ресурс вызова
+    tf_resource_name = Column(String(256), nullable=True)
+    start_ms = Column(BigInteger, nullable=True)  # мс от эпохи (UTC), NULL — у строк нет timestamp
+    end_ms = Column(BigInteger, nullable=True)
+    duration_ms = Column(BigInteger, nullable=True)
+    lines = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    first_error_id = Column(BigInteger, nullable=True)  # LogEntry.id первой строки с ошибкой
+
+    __table_args__ = (
+        # "20 самых долгих вызовов" / "больше всего ошибок" — проходом по индексу
+        Index("ix_spans_duration", "run_id", "kind", "duration_ms", "key"),
+        Index("ix_spans_errors", "run_id", "kind", "errors", "key"),
+        Index("ix_spans_start", "run_id", "kind", "start_ms", "key"),
+        # поиск по всем запускам (/search): какие запуски содержат ключ — без обхода запусков
+        Index("ix_spans_lookup", "kind", "key", "run_id"),
+        Index("ix_spans_key_trgm", "key", postgresql_using="gin", postgresql_ops={"key": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
+
+
+class SpanIndexRun(Base):
+    """Запуск, индекс spans которого построен целиком — и тогда, когда в нём нет ни вызовов, ни ресурсов."""
+
+    __tablename__ = "span_index_runs"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+
+
+class SearchKey(Base):
+    """Словарь ключей поиска по всем запускам (/search): ресурсы "тип:имя", tf_req_id, шаблоны ошибок."""
+
+    __tablename__ = "search_keys"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(32), nullable=False)  # resource|tf_req_id|error
+    value = Column(Text, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("kind", "value", name="uq_search_keys_kind_value"),
+        Index("ix_search_keys_value_trgm", "value", postgresql_using="gin", postgresql_ops={"value": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
+
+
+class RunSearchKey(Base):
+    """Инвертированный индекс: в каких запусках встречается ключ поиска."""
+
+    __tablename__ = "run_search_keys"
+
+    key_id = Column(Integer, ForeignKey("search_keys.id"), primary_key=True)
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_run_search_keys_run", "run_id"),  # удаление запуска
+        {"sqlite_with_rowid": False},
+    )
+
+
+class SearchIndexRun(Base):
+    """Запуск, ключи spans и error_templates которого занесены в run_search_keys (после изменения индексов снимается)."""
+
+    __tablename__ = "search_index_runs"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+
+
+class ErrorTemplate(Base):
+    """Шаблон сообщений об ошибках запуска (Drain): id, ARN, числа и т.п. заменены на маски."""
+
+    __tablename__ = "error_templates"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    template_id = Column(Integer, primary_key=True)  # номер кластера внутри запуска
+    template = Column(Text, nullable=False)  # токены через пробел, переменные части — <*>
+    count = Column(Integer, nullable=False, default=0)
+    first_seen = Column(DateTime, nullable=True)
+    last_seen = Column(DateTime, nullable=True)
+    first_entry_id = Column(BigInteger, nullable=True)  # LogEntry.id первой строки шаблона
+
+    __table_args__ = (
+        Index("ix_error_templates_top", "run_id", "count", "template_id"),
+    )
+
+
+class ErrorRow(Base):
+    """Шаблон каждой строки с ошибкой: строки шаблона (/logs?template_id=) — по индексу."""
+
+    __tablename__ = "error_rows"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    entry_id = Column(BigInteger, primary_key=True)
+    template_id = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_error_rows_template", "run_id", "template_id", "entry_id"),
+        {"sqlite_with_rowid": False},
+    )
+
+
+class RunPlugin(Base):
+    """Цепочка плагинов (адрес и версия из PLUGINS), через которую прошли строки запуска."""
+
+    __tablename__ = "run_plugins"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)  # порядок в цепочке
+    address = Column(String(256), nullable=False)
+    version = Column(String(64), nullable=False, default="")
+    applied_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class RunVersion(Base):
+    """Версия содержимого запуска: растёт при каждой записи строк (разбор, дозапись, reprocess).
+
+    Кэш ответов у каждой реплики свой, ключ и ETag строятся по этой версии (cache.py).
+    """
+
+    __tablename__ = "run_versions"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class RunLease(Base):
+    """Аренда запуска задачей reprocess: какая реплика держит статус reprocessing и когда продлевала.
+
+    Истёкшую аренду (реплика остановилась посреди задачи) может забрать другая реплика.
+    """
+
+    __tablename__ = "run_leases"
+
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    owner = Column(String(128), nullable=False)
+    heartbeat_at = Column(DateTime, nullable=False)
+
+
+def _decoded(column):
+    return column_property(
+        select(DictValue.value).where(DictValue.id == column).correlate_except(DictValue).scalar_subquery()
+    )
+
+
+# Партиционирование по run_id: id строки = (run_id << RUN_ID_SHIFT) + порядковый номер,
+# поэтому строки одного запуска лежат непрерывным диапазоном первичного ключа
+RUN_ID_SHIFT = 32
+
+
+def run_id_range(run_id: int):
+    """Inclusive LogEntry.id bounds of a run's partition."""
+    lo = run_id << RUN_ID_SHIFT
+    return lo, lo + (1 << RUN_ID_SHIFT) - 1
+
+
 class LogEntry(Base):
     __tablename__ = "log_entries"
 
-    id = Column(Integer, primary_key=True, index=True)
-    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), index=True, nullable=False)
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=False)
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), nullable=False)
 
-    raw = Column(Text, nullable=False)
-    json_str = Column(Text, default="")
+    # исходная строка хранится один раз; json_str и message выводятся из неё, когда это возможно.
+    # Большие текстовые колонки отложены: ORM-запросы не читают их, пока к ним не обратятся
+    raw = mapped_column(Text, nullable=False, deferred=True)
+    json_extra = mapped_column("json_str", Text, nullable=True, deferred=True)  # only when it is not derivable from raw (listing.json_text)
 
     # parsed fields
-    timestamp = Column(DateTime, index=True, nullable=True)
-    level = Column(String(32), index=True, nullable=True)
-    phase = Column(String(32), index=True, nullable=True)  # plan/apply/other
-    tf_req_id = Column(String(128), index=True, nullable=True)
-    tf_resource_type = Column(String(128), index=True, nullable=True)
-    tf_resource_name = Column(String(256), index=True, nullable=True)
-    message = Column(Text, default="")
-    is_error = Column(Boolean, default=False, index=True)
-    is_malformed = Column(Boolean, default=False, index=True)
+    timestamp = Column(DateTime, nullable=True)
+    level_id = Column(Integer, ForeignKey("dict_values.id"), nullable=True)
+    phase_id = Column(Integer, ForeignKey("dict_values.id"), nullable=True)  # plan/apply/other
+    tf_req_id_id = Column(Integer, ForeignKey("dict_values.id"), nullable=True)
+    tf_resource_type_id = Column(Integer, ForeignKey("dict_values.id"), nullable=True)
+    tf_resource_name = Column(String(256), nullable=True)
+    message_text = Column("message", Text, nullable=True)  # only when message is not a slice of raw
+    message_offset = Column(Integer, nullable=True)
+    message_len = Column(Integer, nullable=True)
+    is_error = Column(Boolean, default=False)
+    is_malformed = Column(Boolean, default=False)
+
+    # decoded string values, read-only
+    level = _decoded(level_id)
+    phase = _decoded(phase_id)
+    tf_req_id = _decoded(tf_req_id_id)
+    tf_resource_type = _decoded(tf_resource_type_id)
+    message = column_property(func.coalesce(message_text, func.substr(raw, message_offset + 1, message_len)))
 
     run = relationship("Run", back_populates="logs")
+
+    # все индексы начинаются с run_id: удаление и выборки по запуску затрагивают только его страницы
+    __table_args__ = (
+        Index("ix_log_entries_run_ts", "run_id", "timestamp"),
+        Index("ix_log_entries_run_name", "run_id", "tf_resource_name"),
+        Index("ix_log_entries_run_level", "run_id", "level_id"),
+        # (run_id, ключ, timestamp): поиск пар в окне времени без сортировки
+        Index("ix_log_entries_run_phase", "run_id", "phase_id", "timestamp"),
+        Index("ix_log_entries_run_req", "run_id", "tf_req_id_id", "timestamp"),
+        Index("ix_log_entries_run_resource", "run_id", "tf_resource_type_id", "tf_resource_name", "timestamp"),
+        # PostgreSQL: триграммные индексы для search и секционирование по диапазонам id (по одной секции на запуск)
+        Index("ix_log_entries_raw_trgm", "raw", postgresql_using="gin", postgresql_ops={"raw": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_log_entries_json_trgm", "json_str", postgresql_using="gin", postgresql_ops={"json_str": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_log_entries_message_trgm", "message", postgresql_using="gin", postgresql_ops={"message": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        {"postgresql_partition_by": "RANGE (id)"},
+    )
+
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+# SQLite: триграммный FTS5-индекс значений run_keys, rowid = (run_id << RUN_ID_SHIFT) + value_id
+RUN_KEYS_FTS = "run_keys_fts"
+event.listen(
+    RunKey.__table__,
+    "after_create",
+    DDL(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {RUN_KEYS_FTS} "
+        "USING fts5(value, kind UNINDEXED, tokenize='trigram')"
+    ).execute_if(dialect="sqlite"),
+)
+
+# SQLite: триграммный FTS5-индекс словаря ключей поиска, rowid = search_keys.id (ключи только добавляются)
+SEARCH_KEYS_FTS = "search_keys_fts"
+for _ddl in (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_KEYS_FTS} "
+    "USING fts5(value, kind UNINDEXED, content='search_keys', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_KEYS_FTS}_insert AFTER INSERT ON search_keys BEGIN "
+    f"INSERT INTO {SEARCH_KEYS_FTS} (rowid, value, kind) VALUES (new.id, new.value, new.kind); END",
+):
+    event.listen(SearchKey.__table__, "after_create", DDL(_ddl).execute_if(dialect="sqlite"))
@@ -0,0 +1,125 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import Row, case, func, literal, or_, select
+from sqlalchemy.orm import Session
+
+from . import dictionary
+from .filters import resource_branch
+from .listing import select_rows
+from .models import LogEntry
+
+
+# Подмешивание парных строк (запрос/ответ) к странице /logs.
+# Для каждого ключа страницы берём не более per_key ближайших строк с каждой стороны
+# от временного окна страницы, общий объём ограничен budget.
+PAIRS_PER_KEY = 50
+PAIRS_BUDGET = 2000
+
+
+def _page_keys(db: Session, base_rows: Sequence[Row], pair_by: str):
+    """Page keys in page order: (display key (as in /logs/groups) -> SQL clause selecting its rows,
+    columns identifying a key, row -> its display key)."""
+    keys: Dict[str, object] = {}
+    if pair_by in ("tf_req_id", "phase"):
+        column = LogEntry.tf_req_id_id if pair_by == "tf_req_id" else LogEntry.phase_id
+        ids = [getattr(r, column.key) for r in base_rows]
+        names = dictionary.decode_ids(db, ids)
+        for value_id in ids:
+            name = names.get(value_id)
+            if name is not None and name not in keys:
+                keys[name] = value_id
+        return keys, [column], lambda r: names.get(getattr(r, column.key))
+
+    names = dictionary.decode_ids(db, (r.tf_resource_type_id for r in base_rows))
+
+    def key_of(r: Row) -> str:
+        return f"{names.get(r.tf_resource_type_id) or ''}:{r.tf_resource_name or ''}"
+
+    for r in base_rows:
+        if r.tf_resource_type_id is None and not r.tf_resource_name:
+            continue
+        key = key_of(r)
+        if key not in keys:
+            keys[key] = resource_branch(r.run_id, r.tf_resource_type_id, r.tf_resource_name or None)
+    return keys, [LogEntry.tf_resource_type_id, LogEntry.tf_resource_name], key_of
+
+
+def _partner_rows(db, run_id, keys, key_columns, base_ids, win_from, per_key):
+    """Up to per_key + 1 nearest rows per (key, side) of all page keys in one windowed query."""
+    if len(key_columns) == 1:
+        where = key_columns[0].in_(list(keys.values()))
+    else:
+        where = or_(*keys.values())
+    if win_from is None:
+        side = literal(0)
+    else:
+        # окно страницы и после него — сторона 0, до него — сторона 1
+        side = case((LogEntry.timestamp >= win_from, 0), else_=1)
+    # сторона 0 — по возрастанию, сторона 1 — по убыванию (ближайшие первыми);
+    # в разделе одна сторона, выражение другой там постоянно NULL
+    rank = func.row_number().over(
+        partition_by=[*key_columns, side],
+        order_by=[
+            case((side == 0, LogEntry.timestamp)).asc(),
+            case((side == 0, LogEntry.id)).asc(),
+            case((side == 1, LogEntry.timestamp)).desc(),
+            case((side == 1, LogEntry.id)).desc(),
+        ],
+    )
+    ranked = (
+        select_rows(LogEntry.run_id == run_id, where, LogEntry.id.notin_(base_ids))
+        .add_columns(side.label("side"), rank.label("rank"))
+        .subquery()
+    )
+    stmt = select(ranked).where(ranked.c.rank <= per_key + 1).order_by(ranked.c.side, ranked.c.rank)
+    return db.execute(stmt).all()
+
+
+def expand_pairs(
+    db: Session,
+    run_id: int,
+    base_rows: Sequence[Row],
+    pair_by: str = "tf_req_id",
+    per_key: int = PAIRS_PER_KEY,
+    budget: int = PAIRS_BUDGET,
+) -> Tuple[List[Row], List[str]]:
+    """Return (partner rows not on the page, keys whose partners were cut off).
+
+    base_rows are listing.LIST_COLUMNS tuples; the returned rows carry the same columns
+    (plus the side and rank of the partner query).
+    """
+    keys, key_columns, key_of = _page_keys(db, base_rows, pair_by)
+    if not keys:
+        return [], []
+
+    base_ids: Set[int] = {r.id for r in base_rows}
+    stamps = [r.timestamp for r in base_rows if r.timestamp is not None]
+    win_from: Optional[datetime] = min(stamps) if stamps else None
+
+    sides: Dict[str, List[List[Row]]] = {key: [[], []] for key in keys}
+    for r in _partner_rows(db, run_id, keys, key_columns, base_ids, win_from, per_key):
+        sides[key_of(r)][r.side].append(r)
+
+    extra: Dict[int, Row] = {}
+    truncated: List[str] = []
+    for key in keys:
+        if len(extra) >= budget:
+            truncated.append(key)
+            continue
+        cut = False
+        for rows in sides[key] if win_from is not None else sides[key][:1]:
+            # остаток общего объёма — перед каждой стороной: обе стороны ключа делят один budget
+            limit = min(per_key, budget - len(extra))
+            if limit <= 0:
+                cut = True
+                break
+            if len(rows) > limit:
+                cut = True
+                rows = rows[:limit]
+            for r in rows:
+                extra[r.id] = r
+        if cut:
+            truncated.append(key)
+
+    return list(extra.values()), truncated
@@ -1,7 +1,8 @@
+import io
 import json
 import re
 from datetime import datetime, timezone
-from typing import Any, Dict, Iterable, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 
 TIMESTAMP_REGEXES = [
@@ -186,3 +187,29 @@ def normalize_entry(obj: Dict[str, Any], raw: str, malformed: bool) -> Dict[str,
     }
 
 
+
+
+def _line_start(fh, pos: int) -> int:
+    """First line start at or after pos (pos itself when it follows a newline)."""
+    if pos == 0:
+        return 0
+    fh.seek(pos - 1)
+    fh.readline()
+    return fh.tell()
+
+
+def parse_range(path: str, lo: int, hi: int) -> List[Dict[str, Any]]:
+    """Normalized rows of the lines starting in [lo, hi) of a file.
+
+    Соседние диапазоны выравниваются по одной и той же границе строки, поэтому файл можно
+    разбирать кусками в разных процессах; строки читаются так же, как open(path, "r").
+    """
+    with open(path, "rb") as fh:
+        start = _line_start(fh, lo)
+        end = _line_start(fh, hi)
+        if end <= start:
+            return []
+        fh.seek(start)
+        data = fh.read(end - start)
+    text = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", errors="replace")
+    return [normalize_entry(obj, raw, malformed) for obj, raw, malformed in iter_parse_jsonl(text)]
@@ -0,0 +1,128 @@
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from .models import Run, RunPlugin
+from .parser import parse_datetime
+from ..plugins.registry import get_registered_plugins
+
+
+# Прогон нормализованных строк через плагины PLUGINS (gRPC LogFilter). Плагин получает поля LogItem
+# и возвращает изменённые или отфильтрованные строки: ответ сливается с исходными строками по id —
+# raw и остальное, чего нет в LogItem, сохраняется; timestamp приходит строкой ISO8601.
+# Цепочка (адрес и версия по порядку) записывается для запуска в run_plugins: запуск, разобранный
+# другой цепочкой, устарел и перегоняется через /runs/{id}/reprocess.
+PLUGIN_BATCH = 500  # строк в одном вызове: сообщение gRPC ограничено 4 МБ
+PLUGIN_FIELDS = (
+    "timestamp", "level", "phase", "tf_req_id", "tf_resource_type", "tf_resource_name",
+    "message", "is_error", "is_malformed", "json_str",
+)
+
+
+def plugin_chain(plugins: Sequence[Any]) -> List[Dict[str, str]]:
+    return [{"address": p.address, "version": p.version} for p in plugins]
+
+
+def _timestamp(value: Any, current: Any) -> Any:
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        return current
+    if not value:
+        return None
+    # нераспознанное время плагина не затирает разобранное
+    parsed = parse_datetime(value)
+    return current if parsed is None else parsed
+
+
+def merge_plugin_output(rows: List[Dict[str, Any]], items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Plugin output applied to the rows it was given (matched by "id"), in the order of the rows;
+    rows missing from it are dropped."""
+    returned: Dict[Any, Dict[str, Any]] = {}
+    for item in items:
+        # плагин может менять и отбрасывать строки, но не добавлять или переставлять их
+        returned.setdefault(item.get("id"), item)
+    out = []
+    for src in rows:
+        item = returned.get(src["id"])
+        if item is None:
+            continue
+        row = dict(src)
+        for field in PLUGIN_FIELDS:
+            if field not in item:
+                continue
+            value = item[field]
+            if field == "timestamp":
+                value = _timestamp(value, src.get("timestamp"))
+            elif field in ("message", "json_str") and not value:
+                # пустая строка в proto3 — "не задано"
+                continue
+            elif field in ("is_error", "is_malformed"):
+                value = bool(value)
+            row[field] = value
+        out.append(row)
+    return out
+
+
+def apply_plugins(
+    plugins: Sequence[Any], rows: List[Dict[str, Any]], strict: bool = False
+) -> Tuple[List[Dict[str, Any]], Dict[str, float], Set[str]]:
+    """Rows (each with a unique "id") through the chain: (rows, seconds per plugin, failed plugins).
+
+    A failing plugin is skipped so that it does not break parsing, unless ``strict``.
+    """
+    seconds: Dict[str, float] = {}
+    failed: Set[str] = set()
+    for p in plugins:
+        started = time.perf_counter()
+        try:
+            out: List[Dict[str, Any]] = []
+            for i in range(0, len(rows), PLUGIN_BATCH):
+                part = rows[i : i + PLUGIN_BATCH]
+                out.extend(merge_plugin_output(part, p.process_batch(part)))
+            rows = out
+        except Exception:
+            if strict:
+                raise
+            # плагины не должны ломать парсинг
+            failed.add(p.address)
+        seconds[p.address] = seconds.get(p.address, 0.0) + time.perf_counter() - started
+    return rows, seconds, failed
+
+
+def record_plugins(db: Session, run_id: int, plugins: Sequence[Any]) -> None:
+    """Store the chain the run's rows went through (no rows — no plugins)."""
+    drop_run_plugins(db, run_id)
+    if plugins:
+        db.execute(insert(RunPlugin), [
+            {"run_id": run_id, "position": i, "address": p.address, "version": p.version, "applied_at": datetime.utcnow()}
+            for i, p in enumerate(plugins)
+        ])
+
+
+def drop_run_plugins(db: Session, run_id: int) -> None:
+    db.execute(delete(RunPlugin).where(RunPlugin.run_id == run_id))
+
+
+def plugin_state(db: Session, stale_only: bool = False) -> Dict[str, Any]:
+    """Current PLUGINS chain and the chain of every run; a run is stale when they differ."""
+    current = plugin_chain(get_registered_plugins())
+    recorded: Dict[int, List[Dict[str, Any]]] = {}
+    for run_id, address, version, applied_at in db.execute(
+        select(RunPlugin.run_id, RunPlugin.address, RunPlugin.version, RunPlugin.applied_at)
+        .order_by(RunPlugin.run_id, RunPlugin.position)
+    ):
+        recorded.setdefault(run_id, []).append({"address": address, "version": version, "applied_at": applied_at})
+    runs = []
+    for run_id, filename, status in db.execute(
+        select(Run.id, Run.filename, Run.status).order_by(Run.created_at.desc(), Run.id.desc())
+    ):
+        chain = recorded.get(run_id, [])
+        stale = [{"address": p["address"], "version": p["version"]} for p in chain] != current
+        if stale_only and not stale:
+            continue
+        runs.append({"run_id": run_id, "filename": filename, "status": status, "plugins": chain, "stale": stale})
+    return {"plugins": current, "stale": sum(1 for r in runs if r["stale"]), "runs": runs}
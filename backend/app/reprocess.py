@@ -0,0 +1,345 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.orm import Session
+
+from . import dictionary, jobs
+from .archive import ensure_hydrated
+from .cache import bump_run_version, invalidate_run
+from .database import SessionLocal
+from .keyindex import INDEXED_KINDS, add_run_keys, batch_keys, drop_run_keys
+from .limits import run_heavy
+from .models import LogEntry, Run, RunLease, run_id_range
+from .parser import iter_parse_jsonl, normalize_entry
+from .pluginchain import apply_plugins, drop_run_plugins, record_plugins
+from .services import compact_text_fields, run_summary
+from .spans import SpanIndexer, drop_span_index
+from .storage import dialect_insert
+from .templates import TemplateMiner, drop_template_index
+from .timeindex import BUILD_CHUNK, TimelineIndexer, drop_timeline_index
+from ..plugins.registry import get_registered_plugins
+
+logger = logging.getLogger(__name__)
+
+
+# Повторный прогон плагинов по уже разобранному запуску, без чтения исходного файла.
+# Строки читаются из log_entries по диапазону id пачками, каждая заново нормализуется из raw
+# (плагины применяются к результату разбора, а не поверх прошлой цепочки — повторный прогон
+# даёт тот же результат), проходит цепочку, и в БД пишутся только изменившиеся колонки.
+# Каждая пачка фиксируется отдельно: SQLite не держит блокировку записи весь прогон, загрузка
+# и live tail пишут между пачками. Индексы запуска (ключи, хронология, вызовы, шаблоны ошибок)
+# собираются в том же проходе и заменяются в конце одной транзакцией.
+# На время задачи запуск в статусе reprocessing с арендой (run_leases): удалить, архивировать
+# или перегнать его нельзя ни с одной реплики. Аренду продлевает поток задачи; истёкшую —
+# реплика остановилась посреди задачи — можно забрать.
+JOB_KIND = "reprocess"
+REPROCESS_STATUSES = ("parsed", "archived")
+REPROCESS_STATUS = "reprocessing"
+# у каждого процесса своя; задайте INSTANCE_ID реплике, чтобы после перезапуска она сразу
+# освобождала свои прерванные задачи, не дожидаясь истечения аренды
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = float(os.getenv("REPROCESS_LEASE_SECONDS", "120"))
+# колонки, которые может изменить цепочка (ключи атрибутов LogEntry, как у bulk_insert_entries)
+UPDATABLE = (
+    "timestamp", "level_id", "phase_id", "tf_req_id_id", "tf_resource_type_id", "tf_resource_name",
+    "json_extra", "message_text", "message_offset", "message_len", "is_error", "is_malformed",
+)
+
+_columns = {key: LogEntry.__mapper__.columns[key] for key in UPDATABLE}
+_id = LogEntry.__table__.c.id
+_raw = LogEntry.__table__.c.raw
+
+_start_lock = threading.Lock()
+_running: Dict[int, jobs.IngestJob] = {}
+_tasks: Set[asyncio.Task] = set()
+
+
+def _normalized(raw: str) -> Dict[str, Any]:
+    for obj, line, malformed in iter_parse_jsonl([raw]):
+        return normalize_entry(obj, line, malformed)
+    return normalize_entry({}, raw, True)
+
+
+def _stored(value: Any, key: str) -> Any:
+    # как значение ляжет в колонку: булевы могут быть NULL, имя ресурса из JSON — числом
+    if key in ("is_error", "is_malformed"):
+        return bool(value)
+    if key == "tf_resource_name" and value is not None:
+        return str(value)
+    return value
+
+
+def _read_chunks(db: Session, run_id: int):
+    lo, hi = run_id_range(run_id)
+    last = lo
+    while True:
+        rows = db.execute(
+            select(_id, _raw, *_columns.values()).where(_id > last, _id <= hi).order_by(_id).limit(BUILD_CHUNK)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def _write_changes(db: Session, changes: Dict[Tuple[str, ...], List[Dict[str, Any]]]) -> None:
+    # один UPDATE на набор изменившихся колонок, executemany по id
+    for keys, params in changes.items():
+        stmt = update(LogEntry.__table__).where(_id == bindparam("b_id")).values(
+            {_columns[key].name: bindparam(f"b_{key}") for key in keys}
+        )
+        db.execute(stmt, params)
+
+
+def reprocess_run(
+    db: Session, run_id: int, on_batch: Optional[Callable[[int, Dict[str, float]], None]] = None
+) -> Dict[str, Any]:
+    """Run the stored rows of a run through the current PLUGINS chain and write back changed columns.
+
+    Rows a plugin drops are kept as parsed (row ids of a run stay dense). Every batch commits with
+    its changed rows (``on_batch`` is called before that commit and may abort it); the run's indexes
+    are swapped in the last transaction, which also sets the run "parsed" and drops its lease.
+    Plugin errors abort the run between batches: see _abandon.
+    """
+    ensure_hydrated(db, run_id)
+    run = db.get(Run, run_id)
+    if run is None:
+        raise ValueError(f"Run {run_id} not found")
+    plugins = get_registered_plugins()
+    timeline = TimelineIndexer(run_id, fresh=True)
+    spans = SpanIndexer(run_id, fresh=True)
+    templates = TemplateMiner(run_id, fresh=True)
+    keys: Dict[str, Set[str]] = {kind: set() for kind in INDEXED_KINDS}
+    total = malformed = changed = 0
+    phases: Set[str] = set()
+
+    for chunk in _read_chunks(db, run_id):
+        parsed = [dict(_normalized(r.raw), id=r.id, run_id=run_id) for r in chunk]
+        out, plugin_seconds, _failed = apply_plugins(plugins, parsed, strict=True)
+        # строка на каждую прочитанную, в порядке id: отброшенные плагином — как разобраны
+        by_id = {r["id"]: r for r in out}
+        rows = [by_id.get(r["id"], r) for r in parsed]
+        for data in rows:
+            if data.get("phase"):
+                phases.add(data["phase"])
+            if data.get("is_malformed"):
+                malformed += 1
+        timeline.add(rows)
+        spans.add(rows, rows[0]["id"])
+        templates.add(rows, rows[0]["id"])
+        for kind, values in batch_keys(rows).items():
+            keys[kind] |= values
+        dictionary.encode_rows(db, rows)
+        changes: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for data, src, stored in zip(rows, parsed, chunk):
+            compact_text_fields(data, None if src["is_malformed"] else src["json_str"])
+            # stored: id, raw, затем колонки UPDATABLE
+            diff = tuple(
+                key for i, key in enumerate(UPDATABLE, 2)
+                if data.get(key) != stored[i] and _stored(data.get(key), key) != _stored(stored[i], key)
+            )
+            if diff:
+                changes.setdefault(diff, []).append(
+                    {"b_id": data["id"], **{f"b_{key}": _stored(data.get(key), key) for key in diff}}
+                )
+                changed += 1
+        _write_changes(db, changes)
+        if changes:
+            bump_run_version(db, run_id)
+        total += len(chunk)
+        if on_batch is not None:
+            on_batch(len(chunk), plugin_seconds)
+        # пачка фиксируется сразу: в памяти нет изменений всего запуска, блокировка записи — на одну пачку
+        db.commit()
+        if changes:
+            invalidate_run(run_id)
+
+    if changed:
+        # индексы запуска собраны заново по новым значениям строк
+        drop_run_keys(db, run_id)
+        drop_timeline_index(db, run_id)
+        drop_span_index(db, run_id)
+        drop_template_index(db, run_id)
+        add_run_keys(db, run_id, keys, set())
+        timeline.flush(db)
+        spans.flush(db)
+        templates.flush(db)
+        bump_run_version(db, run_id)
+    record_plugins(db, run_id, plugins)
+    run.summary = run_summary(total, malformed, phases)
+    run.status = "parsed"
+    db.add(run)
+    db.execute(delete(RunLease).where(RunLease.run_id == run_id))
+    db.commit()
+    invalidate_run(run_id)
+    return {"rows": total, "changed": changed, "summary": run.summary}
+
+
+def _owned(run_id: int):
+    return select(RunLease.run_id).where(RunLease.run_id == run_id, RunLease.owner == INSTANCE_ID).exists()
+
+
+def _claim(db: Session, run_id: int) -> bool:
+    """Take the run for this process: from REPROCESS_STATUSES, or over an expired lease."""
+    now = datetime.utcnow()
+    # проверка и смена статуса одним UPDATE: две реплики не начнут задачу для одного запуска
+    claimed = db.execute(
+        update(Run).where(Run.id == run_id, Run.status.in_(REPROCESS_STATUSES)).values(status=REPROCESS_STATUS)
+    ).rowcount
+    if claimed:
+        t = RunLease.__table__
+        stmt = dialect_insert(db, t).values(run_id=run_id, owner=INSTANCE_ID, heartbeat_at=now)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[t.c.run_id], set_={"owner": INSTANCE_ID, "heartbeat_at": now}
+        ))
+    else:
+        # уже reprocessing: аренду остановившейся реплики забирает один UPDATE (условие перепроверяется под блокировкой строки)
+        claimed = db.execute(
+            update(RunLease)
+            .where(
+                RunLease.run_id == run_id,
+                RunLease.heartbeat_at < now - timedelta(seconds=LEASE_SECONDS),
+                select(Run.id).where(Run.id == run_id, Run.status == REPROCESS_STATUS).exists(),
+            )
+            .values(owner=INSTANCE_ID, heartbeat_at=now)
+        ).rowcount
+    db.commit()
+    return bool(claimed)
+
+
+def _reset(db: Session, run_id: int, *criteria) -> bool:
+    """Return a "reprocessing" run to "parsed" (if ``criteria`` still hold) and drop its lease.
+
+    Batches committed before the job stopped stay: the indexes are dropped (rebuilt from the rows
+    on next use) and the recorded chain is forgotten, so the run shows as stale in /runs/plugins.
+    """
+    released = db.execute(
+        update(Run).where(Run.id == run_id, Run.status == REPROCESS_STATUS, *criteria).values(status="parsed")
+    ).rowcount
+    if released:
+        drop_run_keys(db, run_id)
+        drop_timeline_index(db, run_id)
+        drop_span_index(db, run_id)
+        drop_template_index(db, run_id)
+        drop_run_plugins(db, run_id)
+        bump_run_version(db, run_id)
+        db.execute(delete(RunLease).where(RunLease.run_id == run_id))
+    db.commit()
+    if released:
+        invalidate_run(run_id)
+    return bool(released)
+
+
+def _abandon(db: Session, run_id: int) -> None:
+    # после ошибки задачи — только пока аренда наша: иначе запуск уже перегоняет другая реплика
+    _reset(db, run_id, _owned(run_id))
+
+
+def release_interrupted_runs(db: Session) -> List[int]:
+    """Startup: runs left "reprocessing" by a stopped process become available again.
+
+    Only leases that expired (or have no row) or belong to INSTANCE_ID are released: a job still
+    running on another replica keeps its run.
+    """
+    def not_leased(run_id: int):
+        cutoff = datetime.utcnow() - timedelta(seconds=LEASE_SECONDS)
+        return ~select(RunLease.run_id).where(
+            RunLease.run_id == run_id, RunLease.heartbeat_at >= cutoff, RunLease.owner != INSTANCE_ID
+        ).exists()
+
+    stuck = db.execute(select(Run.id).where(Run.status == REPROCESS_STATUS)).scalars().all()
+    # условие аренды проверяется ещё раз в UPDATE: её могла только что забрать другая реплика
+    return [run_id for run_id in stuck if _reset(db, run_id, not_leased(run_id))]
+
+
+class _Lease:
+    """Renews the lease of a claimed run from a thread of its own: the job may wait for a heavy slot
+    or for a slow plugin longer than LEASE_SECONDS. ``lost`` — another replica took the run over."""
+
+    def __init__(self, run_id: int) -> None:
+        self.run_id = run_id
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"reprocess-lease-{run_id}", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _beat(self) -> None:
+        while not self._stop.wait(LEASE_SECONDS / 4):
+            db = SessionLocal()
+            try:
+                renewed = db.execute(
+                    update(RunLease)
+                    .where(RunLease.run_id == self.run_id, RunLease.owner == INSTANCE_ID)
+                    .values(heartbeat_at=datetime.utcnow())
+                ).rowcount
+                db.commit()
+                if not renewed:
+                    self.lost = True
+                    return
+            except Exception:
+                # SQLite занят пачкой дольше busy timeout — продлим на следующем шаге
+                db.rollback()
+                logger.warning("Could not renew the reprocess lease of run %s", self.run_id, exc_info=True)
+            finally:
+                db.close()
+
+
+def _run_job(job: jobs.IngestJob, run_id: int, name: str, lease: _Lease) -> None:
+    def on_batch(lines: int, plugin_seconds: Dict[str, float]) -> None:
+        if lease.lost:
+            raise RuntimeError(f"Run {run_id} was taken over by another replica")
+        job.add_batch(name, lines, plugin_seconds)
+
+    db = SessionLocal()
+    try:
+        job.set_status("running")
+        job.set_file(name, status="running")
+        result = reprocess_run(db, run_id, on_batch)
+        job.set_file(name, status="done", **result)
+        job.finish("done")
+    except Exception as exc:
+        db.rollback()
+        _abandon(db, run_id)
+        job.set_file(name, status="error", error=str(exc))
+        job.finish("error", str(exc))
+    finally:
+        lease.stop()
+        db.close()
+        with _start_lock:
+            _running.pop(run_id, None)
+
+
+def start_reprocess(db: Session, run_id: int) -> Optional[jobs.IngestJob]:
+    """Queue a run for reprocessing under a heavy-work slot (limits.run_heavy); call from the event loop.
+
+    The run is claimed first (status "reprocessing" plus a lease of this process), so it cannot be
+    deleted, archived or reprocessed elsewhere meanwhile. Returns the job already running for the
+    run here, or None when the run is in another status or leased by a live replica.
+    """
+    with _start_lock:
+        job = _running.get(run_id)
+        if job is not None:
+            return job
+        if not _claim(db, run_id):
+            return None
+        run = db.get(Run, run_id)
+        job = jobs.create_job(JOB_KIND)
+        job.set_file(run.filename, status="queued", run_id=run_id)
+        _running[run_id] = job
+    lease = _Lease(run_id)
+    lease.start()
+    task = asyncio.get_running_loop().create_task(run_heavy(_run_job, job, run_id, run.filename, lease))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
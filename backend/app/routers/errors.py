@@ -0,0 +1,35 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import Session
+
+from ..archive import ensure_hydrated
+from ..cache import cached_response
+from ..database import get_db
+from ..limits import heavy_slot
+from ..templates import ensure_template_index, has_template_index, top_templates
+
+
+router = APIRouter(prefix="/errors", tags=["errors"])
+
+
+@router.get("/top", dependencies=[Depends(heavy_slot)])
+def top_errors(
+    request: Request,
+    run_id: int,
+    limit: int = Query(20, ge=1, le=1000),
+    q: Optional[str] = Query(None, description="подстрока шаблона"),
+    db: Session = Depends(get_db),
+):
+    """Различные причины ошибок запуска: шаблоны сообщений (id, ARN, числа замаскированы)
+    по числу строк, с первым/последним появлением. Строки шаблона: /logs?template_id=..."""
+
+    def build():
+        # шаблоны хранятся и для архивных запусков, строки нужны только чтобы их построить
+        if not has_template_index(db, run_id):
+            ensure_hydrated(db, run_id)
+            ensure_template_index(db, run_id)
+        return ORJSONResponse(top_templates(db, run_id, limit, q))
+
+    return cached_response(request, db, run_id, build)
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException
+
+from .. import importer, jobs
+
+
+router = APIRouter(prefix="/import", tags=["import"])
+
+
+@router.post("/scan")
+def scan_import_dir(force: bool = False):
+    """Импортировать новые и изменившиеся файлы IMPORT_DIR на сервере (фоновая задача).
+
+    Прогресс без опроса — GET /jobs/{job_id}/events.
+    """
+    if not importer.IMPORT_DIR:
+        raise HTTPException(status_code=400, detail="IMPORT_DIR is not configured")
+    return importer.start_import(force).snapshot(with_files=False)
+
+
+@router.get("/jobs")
+def list_import_jobs():
+    return [job.snapshot(with_files=False) for job in jobs.list_jobs(importer.JOB_KIND)]
+
+
+@router.get("/jobs/{job_id}")
+def get_import_job(job_id: str):
+    """Прогресс задачи импорта по файлам: queued|parsing|done|skipped|error, bytes_done, lines, run_id."""
+    job = jobs.get_job(job_id)
+    if job is None or job.kind != importer.JOB_KIND:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.snapshot()
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from .. import events, jobs
+
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+KEEPALIVE_SECONDS = 15
+STREAM_SECONDS = 60  # как у live: по истечении EventSource переподключается и получает снимок заново
+
+
+def _job_id(job_id: str) -> str:
+    if not jobs.JOB_ID_RE.match(job_id):
+        raise HTTPException(status_code=400, detail="job_id must match [A-Za-z0-9_-]{1,64}")
+    return job_id
+
+
+@router.get("/")
+def list_ingest_jobs(kind: Optional[str] = None):
+    return [job.snapshot(with_files=False) for job in jobs.list_jobs(kind)]
+
+
+@router.get("/{job_id}")
+def get_ingest_job(job_id: str):
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.snapshot()
+
+
+@router.get("/{job_id}/events")
+async def job_events(request: Request, job_id: str):
+    """Server-Sent Events: snapshot (текущее состояние), progress (строки/байты, текущий файл,
+    время плагинов), done (итог по файлам). Подписаться можно до отправки файла: пока задачи
+    с этим id нет, приходит снимок status=pending, а POST /uploads/file?job_id=... пишет прогресс
+    в тот же канал. Подписка задачу не создаёт."""
+    channel = jobs.channel(_job_id(job_id))
+
+    def snapshot():
+        job = jobs.get_job(job_id)
+        return job.snapshot() if job is not None else jobs.pending_snapshot(job_id)
+
+    async def stream():
+        # подписка до снимка: прогресс между ними не потеряется
+        queue = events.subscribe(channel)
+        try:
+            yield b"retry: 3000\n\n"
+            job = jobs.get_job(job_id)
+            if job is not None and job.finished_at is not None:
+                yield events.sse_frame("done", {"type": "done", **job.snapshot()})
+                return
+            yield events.sse_frame("snapshot", snapshot())
+            deadline = time.monotonic() + STREAM_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    message = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield b": keepalive\n\n"
+                    continue
+                if message["type"] == "reset":
+                    # очередь переполнилась: вместо пропущенных сообщений — свежий снимок
+                    yield events.sse_frame("snapshot", snapshot())
+                    continue
+                yield events.sse_frame(message["type"], message)
+                if message["type"] == "done":
+                    return
+        finally:
+            events.unsubscribe(channel, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
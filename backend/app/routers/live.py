@@ -0,0 +1,179 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Set, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .. import events, tail
+from ..database import get_db
+from ..models import IngestCheckpoint, Run
+
+
+router = APIRouter(prefix="/live", tags=["live"])
+
+# POST /append разбирает принятое не реже, чем раз в FLUSH_BYTES / FLUSH_SECONDS
+FLUSH_BYTES = 256 * 1024
+FLUSH_SECONDS = 0.5
+KEEPALIVE_SECONDS = 15
+# uvicorn при остановке ждёт завершения открытых ответов: поток событий закрывается сам,
+# EventSource переподключается с Last-Event-ID и получает пропущенные строки
+STREAM_SECONDS = 60
+
+_writers: Set[int] = set()  # запуски, в которые сейчас пишет POST /append
+
+
+def _live_run(db: Session, run_id: int) -> Run:
+    run = db.get(Run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.status != tail.LIVE_STATUS:
+        raise HTTPException(status_code=409, detail=f"Run is {run.status}, not live")
+    return run
+
+
+@router.post("/")
+def create_live_run(filename: str = "live.log", db: Session = Depends(get_db)):
+    """Пустой запуск в статусе live; строки приходят через POST /live/{run_id}/append."""
+    run = tail.start_live_run(db, filename)
+    return tail.progress(db, run.id)
+
+
+@router.post("/follow")
+def follow_file(path: str, db: Session = Depends(get_db)):
+    """Следить за файлом, который дописывает terraform на сервере (TF_LOG_PATH внутри TAIL_DIR)."""
+    target = tail.followable_path(path)
+    if target is None:
+        raise HTTPException(status_code=400, detail="path must be an existing file inside TAIL_DIR")
+    run = tail.start_live_run(db, target.name, path=target, follow=True)
+    return tail.progress(db, run.id)
+
+
+@router.get("/{run_id}")
+def live_progress(run_id: int, db: Session = Depends(get_db)):
+    state = tail.progress(db, run_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return state
+
+
+@router.post("/{run_id}/append")
+async def append_lines(request: Request, run_id: int, finish: bool = False, db: Session = Depends(get_db)):
+    """Дописать строки в запуск. Тело читается потоком (chunked), разбор идёт по мере приёма:
+
+    terraform apply 2>&1 | curl -T - -H 'Content-Type: text/plain' .../api/live/1/append
+    """
+    run = _live_run(db, run_id)
+    cp = db.get(IngestCheckpoint, run_id)
+    if cp is not None and cp.follow:
+        raise HTTPException(status_code=409, detail="Run follows a server-side file")
+    if run_id in _writers:
+        raise HTTPException(status_code=409, detail="Another append to this run is in progress")
+    path = Path(run.stored_path)
+    db.close()
+
+    _writers.add(run_id)
+    received = 0
+    try:
+        pending = 0
+        flushed_at = time.monotonic()
+        with path.open("ab") as fh:
+            async for chunk in request.stream():
+                fh.write(chunk)
+                received += len(chunk)
+                pending += len(chunk)
+                if pending >= FLUSH_BYTES or time.monotonic() - flushed_at >= FLUSH_SECONDS:
+                    fh.flush()
+                    await run_in_threadpool(tail.catch_up, run_id)
+                    pending = 0
+                    flushed_at = time.monotonic()
+        if finish:
+            await run_in_threadpool(tail.finish_live_run, run_id)
+        else:
+            await run_in_threadpool(tail.catch_up, run_id)
+    finally:
+        _writers.discard(run_id)
+    return {**tail.progress(db, run_id), "received": received}
+
+
+@router.post("/{run_id}/finish")
+async def finish_run(run_id: int, db: Session = Depends(get_db)):
+    """Разобрать остаток файла (включая строку без перевода строки) и перевести запуск в parsed."""
+    _live_run(db, run_id)
+    if run_id in _writers:
+        raise HTTPException(status_code=409, detail="Append to this run is in progress")
+    await run_in_threadpool(tail.finish_live_run, run_id)
+    db.expire_all()
+    return tail.progress(db, run_id)
+
+
+def _render(message: Dict[str, Any], by: str, sent: int) -> Tuple[Optional[bytes], int]:
+    """SSE frame for a tail/events message and the id of the last row sent so far."""
+    kind = message["type"]
+    if kind == "done":
+        return events.sse_frame("done", message), sent
+    if kind != "rows":
+        return events.sse_frame("reset", {}), sent
+    if message["last_id"] <= sent:
+        return None, sent
+    items = [i for i in message["items"] if i["id"] > sent]
+    delta = message["timeline"][by] if len(items) == len(message["items"]) else tail.timeline_delta(items, by)
+    frame = events.sse_frame("rows", {"items": items, "timeline": delta, "total": message["total"]}, message["last_id"])
+    return frame, message["last_id"]
+
+
+@router.get("/{run_id}/events")
+async def live_events(
+    request: Request,
+    run_id: int,
+    by: str = "tf_req_id",
+    last_event_id: Optional[int] = Header(None, description="id последней полученной строки (переподключение EventSource)"),
+    db: Session = Depends(get_db),
+):
+    """Server-Sent Events: rows (новые строки + дельта таймлайна по ``by``), reset, done."""
+    if db.get(Run, run_id) is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if by not in tail.TIMELINE_BYS:
+        by = "tf_req_id"
+
+    async def stream():
+        # подписка до чтения состояния: строки, разобранные между ними, не потеряются
+        queue = events.subscribe(run_id)
+        try:
+            status, replay = await run_in_threadpool(tail.live_state, run_id, last_event_id)
+            if status is None:
+                return
+            yield b"retry: 3000\n\n"
+            sent = last_event_id or 0
+            if replay is not None:
+                frame, sent = _render(replay, by, sent)
+                if frame is not None:
+                    yield frame
+            if status != tail.LIVE_STATUS:
+                yield events.sse_frame("done", {"type": "done", "status": status})
+                return
+            deadline = time.monotonic() + STREAM_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    message = await asyncio.wait_for(queue.get(), min(KEEPALIVE_SECONDS, STREAM_SECONDS))
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield b": keepalive\n\n"
+                    continue
+                frame, sent = _render(message, by, sent)
+                if frame is not None:
+                    yield frame
+                if message["type"] == "done":
+                    return
+        finally:
+            events.unsubscribe(run_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
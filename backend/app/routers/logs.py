@@ -1,156 +1,92 @@
 from datetime import datetime
-from typing import Optional
+from typing import Literal
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import func
 
-from ..database import SessionLocal
-from ..models import LogEntry
-from ..schemas import LogsPage, LogEntryOut
+from .. import dictionary
+from ..archive import ensure_hydrated
+from ..cache import cached_response
+from ..counts import count_logs
+from ..database import get_db
+from ..filters import LogFilters, run_criteria
+from ..limits import heavy_slot
+from ..models import RUN_ID_SHIFT, LogEntry
+from ..pairs import PAIRS_BUDGET, PAIRS_PER_KEY, expand_pairs
+from ..listing import attach_json, rows_to_items, select_rows
+from ..schemas import LogEntryOut, LogsPage
 
 
 router = APIRouter(prefix="/logs", tags=["logs"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get("/", response_model=LogsPage)
 def list_logs(
+    request: Request,
     run_id: int,
     page: int = 1,
     page_size: int = 100,
     include_pairs: bool = False,
     pair_by: str = "tf_req_id",  # tf_req_id|resource|phase
-    tf_req_id: Optional[str] = None,
-    tf_resource_type: Optional[str] = None,
-    tf_resource_name: Optional[str] = None,
-    phase: Optional[str] = None,
-    level: Optional[str] = None,
-    status: Optional[str] = Query(None, description="error|ok|malformed"),
-    search: Optional[str] = None,
-    ts_from: Optional[datetime] = None,
-    ts_to: Optional[datetime] = None,
+    pairs_per_key: int = Query(PAIRS_PER_KEY, ge=1, le=1000),
+    pairs_budget: int = Query(PAIRS_BUDGET, ge=0, le=20000),
+    include_json: bool = Query(False, description="fill items[].json; otherwise fetch it via /logs/{id}"),
+    count: Literal["exact", "cached", "estimate"] = Query("exact", description="how total is computed"),
+    filters: LogFilters = Depends(),
     db: Session = Depends(get_db),
 ):
-    q = db.query(LogEntry).filter(LogEntry.run_id == run_id)
+    return cached_response(request, db, run_id, lambda: ORJSONResponse(_logs_page(
+        db, run_id, page, page_size, include_pairs, pair_by, pairs_per_key, pairs_budget, include_json, count, filters,
+    )))
 
-    if tf_req_id:
-        # Support partial matching for tf_req_id (e.g., '77' matches '778', '779', '776')
-        q = q.filter(LogEntry.tf_req_id.like(f"%{tf_req_id}%"))
-    if tf_resource_type:
-        # Support partial matching for tf_resource_type
-        q = q.filter(LogEntry.tf_resource_type.like(f"%{tf_resource_type}%"))
-    if tf_resource_name:
-        q = q.filter(LogEntry.tf_resource_name == tf_resource_name)
-    if phase:
-        q = q.filter(LogEntry.phase == phase)
-    if level:
-        q = q.filter(LogEntry.level == level)
-    if status == "error":
-        q = q.filter(LogEntry.is_error.is_(True))
-    elif status == "malformed":
-        q = q.filter(LogEntry.is_malformed.is_(True))
-    elif status == "ok":
-        q = q.filter(LogEntry.is_error.is_(False), LogEntry.is_malformed.is_(False))
-    if ts_from:
-        q = q.filter(LogEntry.timestamp >= ts_from)
-    if ts_to:
-        q = q.filter(LogEntry.timestamp <= ts_to)
-    if search:
-        like = f"%{search}%"
-        q = q.filter(or_(LogEntry.message.like(like), LogEntry.json_str.like(like)))
 
-    total = q.count()
-    base_items = (
-        q.order_by(LogEntry.timestamp.asc(), LogEntry.id.asc())
+def _logs_page(
+    db: Session,
+    run_id: int,
+    page: int,
+    page_size: int,
+    include_pairs: bool,
+    pair_by: str,
+    pairs_per_key: int,
+    pairs_budget: int,
+    include_json: bool,
+    count: str,
+    filters: LogFilters,
+) -> dict:
+    """LogsPage as plain dicts; serialized by orjson without per-row pydantic models."""
+    ensure_hydrated(db, run_id)
+    criteria = run_criteria(db, run_id, filters)
+
+    total, is_estimate = count_logs(db, run_id, criteria, filters, count)
+    base_rows = db.execute(
+        select_rows(*criteria)
+        .order_by(LogEntry.timestamp.asc(), LogEntry.id.asc())
         .offset((page - 1) * page_size)
         .limit(page_size)
-        .all()
-    )
-
-    extras_count = 0
-    items: list[LogEntryOut] = []
-
-    def to_out(e: LogEntry, is_extra: bool = False) -> LogEntryOut:
-        return LogEntryOut(
-            id=e.id,
-            run_id=e.run_id,
-            timestamp=e.timestamp,
-            level=e.level,
-            phase=e.phase,
-            tf_req_id=e.tf_req_id,
-            tf_resource_type=e.tf_resource_type,
-            tf_resource_name=e.tf_resource_name,
-            message=e.message,
-            is_error=e.is_error,
-            is_malformed=e.is_malformed,
-            data_json=e.json_str,
-            is_extra=is_extra,
-        )
+    ).all()
+    items = rows_to_items(db, base_rows)
 
     if not include_pairs:
-        return LogsPage(total=total, items=[to_out(i) for i in base_items], extras=0)
-
-    # Включаем пары по ключу (tf_req_id|resource|phase), чтобы показать запрос/ответ вместе
-    items.extend(to_out(i) for i in base_items)
-    base_ids = {e.id for e in base_items}
+        if include_json:
+            attach_json(db, items)
+        return {"total": total, "is_estimate": is_estimate, "items": items, "extras": 0, "truncated_keys": []}
 
-    if pair_by == "tf_req_id":
-        keys = {e.tf_req_id for e in base_items if e.tf_req_id}
-        if keys:
-            extra_q = (
-                db.query(LogEntry)
-                .filter(LogEntry.run_id == run_id)
-                .filter(LogEntry.tf_req_id.in_(keys))
-            )
-            extra_rows = extra_q.order_by(LogEntry.timestamp.asc(), LogEntry.id.asc()).limit(3000).all()
-    elif pair_by == "phase":
-        keys = {e.phase for e in base_items if e.phase}
-        if keys:
-            extra_q = (
-                db.query(LogEntry)
-                .filter(LogEntry.run_id == run_id)
-                .filter(LogEntry.phase.in_(keys))
-            )
-            extra_rows = extra_q.order_by(LogEntry.timestamp.asc(), LogEntry.id.asc()).limit(3000).all()
-    else:  # resource
-        res_keys = {(e.tf_resource_type or None, e.tf_resource_name or None) for e in base_items if (e.tf_resource_type or e.tf_resource_name)}
-        extra_rows = []
-        if res_keys:
-            # Грубая предфильтрация по типу/имени, затем точная в памяти
-            types = {t for t, _ in res_keys if t}
-            names = {n for _, n in res_keys if n}
-            extra_q = db.query(LogEntry).filter(LogEntry.run_id == run_id)
-            if types:
-                extra_q = extra_q.filter(LogEntry.tf_resource_type.in_(list(types)))
-            if names:
-                extra_q = extra_q.filter(LogEntry.tf_resource_name.in_(list(names)))
-            maybe_rows = extra_q.order_by(LogEntry.timestamp.asc(), LogEntry.id.asc()).limit(5000).all()
-            for e in maybe_rows:
-                key = (e.tf_resource_type or None, e.tf_resource_name or None)
-                if key in res_keys:
-                    extra_rows.append(e)
-
-    if 'extra_rows' in locals():
-        for e in extra_rows:
-            if e.id in base_ids:
-                continue
-            items.append(to_out(e, is_extra=True))
-            extras_count += 1
-        items.sort(key=lambda x: (x.timestamp or datetime.min, x.id))
+    # Включаем пары по ключу (tf_req_id|resource|phase), чтобы показать запрос/ответ вместе:
+    # по каждому ключу — ближайшие к окну страницы строки, с общим лимитом на ответ
+    extra_rows, truncated = expand_pairs(db, run_id, base_rows, pair_by, pairs_per_key, pairs_budget)
+    items.extend(rows_to_items(db, extra_rows, is_extra=True))
+    items.sort(key=lambda x: (x["timestamp"] or datetime.min, x["id"]))
+    if include_json:
+        attach_json(db, items)
 
-    return LogsPage(total=total, items=items, extras=extras_count)
+    return {"total": total, "is_estimate": is_estimate, "items": items, "extras": len(extra_rows), "truncated_keys": truncated}
 
 
-@router.get("/groups")
+@router.get("/groups", dependencies=[Depends(heavy_slot)])
 def get_groups(
+    request: Request,
     run_id: int,
     pair_by: str = "tf_req_id",  # tf_req_id|resource|phase
     db: Session = Depends(get_db),
@@ -158,94 +94,64 @@ def get_groups(
     """
     Получить все уникальные группы для файла запуска
     """
-    q = db.query(LogEntry).filter(LogEntry.run_id == run_id)
-    
+    return cached_response(request, db, run_id, lambda: ORJSONResponse(_groups(db, run_id, pair_by)))
+
+
+def _groups(db: Session, run_id: int, pair_by: str) -> dict:
+    ensure_hydrated(db, run_id)
+    # Один GROUP BY по целочисленным ключам словаря вместо отдельного COUNT на каждую группу
+    by_resource = pair_by not in ("tf_req_id", "phase")
     if pair_by == "tf_req_id":
-        # Получаем все уникальные tf_req_id
-        results = q.filter(LogEntry.tf_req_id.isnot(None)).with_entities(LogEntry.tf_req_id).distinct().all()
-        groups = [{
-            "key": r.tf_req_id,
-            "display_name": r.tf_req_id,
-            "type": "tf_req_id"
-        } for r in results if r.tf_req_id]
-        
-        # Проверяем, есть ли записи с null tf_req_id
-        null_count = q.filter(LogEntry.tf_req_id.is_(None)).count()
-        if null_count > 0:
-            groups.append({
-                "key": "(без tf_req_id)",
-                "display_name": "(без tf_req_id)",
-                "type": "tf_req_id",
-                "count": null_count
-            })
-        
+        group_cols = [LogEntry.tf_req_id_id]
     elif pair_by == "phase":
-        # Получаем все уникальные фазы
-        results = q.filter(LogEntry.phase.isnot(None)).with_entities(LogEntry.phase).distinct().all()
-        groups = [{
-            "key": r.phase,
-            "display_name": r.phase,
-            "type": "phase"
-        } for r in results if r.phase]
-        
-        # Проверяем, есть ли записи с null phase
-        null_count = q.filter(LogEntry.phase.is_(None)).count()
-        if null_count > 0:
-            groups.append({
-                "key": "(без phase)",
-                "display_name": "(без phase)",
-                "type": "phase",
-                "count": null_count
-            })
-        
+        group_cols = [LogEntry.phase_id]
     else:  # resource
-        # Получаем все уникальные комбинации ресурсов
-        results = q.filter(
-            or_(LogEntry.tf_resource_type.isnot(None), LogEntry.tf_resource_name.isnot(None))
-        ).with_entities(LogEntry.tf_resource_type, LogEntry.tf_resource_name).distinct().all()
-        
-        groups = []
-        for r in results:
-            key = f"{r.tf_resource_type or ''}:{r.tf_resource_name or ''}"
-            display_name = f"{r.tf_resource_type or '(нет типа)'} : {r.tf_resource_name or '(нет имени)'}"
+        group_cols = [LogEntry.tf_resource_type_id, LogEntry.tf_resource_name]
+
+    rows = (
+        db.query(*group_cols, func.count())
+        .filter(LogEntry.run_id == run_id)
+        .group_by(*group_cols)
+        .all()
+    )
+    names = dictionary.decode_ids(db, (r[0] for r in rows))
+
+    groups = []
+    null_count = 0
+    for r in rows:
+        if by_resource:
+            res_type, res_name, count = names.get(r[0]), r[1], r[2]
+            if not res_type and res_name is None:
+                null_count += count
+                continue
             groups.append({
-                "key": key,
-                "display_name": display_name,
-                "type": "resource"
+                "key": f"{res_type or ''}:{res_name or ''}",
+                "display_name": f"{res_type or '(нет типа)'} : {res_name or '(нет имени)'}",
+                "type": "resource",
+                "count": count,
             })
-            
-        # Проверяем, есть ли записи без resource информации
-        null_count = q.filter(
-            and_(LogEntry.tf_resource_type.is_(None), LogEntry.tf_resource_name.is_(None))
-        ).count()
-        if null_count > 0:
+        else:
+            value, count = names.get(r[0]), r[1]
+            if not value:
+                null_count += count
+                continue
             groups.append({
-                "key": "(без resource)",
-                "display_name": "(без resource)",
-                "type": "resource",
-                "count": null_count
+                "key": value,
+                "display_name": value,
+                "type": pair_by,
+                "count": count,
             })
-    
-    # Подсчитываем количество записей для каждой группы
-    for group in groups:
-        # Пропускаем, если count уже установлен (для специальных групп)
-        if "count" in group:
-            continue
-            
-        if pair_by == "tf_req_id":
-            count = q.filter(LogEntry.tf_req_id == group["key"]).count()
-        elif pair_by == "phase":
-            count = q.filter(LogEntry.phase == group["key"]).count()
-        else:  # resource
-            parts = group["key"].split(":", 1)
-            res_type = parts[0] if parts[0] else None
-            res_name = parts[1] if len(parts) > 1 and parts[1] else None
-            count = q.filter(
-                LogEntry.tf_resource_type == res_type,
-                LogEntry.tf_resource_name == res_name
-            ).count()
-        group["count"] = count
-    
+
+    # Записи без ключа группировки
+    if null_count > 0:
+        label = "(без resource)" if by_resource else f"(без {pair_by})"
+        groups.append({
+            "key": label,
+            "display_name": label,
+            "type": "resource" if by_resource else pair_by,
+            "count": null_count,
+        })
+
     # Сортируем по количеству записей (убывание)
     groups.sort(key=lambda x: x["count"], reverse=True)
     
@@ -257,3 +163,13 @@ def get_groups(
     }
 
 
+@router.get("/{entry_id:int}", response_model=LogEntryOut)
+def get_log_entry(entry_id: int, db: Session = Depends(get_db)):
+    """Одна строка лога вместе с полным JSON (в списке /logs он не передаётся)."""
+    ensure_hydrated(db, entry_id >> RUN_ID_SHIFT)
+    row = db.execute(select_rows(LogEntry.id == entry_id)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Log entry not found")
+    items = rows_to_items(db, [row])
+    attach_json(db, items)
+    return ORJSONResponse(items[0])
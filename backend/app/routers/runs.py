@@ -1,20 +1,23 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from ..database import SessionLocal
+from ..archive import ARCHIVE_AFTER_DAYS, archive_expired_runs, archive_run, ensure_hydrated
+from ..database import get_db
+from ..limits import heavy_slot
 from ..models import Run
+from ..pluginchain import plugin_state
+from ..reprocess import REPROCESS_STATUS, start_reprocess
+from ..rundiff import diff_runs
 from ..schemas import RunOut, RunsPage
+from ..services import drop_run
+from ..spans import ensure_span_index, has_span_index
+from ..templates import ensure_template_index, has_template_index
+from ..timeindex import ensure_timeline_index, has_timeline_index, run_error_count
 
 router = APIRouter(prefix="/runs", tags=["runs"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/", response_model=RunsPage)
 def list_runs(
     page: int = Query(1, ge=1, description="Page number"),
@@ -37,8 +40,94 @@ def list_runs(
         items=items
     )
 
+def _ensure_diff_indexes(db: Session, run_id: int) -> None:
+    # индексы хранятся и для архивных запусков, строки нужны только чтобы их построить
+    if not has_timeline_index(db, run_id):
+        ensure_hydrated(db, run_id)
+        ensure_timeline_index(db, run_id)
+    if not has_span_index(db, run_id):
+        ensure_hydrated(db, run_id)
+        ensure_span_index(db, run_id)
+    if not has_template_index(db, run_id) and run_error_count(db, run_id) != 0:
+        ensure_hydrated(db, run_id)
+        ensure_template_index(db, run_id)
+
+
+@router.get("/diff", dependencies=[Depends(heavy_slot)])
+def diff_two_runs(
+    base_run_id: int = Query(..., description="с чем сравнивать (например, последний удачный apply)"),
+    run_id: int = Query(..., description="сравниваемый запуск"),
+    min_delta_ms: int = Query(1000, ge=0, description="изменение длительности ресурса, которое считается изменением"),
+    limit: int = Query(200, ge=1, le=10000, description="элементов в каждом списке"),
+    db: Session = Depends(get_db),
+):
+    """Ресурсы (тип:имя) и фазы run_id против base_run_id: добавленные/удалённые/изменившиеся ресурсы
+    с разницей длительности, строк и ошибок, и новые (и исчезнувшие) шаблоны ошибок."""
+    for rid in (base_run_id, run_id):
+        if db.get(Run, rid) is None:
+            raise HTTPException(status_code=404, detail=f"Run {rid} not found")
+        _ensure_diff_indexes(db, rid)
+    return ORJSONResponse(diff_runs(db, base_run_id, run_id, min_delta_ms, limit))
+
+
+@router.get("/plugins")
+def runs_plugins(stale_only: bool = False, db: Session = Depends(get_db)):
+    """Текущая цепочка PLUGINS и цепочка, через которую прошли строки каждого запуска;
+    stale — цепочки различаются (запуск стоит перегнать через POST /runs/{run_id}/reprocess)."""
+    return plugin_state(db, stale_only)
+
+
+@router.post("/{run_id}/reprocess")
+async def reprocess_run_plugins(run_id: int, db: Session = Depends(get_db)):
+    """Прогнать строки запуска через текущие плагины без повторного разбора файла (фоновая задача
+    в слоте тяжёлых операций): пишутся только изменившиеся поля, индексы запуска пересобираются.
+    Прогресс — GET /jobs/{job_id}/events."""
+    run = db.get(Run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    job = start_reprocess(db, run_id)
+    if job is None:
+        db.refresh(run)
+        raise HTTPException(status_code=409, detail=f"Run {run_id} is {run.status}")
+    return job.snapshot()
+
+
 @router.post("/clear")
 def clear_runs(db: Session = Depends(get_db)):
-    db.query(Run).delete()
+    runs = db.query(Run).all()
+    busy = [run.id for run in runs if run.status == REPROCESS_STATUS]
+    if busy:
+        raise HTTPException(status_code=409, detail=f"Runs {busy} are {REPROCESS_STATUS}")
+    for run in runs:
+        drop_run(db, run)
     db.commit()
     return {"message": "All runs cleared"}
+
+@router.delete("/{run_id}")
+def delete_run(run_id: int, db: Session = Depends(get_db)):
+    run = db.get(Run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.status == REPROCESS_STATUS:
+        raise HTTPException(status_code=409, detail=f"Run {run_id} is {run.status}")
+    drop_run(db, run)
+    db.commit()
+    return {"message": f"Run {run_id} deleted"}
+
+@router.post("/archive")
+def archive_runs(
+    older_than_days: int = Query(ARCHIVE_AFTER_DAYS, ge=0, description="Archive parsed runs older than N days"),
+    run_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    if run_id is not None:
+        run = db.get(Run, run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="Run not found")
+        if not run.archived_path:
+            # как archive_expired_runs: в архив уходят только разобранные запуски
+            if run.status != "parsed" or archive_run(db, run) is None:
+                db.refresh(run)
+                raise HTTPException(status_code=409, detail=f"Run {run_id} is {run.status}")
+        return {"archived": [run.id]}
+    return {"archived": archive_expired_runs(db, older_than_days)}
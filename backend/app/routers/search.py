@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..exporter import session_chunks
+from ..filters import naive_utc
+from ..limits import limit_stream
+from ..search import SearchQuery, search_runs
+
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+
+@router.get("/")
+def search_all_runs(
+    resource: Optional[str] = Query(None, description="подстрока ресурса 'тип:имя'"),
+    tf_req_id: Optional[str] = Query(None, description="подстрока tf_req_id"),
+    error: Optional[str] = Query(None, description="подстрока шаблона ошибки (/errors/top)"),
+    text: Optional[str] = Query(None, description="подстрока строки лога — читается только в отобранных запусках"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=1000, description="сколько запусков вернуть"),
+    per_run: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """Поиск по всем запускам (новые первыми): какие запуски затрагивали ресурс, вызов или ошибку.
+    NDJSON: по строке {"type": "run", ...} на найденный запуск по мере поиска, в конце {"type": "done", ...}.
+    Условия объединяются через И."""
+    query = SearchQuery(resource, tf_req_id, error, text, naive_utc(since), naive_utc(until), limit, per_run)
+    if query.empty():
+        raise HTTPException(status_code=400, detail="Specify resource, tf_req_id, error or text")
+    chunks = session_chunks(lambda stream_db: (orjson.dumps(m) + b"\n" for m in search_runs(stream_db, query)))
+    return StreamingResponse(
+        limit_stream(chunks),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
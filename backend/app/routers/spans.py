@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import Session
+
+from ..archive import ensure_hydrated
+from ..cache import cached_response
+from ..database import get_db
+from ..filters import naive_utc
+from ..limits import heavy_slot
+from ..spans import SPAN_KINDS, SPAN_SORTS, ensure_span_index, has_span_index, query_spans
+
+
+router = APIRouter(prefix="/spans", tags=["spans"])
+
+
+@router.get("/", dependencies=[Depends(heavy_slot)])
+def list_spans(
+    request: Request,
+    run_id: int,
+    kind: str = Query("tf_req_id", description="tf_req_id — вызовы провайдера, resource — ресурсы (тип:имя)"),
+    sort: str = Query("duration", description="duration|errors|lines|start"),
+    order: str = Query("desc", description="asc|desc"),
+    q: Optional[str] = Query(None, description="подстрока ключа"),
+    tf_resource_type: Optional[str] = None,
+    min_duration_ms: Optional[int] = Query(None, ge=0),
+    errors_only: bool = False,
+    ts_from: Optional[datetime] = None,
+    ts_to: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """Вызовы (tf_req_id) или ресурсы запуска с длительностью, числом строк и ошибок —
+    из индекса, который ведётся при разборе. 20 самых долгих вызовов: ?run_id=1&sort=duration."""
+    if kind not in SPAN_KINDS:
+        kind = "tf_req_id"
+    if sort not in SPAN_SORTS:
+        sort = "duration"
+
+    def build():
+        # индекс хранится и для архивных запусков, строки нужны только чтобы его построить
+        if not has_span_index(db, run_id):
+            ensure_hydrated(db, run_id)
+            ensure_span_index(db, run_id)
+        items = query_spans(
+            db, run_id, kind, sort, order, q, tf_resource_type, min_duration_ms, errors_only,
+            naive_utc(ts_from), naive_utc(ts_to), limit, offset,
+        )
+        return ORJSONResponse({"items": items})
+
+    return cached_response(request, db, run_id, build)
@@ -1,73 +1,67 @@
 from datetime import datetime
-from typing import Optional, Dict, Tuple
+from typing import Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
-from ..database import SessionLocal
-from ..models import LogEntry
-from ..schemas import TimelineOut, TimelineItem
+from ..archive import ensure_hydrated
+from ..cache import cached_response
+from ..database import get_db
+from ..filters import LogFilters, naive_utc
+from ..limits import heavy_slot
+from ..schemas import TimelineOut
+from ..services import timeline_buckets
+from ..timeindex import TIMELINE_BYS, ensure_timeline_index, has_timeline_index, indexed_timeline, lod_timeline
 
 
 router = APIRouter(prefix="/timeline", tags=["timeline"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@router.get("/", response_model=TimelineOut, dependencies=[Depends(heavy_slot)])
+def build_timeline(request: Request, run_id: int, by: str = "tf_req_id", ts_from: Optional[datetime] = None, ts_to: Optional[datetime] = None, db: Session = Depends(get_db)):
+    return cached_response(request, db, run_id, lambda: ORJSONResponse(_timeline(db, run_id, by, ts_from, ts_to)))
 
 
-@router.get("/", response_model=TimelineOut)
-def build_timeline(run_id: int, by: str = "tf_req_id", ts_from: Optional[datetime] = None, ts_to: Optional[datetime] = None, db: Session = Depends(get_db)):
-    q = db.query(LogEntry).filter(LogEntry.run_id == run_id)
-    if ts_from:
-        q = q.filter(LogEntry.timestamp >= ts_from)
-    if ts_to:
-        q = q.filter(LogEntry.timestamp <= ts_to)
+def _ensure_index(db: Session, run_id: int) -> None:
+    # индекс хранится и для архивных запусков, строки нужны только чтобы его построить
+    if not has_timeline_index(db, run_id):
+        ensure_hydrated(db, run_id)
+        ensure_timeline_index(db, run_id)
 
-    def key_of(e: LogEntry) -> str:
-        if by == "tf_req_id":
-            if e.tf_req_id:
-                return e.tf_req_id
-            # If no tf_req_id, try to use resource type or phase as fallback
-            if e.tf_resource_type:
-                return f"resource:{e.tf_resource_type}"
-            if e.phase:
-                return f"phase:{e.phase}"
-            if e.level:
-                return f"level:{e.level}"
-            return "general"
-        if by == "resource":
-            return f"{e.tf_resource_type or 'unknown_type'}:{e.tf_resource_name or 'unknown_name'}"
-        return e.phase or "unknown_phase"
 
-    buckets: Dict[str, Tuple[Optional[datetime], Optional[datetime], int, int, int]] = {}
-    for e in q:
-        key = key_of(e)
-        start, end, count, errors, malformed = buckets.get(key, (None, None, 0, 0, 0))
-        ts = e.timestamp
-        if ts is not None:
-            start = ts if start is None else min(start, ts)
-            end = ts if end is None else max(end, ts)
-        count += 1
-        if e.is_error:
-            errors += 1
-        if e.is_malformed:
-            malformed += 1
-        buckets[key] = (start, end, count, errors, malformed)
+def _timeline(db: Session, run_id: int, by: str, ts_from: Optional[datetime], ts_to: Optional[datetime]) -> dict:
+    """TimelineOut as plain dicts (orjson, no per-item pydantic models)."""
+    if ts_from is None and ts_to is None and by in TIMELINE_BYS:
+        # весь запуск — готовые полосы из индекса хронологии
+        _ensure_index(db, run_id)
+        return {"items": indexed_timeline(db, run_id, by)}
+    ensure_hydrated(db, run_id)
+    items = [
+        {"key": key, "start": start, "end": end, "count": count, "errors": errors, "malformed": malformed}
+        for key, start, end, count, errors, malformed in timeline_buckets(db, run_id, by, LogFilters(ts_from=ts_from, ts_to=ts_to))
+    ]
+    return {"items": items}
 
-    items = []
-    for key, (start, end, count, errors, malformed) in buckets.items():
-        if start is None:
-            continue
-        if end is None:
-            end = start
-        items.append(TimelineItem(key=key, start=start, end=end, count=count, errors=errors, malformed=malformed))
 
-    # Timeline data ready for return
-    items.sort(key=lambda i: (i.start, i.key))
-    return TimelineOut(items=items)
+@router.get("/lod", dependencies=[Depends(heavy_slot)])
+def zoom_timeline(
+    request: Request,
+    run_id: int,
+    by: str = "tf_req_id",
+    ts_from: Optional[datetime] = None,
+    ts_to: Optional[datetime] = None,
+    buckets: int = Query(200, ge=1, le=5000, description="бюджет интервалов плотности (≈ ширина в пикселях / 4)"),
+    top: int = Query(100, ge=0, le=2000, description="сколько полос окна вернуть"),
+    db: Session = Depends(get_db),
+):
+    """Масштабируемая хронология окна [ts_from, ts_to] (по умолчанию — весь запуск):
+    buckets — плотность строк/ошибок, items — top полос окна (сначала с ошибками, затем по числу строк)."""
+    if by not in TIMELINE_BYS:
+        by = "phase"
+
+    def build():
+        _ensure_index(db, run_id)
+        return ORJSONResponse(lod_timeline(db, run_id, by, naive_utc(ts_from), naive_utc(ts_to), buckets, top))
+
+    return cached_response(request, db, run_id, build)
@@ -1,4 +1,6 @@
+import logging
 from pathlib import Path
+from typing import Optional
 import os
 import fnmatch
 from fastapi import APIRouter, UploadFile, File, HTTPException, Body
@@ -6,52 +8,77 @@ from sqlalchemy.orm import Session
 from fastapi import Depends
 import shutil
 
-from ..database import SessionLocal
+from .. import jobs
+from ..database import DB_DIR, get_db
+from ..importer import IMPORT_EXTENSIONS
+from ..limits import run_heavy
 from ..models import Run
 from ..services import process_uploaded_file
 
 router = APIRouter(prefix="/uploads", tags=["uploads"])
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR") or DB_DIR / "uploads")
+UPLOAD_IMPORT_DIR = DB_DIR / "imports"
+
+
+def _ingest_job(job_id: Optional[str], kind: str) -> jobs.IngestJob:
+    # job_id выбирает клиент, чтобы подписаться на GET /jobs/{job_id}/events до отправки файла
+    if job_id and not jobs.JOB_ID_RE.match(job_id):
+        raise HTTPException(status_code=400, detail="job_id must match [A-Za-z0-9_-]{1,64}")
+    job = jobs.get_or_create(job_id, kind)
+    if job is None:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is still running")
+    return job
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.post("/file")
-async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    print("upload_file function called")
-    storage_dir = Path(__file__).resolve().parent.parent.parent / "storage" / "uploads"
-    storage_dir.mkdir(parents=True, exist_ok=True)
-    dest = storage_dir / file.filename
+async def upload_file(file: UploadFile = File(...), job_id: Optional[str] = None, db: Session = Depends(get_db)):
+    job = _ingest_job(job_id, "upload")
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    dest = UPLOAD_DIR / file.filename
 
     # Save the file to the destination path
     with dest.open("wb") as buffer:
-        buffer.write(await file.read())
+        size = buffer.write(await file.read())
 
     # Debug: Log the file path
-    print(f"File saved to: {dest}")
+    logger.debug("File saved to: %s", dest)
 
     run = Run(filename=file.filename, stored_path=str(dest))
     db.add(run)
     db.commit()
     db.refresh(run)
 
-    # parse immediately (synchronous to meet 2-3 min constraint and simplicity)
-    process_uploaded_file(db, run)
+    job.set_status("running")
+    job.set_file(file.filename, size=size, bytes_done=0, status="parsing", run_id=run.id)
+    # parse immediately (synchronous to meet 2-3 min constraint and simplicity);
+    # в пуле потоков, чтобы разбор не останавливал event loop для остальных запросов
+    try:
+        await run_heavy(process_uploaded_file, db, run, job.file_progress(file.filename))
+    except Exception as exc:
+        job.set_file(file.filename, status="error", error=str(exc))
+        job.finish("error", str(exc))
+        raise
+    job.set_file(file.filename, status="done" if run.status == "parsed" else "error", bytes_done=size, summary=run.summary)
+    job.finish("done")
 
-    return {"run_id": run.id, "filename": run.filename, "status": run.status, "summary": run.summary}
+    return {"run_id": run.id, "filename": run.filename, "status": run.status, "summary": run.summary, "job_id": job.id}
 
 @router.post("/import")
 async def import_directory(
     files: list[UploadFile] = File(...), 
+    job_id: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    storage_dir = Path(__file__).resolve().parent.parent.parent / "storage" / "imports"
+    storage_dir = UPLOAD_IMPORT_DIR
     storage_dir.mkdir(parents=True, exist_ok=True)
+    job = _ingest_job(job_id, "import")
+    # тело запроса уже принято целиком: размеры всех файлов известны до разбора
+    for uploaded_file in files:
+        job.set_file(uploaded_file.filename, size=uploaded_file.size or 0, bytes_done=0, status="queued")
+    job.set_status("running")
     
-    exts = {".log", ".txt", ".jsonl", ".json"}
     results = []
     ok_count = 0
     err_count = 0
@@ -60,7 +87,8 @@ async def import_directory(
         try:
             # Проверяем расширение файла
             file_ext = Path(uploaded_file.filename).suffix.lower()
-            if file_ext not in exts:
+            if file_ext not in IMPORT_EXTENSIONS:
+                job.set_file(uploaded_file.filename, status="error", error=f"Неподдерживаемое расширение файла: {file_ext}")
                 results.append({
                     "filename": uploaded_file.filename,
                     "run_id": None,
@@ -84,7 +112,12 @@ async def import_directory(
             db.refresh(run)
             
             # Обрабатываем файл
-            process_uploaded_file(db, run)
+            job.set_file(uploaded_file.filename, status="parsing", run_id=run.id)
+            await run_heavy(process_uploaded_file, db, run, job.file_progress(uploaded_file.filename))
+            job.set_file(
+                uploaded_file.filename, status="done" if run.status == "parsed" else "error",
+                bytes_done=len(content), summary=run.summary,
+            )
             
             results.append({
                 "filename": run.filename,
@@ -97,6 +130,7 @@ async def import_directory(
             
         except Exception as exc:
             db.rollback()
+            job.set_file(uploaded_file.filename, status="error", error=str(exc))
             results.append({
                 "filename": uploaded_file.filename,
                 "run_id": None,
@@ -106,7 +140,9 @@ async def import_directory(
             })
             err_count += 1
 
+    job.finish("done")
     return {
+        "job_id": job.id,
         "import_dir": str(storage_dir),
         "count": len(results),
         "ok": ok_count,
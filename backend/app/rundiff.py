@@ -0,0 +1,146 @@
+import heapq
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models import ErrorTemplate, Span, TimelineSpan
+from .spans import from_ms, to_ms
+from .templates import Drain
+from .timeindex import timeline_key
+
+
+# Сравнение двух запусков (упавший apply против последнего удачного): ресурсы и фазы сопоставляются
+# по ключам /timeline (by=resource — "тип:имя", by=phase). Наборы ключей посчитаны при разборе
+# (spans — ресурсы с мс-границами, timeline_spans — фазы), читаются по индексу целиком
+# и соединяются словарями — без GROUP BY по строкам. Шаблоны ошибок сопоставляются через Drain:
+# шаблон второго запуска, не похожий ни на один шаблон первого, — новая ошибка.
+Side = Tuple[Optional[int], Optional[int], int, int]  # start_ms, end_ms, lines, errors
+EMPTY: Side = (None, None, 0, 0)
+
+
+def _resources(db: Session, run_id: int) -> Dict[str, Side]:
+    # Core-запрос мимо ORM: на 100k ресурсов построчная загрузка ORM дороже самого чтения
+    rows = db.connection().execute(
+        select(Span.tf_resource_type, Span.tf_resource_name, Span.start_ms, Span.end_ms, Span.lines, Span.errors)
+        .where(Span.run_id == run_id, Span.kind == "resource")
+        .order_by(Span.key)  # по первичному ключу: строки лежат в том же порядке (spans.flush)
+    ).all()
+    return {
+        timeline_key("resource", None, res_type, res_name, None, None): (start, end, lines, errors)
+        for res_type, res_name, start, end, lines, errors in rows
+    }
+
+
+def _phases(db: Session, run_id: int) -> Dict[str, Side]:
+    rows = db.execute(
+        select(TimelineSpan.key, TimelineSpan.start, TimelineSpan.end, TimelineSpan.count, TimelineSpan.errors)
+        .where(TimelineSpan.run_id == run_id, TimelineSpan.kind == "phase")
+    ).all()
+    return {
+        key: (None if start is None else to_ms(start), None if end is None else to_ms(end), count, errors)
+        for key, start, end, count, errors in rows
+    }
+
+
+def _duration_ms(side: Side) -> Optional[int]:
+    return None if side[0] is None else side[1] - side[0]
+
+
+def _side(side: Side) -> Dict[str, Any]:
+    start, end, lines, errors = side
+    return {"start": from_ms(start), "end": from_ms(end), "duration_ms": _duration_ms(side), "lines": lines, "errors": errors}
+
+
+def _delta(base: Side, other: Side) -> Optional[int]:
+    base_ms, other_ms = _duration_ms(base), _duration_ms(other)
+    return None if base_ms is None or other_ms is None else other_ms - base_ms
+
+
+def _pair(key: str, base: Side, other: Side) -> Dict[str, Any]:
+    return {
+        "key": key,
+        "base": _side(base),
+        "run": _side(other),
+        "duration_delta_ms": _delta(base, other),
+        "lines_delta": other[2] - base[2],
+        "errors_delta": other[3] - base[3],
+    }
+
+
+def diff_keys(base: Dict[str, Side], other: Dict[str, Side], min_delta_ms: int, limit: int) -> Dict[str, Any]:
+    """Added / removed / changed keys of two key sets; a common key changed if its errors or line
+    count differ or its duration moved by at least ``min_delta_ms``. Lists keep the top ``limit``."""
+    added = [k for k in other if k not in base]
+    removed = [k for k in base if k not in other]
+    changed: List[Tuple[str, Side, Side, Optional[int]]] = []
+    for key, b in base.items():
+        o = other.get(key)
+        if o is None:
+            continue
+        delta = _delta(b, o)
+        if o[3] != b[3] or o[2] != b[2] or (delta is not None and abs(delta) >= min_delta_ms):
+            changed.append((key, b, o, delta))
+    unchanged = len(base) - len(removed) - len(changed)
+    # сначала ошибки, затем самые долгие / самые заметно изменившиеся
+    top_added = heapq.nsmallest(limit, added, key=lambda k: (-other[k][3], -(_duration_ms(other[k]) or 0), k))
+    top_removed = heapq.nsmallest(limit, removed, key=lambda k: (-base[k][3], -(_duration_ms(base[k]) or 0), k))
+    top_changed = heapq.nsmallest(limit, changed, key=lambda c: (-abs(c[2][3] - c[1][3]), -abs(c[3] or 0), c[0]))
+    return {
+        "counts": {"added": len(added), "removed": len(removed), "changed": len(changed), "unchanged": unchanged},
+        "added": [{"key": k, **_side(other[k])} for k in top_added],
+        "removed": [{"key": k, **_side(base[k])} for k in top_removed],
+        "changed": [_pair(key, b, o) for key, b, o, _delta_ms in top_changed],
+        "truncated": max(len(added), len(removed), len(changed)) > limit,
+    }
+
+
+def _templates(db: Session, run_id: int) -> List[Tuple]:
+    return db.execute(
+        select(ErrorTemplate.template_id, ErrorTemplate.template, ErrorTemplate.count,
+               ErrorTemplate.first_seen, ErrorTemplate.first_entry_id)
+        .where(ErrorTemplate.run_id == run_id)
+        .order_by(ErrorTemplate.count.desc(), ErrorTemplate.template_id)
+    ).all()
+
+
+def diff_templates(db: Session, base_run_id: int, run_id: int, limit: int) -> Dict[str, Any]:
+    """Error templates of ``run_id`` unlike any template of the base run (new) and the reverse (resolved)."""
+    base, other = _templates(db, base_run_id), _templates(db, run_id)
+    base_drain, other_drain = Drain(), Drain()
+    for template_id, template, *_ in base:
+        base_drain.load(template_id, template)
+    for template_id, template, *_ in other:
+        other_drain.load(template_id, template)
+
+    def item(row) -> Dict[str, Any]:
+        template_id, template, count, first_seen, first_entry_id = row
+        return {"template_id": template_id, "template": template, "count": count,
+                "first_seen": first_seen, "first_entry_id": first_entry_id}
+
+    new = [item(r) for r in other if base_drain.match(r[1].split()) is None]
+    resolved = [item(r) for r in base if other_drain.match(r[1].split()) is None]
+    return {
+        "counts": {"new": len(new), "resolved": len(resolved), "base": len(base), "run": len(other)},
+        "new": new[:limit],
+        "resolved": resolved[:limit],
+    }
+
+
+def diff_runs(db: Session, base_run_id: int, run_id: int, min_delta_ms: int = 1000, limit: int = 200) -> Dict[str, Any]:
+    """/runs/diff: the run against the base run; span, timeline and template indexes must exist."""
+    base_phases, phases = _phases(db, base_run_id), _phases(db, run_id)
+    phase_items = [
+        {**_pair(k, base_phases.get(k, EMPTY), phases.get(k, EMPTY)),
+         "status": "added" if k not in base_phases else "removed" if k not in phases else "common"}
+        for k in set(base_phases) | set(phases)
+    ]
+    # фаз немного — все, в порядке начала
+    phase_items.sort(key=lambda i: (i["base"]["start"] or i["run"]["start"] or from_ms(2 ** 46), i["key"]))
+    return {
+        "base_run_id": base_run_id,
+        "run_id": run_id,
+        "resources": diff_keys(_resources(db, base_run_id), _resources(db, run_id), min_delta_ms, limit),
+        "phases": phase_items,
+        "errors": diff_templates(db, base_run_id, run_id, limit),
+    }
@@ -35,8 +35,10 @@ class LogEntryOut(BaseModel):
 
 class LogsPage(BaseModel):
     total: int
+    is_estimate: bool = False  # total посчитан приближённо (count=estimate)
     items: List[LogEntryOut]
     extras: int = 0
+    truncated_keys: List[str] = []  # ключи include_pairs, по которым показаны не все пары
 
 
 class TimelineItem(BaseModel):
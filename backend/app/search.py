@@ -0,0 +1,161 @@
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .filters import LogFilters, run_criteria
+from .models import ErrorTemplate, LogEntry, Run, Span
+from .searchindex import ensure_search_keys, runs_with_key
+from .spans import ensure_span_index, from_ms, has_span_index
+from .templates import ensure_template_index, has_template_index
+from .timeindex import run_error_count
+
+
+# Поиск по всем запускам: сначала запуски отсекаются по инвертированному индексу ключей
+# (searchindex: ресурсы и tf_req_id из spans, шаблоны ошибок; фрагмент ищется по триграммам),
+# затем в оставшихся читаются совпадения. Свободный текст (text) в индекс не входит: запрос только
+# по тексту проверяет запуски по очереди, новые первыми, пока не наберётся limit.
+# Результаты отдаются построчно (NDJSON) по мере нахождения.
+SPAN_CRITERIA = {"resource": "resource", "tf_req_id": "tf_req_id"}  # параметр -> Span.kind
+
+
+class SearchQuery:
+    def __init__(
+        self,
+        resource: Optional[str] = None,
+        tf_req_id: Optional[str] = None,
+        error: Optional[str] = None,
+        text: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = 50,
+        per_run: int = 20,
+    ) -> None:
+        self.resource = resource
+        self.tf_req_id = tf_req_id
+        self.error = error
+        self.text = text
+        self.since = since
+        self.until = until
+        self.limit = limit  # запусков в ответе
+        self.per_run = per_run  # совпадений каждого вида на запуск
+
+    def empty(self) -> bool:
+        return not (self.resource or self.tf_req_id or self.error or self.text)
+
+    def span_criteria(self) -> Dict[str, str]:
+        """Span.kind -> key fragment."""
+        return {kind: getattr(self, param) for param, kind in SPAN_CRITERIA.items() if getattr(self, param)}
+
+
+def _span_matches(db: Session, run_id: int, kind: str, fragment: str, limit: int) -> List[Dict[str, Any]]:
+    rows = db.execute(
+        select(Span.key, Span.start_ms, Span.end_ms, Span.duration_ms, Span.lines, Span.errors, Span.first_error_id)
+        .where(Span.run_id == run_id, Span.kind == kind, Span.key.contains(fragment, autoescape=True))
+        .order_by(Span.errors.desc(), Span.lines.desc(), Span.key)
+        .limit(limit)
+    ).all()
+    return [
+        {"key": key, "start": from_ms(start), "end": from_ms(end), "duration_ms": duration,
+         "lines": lines, "errors": errors, "first_error_id": error_id}
+        for key, start, end, duration, lines, errors, error_id in rows
+    ]
+
+
+def _template_matches(db: Session, run_id: int, fragment: str, limit: int) -> List[Dict[str, Any]]:
+    rows = db.execute(
+        select(ErrorTemplate.template_id, ErrorTemplate.template, ErrorTemplate.count,
+               ErrorTemplate.first_seen, ErrorTemplate.first_entry_id)
+        .where(ErrorTemplate.run_id == run_id, ErrorTemplate.template.contains(fragment, autoescape=True))
+        .order_by(ErrorTemplate.count.desc(), ErrorTemplate.template_id)
+        .limit(limit)
+    ).all()
+    return [
+        {"template_id": template_id, "template": template, "count": count, "first_seen": first, "first_entry_id": entry_id}
+        for template_id, template, count, first, entry_id in rows
+    ]
+
+
+def _text_matches(db: Session, run_id: int, text: str, limit: int) -> List[Dict[str, Any]]:
+    rows = db.execute(
+        select(LogEntry.id, LogEntry.timestamp, LogEntry.message)
+        .where(*run_criteria(db, run_id, LogFilters(search=text)))
+        .order_by(LogEntry.id)
+        .limit(limit)
+    ).all()
+    return [{"id": entry_id, "timestamp": ts, "message": message} for entry_id, ts, message in rows]
+
+
+def _indexed(db: Session, run_id: int, query: SearchQuery) -> bool:
+    """Whether the summaries the query needs exist for the run (a run without errors needs no templates)."""
+    if query.span_criteria() and not has_span_index(db, run_id):
+        return False
+    if query.error and not has_template_index(db, run_id) and run_error_count(db, run_id) != 0:
+        return False
+    return True
+
+
+def search_runs(db: Session, query: SearchQuery) -> Iterator[Dict[str, Any]]:
+    """Messages of a cross-run search: {"type": "run", ...} per matching run, then {"type": "done", ...}."""
+    started = time.perf_counter()
+    stmt = select(Run.id, Run.filename, Run.created_at, Run.status, Run.archived_path).order_by(Run.created_at.desc(), Run.id.desc())
+    if query.since is not None:
+        stmt = stmt.where(Run.created_at >= query.since)
+    if query.until is not None:
+        stmt = stmt.where(Run.created_at <= query.until)
+    runs = db.execute(stmt).all()
+
+    # отсечение по индексу ключей: запуски, где встречается каждый ключ запроса
+    keyed = dict(query.span_criteria())
+    if query.error:
+        keyed["error"] = query.error
+    indexed = {run.id for run in runs if _indexed(db, run.id, query)}
+    found = []
+    if keyed:
+        ensure_search_keys(db, [run.id for run in runs if run.id in indexed])
+        found = [runs_with_key(db, kind, fragment) for kind, fragment in keyed.items()]
+
+    matched = pruned = 0
+    skipped: List[int] = []
+    for run in runs:
+        if matched >= query.limit:
+            break
+        if run.id not in indexed:
+            # запуск разобран до появления сводок: строятся сейчас (архив ради поиска не восстанавливается),
+            # совпадения проверяются запросами по самому запуску
+            if run.archived_path:
+                skipped.append(run.id)
+                continue
+            if query.span_criteria():
+                ensure_span_index(db, run.id)
+            if query.error:
+                ensure_template_index(db, run.id)
+        elif not all(run.id in ids for ids in found):
+            pruned += 1
+            continue
+        if query.text and run.archived_path:
+            skipped.append(run.id)
+            continue
+
+        matches: Dict[str, Any] = {}
+        for kind, fragment in query.span_criteria().items():
+            matches[kind] = _span_matches(db, run.id, kind, fragment, query.per_run)
+        if query.error:
+            matches["error"] = _template_matches(db, run.id, query.error, query.per_run)
+        if query.text:
+            matches["text"] = _text_matches(db, run.id, query.text, query.per_run)
+        if not all(matches.values()):
+            pruned += 1
+            continue
+        matched += 1
+        yield {
+            "type": "run", "run_id": run.id, "filename": run.filename, "created_at": run.created_at,
+            "status": run.status, "matches": matches,
+        }
+
+    yield {
+        "type": "done", "runs": len(runs), "matched": matched, "pruned": pruned, "skipped": skipped,
+        "truncated": matched >= query.limit, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
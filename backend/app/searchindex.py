@@ -0,0 +1,83 @@
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import column, delete, select, table
+from sqlalchemy.orm import Session
+
+from .models import SEARCH_KEYS_FTS, ErrorTemplate, RunSearchKey, SearchIndexRun, SearchKey, Span
+from .storage import insert_ignore, insert_ignore_tuples, is_postgres
+
+
+# Инвертированный индекс для поиска по всем запускам (/search): словарь ключей search_keys
+# (ресурсы "тип:имя", tf_req_id — из spans, шаблоны ошибок — из error_templates) и run_search_keys
+# "ключ -> запуски". Фрагмент ключа раскрывается в id словаря по триграммам (FTS5 в SQLite,
+# pg_trgm в PostgreSQL), затем запуски берутся по id — без обхода spans и шаблонов всех запусков.
+# Ключи запуска заносятся при первом поиске после построения или изменения его индексов
+# (отметка search_index_runs снимается в SpanIndexer.flush / TemplateMiner.flush); ключи, которых
+# в запуске больше нет (шаблон обобщился при дозаписи), остаются — отсечение идёт с запасом,
+# совпадения всё равно проверяются по самому запуску.
+SEARCH_KINDS = ("resource", "tf_req_id", "error")
+MIN_GRAM_FRAGMENT = 3  # короче — триграммный индекс не помогает, перебираем словарь
+ENCODE_CHUNK = 500
+
+_fts = table(SEARCH_KEYS_FTS, column("rowid"), column("value"), column("kind"))
+
+
+def _run_keys(db: Session, run_id: int) -> Set[Tuple[str, str]]:
+    keys = set(db.execute(select(Span.kind, Span.key).where(Span.run_id == run_id)).tuples())
+    keys.update(("error", t) for t in db.execute(select(ErrorTemplate.template).where(ErrorTemplate.run_id == run_id)).scalars())
+    return keys
+
+
+def _encode(db: Session, keys: Set[Tuple[str, str]]) -> List[int]:
+    ids: List[int] = []
+    by_kind: Dict[str, List[str]] = {}
+    for kind, value in keys:
+        by_kind.setdefault(kind, []).append(value)
+    for kind, values in by_kind.items():
+        for i in range(0, len(values), ENCODE_CHUNK):
+            part = values[i : i + ENCODE_CHUNK]
+            # ON CONFLICT DO NOTHING: ключ мог добавить другой запуск или другая реплика
+            db.execute(insert_ignore(db, SearchKey), [{"kind": kind, "value": v} for v in part])
+            ids.extend(db.execute(
+                select(SearchKey.id).where(SearchKey.kind == kind, SearchKey.value.in_(part))
+            ).scalars())
+    return ids
+
+
+def ensure_search_keys(db: Session, run_ids: Iterable[int]) -> None:
+    """Enter the span and template keys of runs not yet in the index (their span index must exist)."""
+    run_ids = list(run_ids)
+    done: Set[int] = set()
+    for i in range(0, len(run_ids), ENCODE_CHUNK):
+        part = run_ids[i : i + ENCODE_CHUNK]
+        done.update(db.execute(select(SearchIndexRun.run_id).where(SearchIndexRun.run_id.in_(part))).scalars())
+    for run_id in run_ids:
+        if run_id in done:
+            continue
+        key_ids = _encode(db, _run_keys(db, run_id))
+        insert_ignore_tuples(db, RunSearchKey.__table__, ["key_id", "run_id"], [(key_id, run_id) for key_id in key_ids])
+        db.execute(insert_ignore(db, SearchIndexRun).values(run_id=run_id))
+        db.commit()
+
+
+def runs_with_key(db: Session, kind: str, fragment: str) -> Set[int]:
+    """Runs with a ``kind`` key containing ``fragment`` (LIKE '%fragment%', a superset for '%' and '_')."""
+    pattern = f"%{fragment}%"
+    if len(fragment) >= MIN_GRAM_FRAGMENT and not is_postgres(db):
+        # FTS5 trigram отвечает на LIKE по индексу
+        key_ids = select(_fts.c.rowid).where(_fts.c.value.like(pattern), _fts.c.kind == kind)
+    else:
+        # PostgreSQL: LIKE по ix_search_keys_value_trgm
+        key_ids = select(SearchKey.id).where(SearchKey.kind == kind, SearchKey.value.like(pattern))
+    stmt = select(RunSearchKey.run_id).where(RunSearchKey.key_id.in_(key_ids)).distinct()
+    return set(db.execute(stmt).scalars())
+
+
+def invalidate_search_keys(db: Session, run_id: int) -> None:
+    """The run's spans or templates changed: its keys are entered again on the next search."""
+    db.execute(delete(SearchIndexRun).where(SearchIndexRun.run_id == run_id))
+
+
+def drop_search_keys(db: Session, run_id: int) -> None:
+    invalidate_search_keys(db, run_id)
+    db.execute(delete(RunSearchKey).where(RunSearchKey.run_id == run_id))
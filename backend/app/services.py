@@ -1,21 +1,88 @@
+import logging
+from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any, Iterable
+from typing import Callable, Optional, Dict, Any, Iterable, List, Set, Tuple
+from sqlalchemy import case, delete, func, select, update
 from sqlalchemy.orm import Session
 
-from .models import Run, LogEntry
+from . import dictionary
+from .cache import bump_run_version, invalidate_run
+from .filters import LogFilters, run_criteria
+from .keyindex import add_run_keys, batch_keys, drop_run_keys
+from .models import ImportedFile, IngestCheckpoint, Run, LogEntry, RunVersion, run_id_range
 from .parser import iter_parse_jsonl, normalize_entry
+from .pluginchain import apply_plugins, drop_run_plugins, record_plugins
+from .searchindex import drop_search_keys
+from .spans import SpanIndexer, drop_span_index, has_span_index
+from .storage import bulk_insert_entries, drop_run_rows, prepare_run_partition
+from .templates import TemplateMiner, drop_template_index, has_template_index
+from .timeindex import TimelineIndexer, drop_timeline_index, has_timeline_index, timeline_key
 from ..plugins.registry import get_registered_plugins
 
+logger = logging.getLogger(__name__)
 
-def process_uploaded_file(db: Session, run: Run) -> None:
-    path = Path(run.stored_path)
-    if not path.exists():
-        run.status = "error"
-        run.summary = "stored file missing"
-        db.add(run)
-        db.commit()
-        return
 
+def drop_run(db: Session, run: Run) -> None:
+    """Delete a run with bulk statements instead of the ORM cascade."""
+    drop_run_rows(db, run.id, drop_partition=True)
+    drop_run_keys(db, run.id)
+    drop_timeline_index(db, run.id)
+    drop_span_index(db, run.id)
+    drop_template_index(db, run.id)
+    drop_search_keys(db, run.id)
+    drop_run_plugins(db, run.id)
+    db.execute(delete(IngestCheckpoint).where(IngestCheckpoint.run_id == run.id))
+    db.execute(delete(RunVersion).where(RunVersion.run_id == run.id))
+    db.execute(update(ImportedFile).where(ImportedFile.run_id == run.id).values(run_id=None))
+    db.execute(delete(Run).where(Run.id == run.id))
+    if run.archived_path:
+        Path(run.archived_path).unlink(missing_ok=True)
+    invalidate_run(run.id)
+
+
+def next_entry_id(db: Session, run_id: int) -> int:
+    lo, hi = run_id_range(run_id)
+    last = db.execute(select(func.max(LogEntry.id)).where(LogEntry.id.between(lo, hi))).scalar()
+    return (last or lo) + 1
+
+
+def compact_text_fields(data: Dict[str, Any], parsed_json: Optional[str]) -> None:
+    """Drop json_str and message from a normalized row when they can be derived from raw.
+
+    ``parsed_json`` is the json_str normalize_entry gave the row (None if the line did not parse):
+    while json_str is still that text it is not stored and reads back as listing.json_text(raw).
+    """
+    raw = data["raw"]
+    json_str = data.pop("json_str", None)
+    # сравнение строк, без повторного разбора JSON: строка без плагинов — тот же объект str
+    if parsed_json is not None and json_str == parsed_json:
+        json_str = None
+    data["json_extra"] = json_str
+
+    message = data.pop("message", None) or raw
+    offset = raw.find(message)
+    if offset >= 0:
+        data["message_text"] = None
+        data["message_offset"] = offset
+        data["message_len"] = len(message)
+    else:
+        data["message_text"] = message
+        data["message_offset"] = None
+        data["message_len"] = None
+
+
+BatchHook = Callable[[int, Dict[str, float]], None]
+
+
+def ingest_rows(
+    db: Session, run: Run, rows: Iterable[Dict[str, Any]], on_batch: Optional[BatchHook] = None
+) -> Tuple[int, int, Set[str]]:
+    """Append normalized rows (parser.normalize_entry) to the run: plugins, dictionary, key index, bulk insert.
+
+    Returns (lines, malformed, phases); the caller commits (on PostgreSQL a new run's partition is
+    created beforehand on a connection of its own). ``on_batch(lines, plugin_seconds)`` is called after every
+    flushed batch (progress of ingest jobs).
+    """
     total = 0
     errors = 0
     phases = set()
@@ -23,42 +90,178 @@ def process_uploaded_file(db: Session, run: Run) -> None:
     plugins = get_registered_plugins()
     batch = []
     BATCH_SIZE = 500
+    prepare_run_partition(db, run.id)
+    entry_id = next_entry_id(db, run.id)
+    seen_keys = set()  # (kind, value), уже записанные в run_keys
+    # индексы хронологии, вызовов и шаблонов ошибок ведутся, если они полны: запуск новый или уже проиндексирован
+    lo, _hi = run_id_range(run.id)
+    fresh = entry_id == lo + 1
+    timeline = TimelineIndexer(run.id, fresh) if fresh or has_timeline_index(db, run.id) else None
+    spans = SpanIndexer(run.id, fresh) if fresh or has_span_index(db, run.id) else None
+    if fresh:
+        templates = TemplateMiner(run.id, fresh=True)
+    else:
+        templates = TemplateMiner.load(db, run.id) if has_template_index(db, run.id) else None
+    failed_plugins = set()
 
     def flush_batch():
-        nonlocal batch, errors, phases
+        nonlocal batch, errors, phases, entry_id
         if not batch:
             return
-        # прогон через плагины (последовательно)
-        for p in plugins:
-            try:
-                batch = p.process_batch(batch)
-            except Exception:
-                # плагины не должны ломать парсинг
-                pass
+        lines = len(batch)
+        # прогон через плагины (последовательно); по id ответ плагина сливается со строками
+        parsed_json = {}
+        for offset, data in enumerate(batch):
+            data["id"] = entry_id + offset
+            parsed_json[data["id"]] = None if data.get("is_malformed") else data.get("json_str")
+        batch, plugin_seconds, failed = apply_plugins(plugins, batch)
+        failed_plugins.update(failed)
+        parsed = [parsed_json[data["id"]] for data in batch]
         # запись в БД
-        for data in batch:
+        for offset, data in enumerate(batch):
+            data["id"] = entry_id + offset  # плагины могли отбросить строки
             if data.get("phase"):
                 phases.add(data["phase"])
             if data.get("is_malformed"):
                 errors += 1
-            entry = LogEntry(run_id=run.id, **data)
-            db.add(entry)
-        db.flush()
+        key_values = batch_keys(batch)
+        if timeline is not None:
+            timeline.add(batch)
+        if spans is not None:
+            spans.add(batch, entry_id)
+        if templates is not None:
+            templates.add(batch, entry_id)
+        dictionary.encode_rows(db, batch)
+        add_run_keys(db, run.id, key_values, seen_keys)
+        for data, json_str in zip(batch, parsed):
+            compact_text_fields(data, json_str)
+            data["id"] = entry_id
+            data["run_id"] = run.id
+            entry_id += 1
+        bulk_insert_entries(db, batch)
         batch = []
+        if on_batch is not None:
+            on_batch(lines, plugin_seconds)
+
+    for data in rows:
+        total += 1
+        batch.append(data)
+        if len(batch) >= BATCH_SIZE:
+            flush_batch()
+    flush_batch()
+    if timeline is not None:
+        timeline.flush(db)
+    if spans is not None:
+        spans.flush(db)
+    if templates is not None:
+        templates.flush(db)
+    if fresh:
+        # цепочка, через которую прошли строки; упавший плагин к запуску не применён
+        record_plugins(db, run.id, [p for p in plugins if p.address not in failed_plugins])
+    elif failed_plugins:
+        # дописанные строки прошли не всю цепочку: запуск устарел при любых PLUGINS
+        record_plugins(db, run.id, [])
+    if total:
+        bump_run_version(db, run.id)
+    return total, errors, phases
+
+
+def ingest_lines(
+    db: Session, run: Run, lines: Iterable[str], on_batch: Optional[BatchHook] = None
+) -> Tuple[int, int, Set[str]]:
+    """Parse lines and append them to the run (see ingest_rows)."""
+    def rows():
+        for obj, raw, malformed in iter_parse_jsonl(lines):
+            yield normalize_entry(obj, raw, malformed)
+
+    return ingest_rows(db, run, rows(), on_batch)
+
+
+def run_summary(total: int, errors: int, phases: Iterable[str]) -> str:
+    return f"lines={total}; malformed={errors}; phases={','.join(sorted(phases)) or 'n/a'}"
+
+
+def process_uploaded_file(db: Session, run: Run, progress: Optional[Callable[[int, int, Dict[str, float]], None]] = None) -> None:
+    """Parse the stored file of the run; ``progress(bytes_read, lines, plugin_seconds)`` after every batch."""
+    path = Path(run.stored_path)
+    if not path.exists():
+        run.status = "error"
+        run.summary = "stored file missing"
+        db.add(run)
+        db.commit()
+        return
 
     with path.open("r", encoding="utf-8", errors="replace") as fh:
-        print(f"Opening file for reading: {path}")
-        for obj, raw, malformed in iter_parse_jsonl(fh):
-            print(f"Processing line: {raw}")
-            total += 1
-            data = normalize_entry(obj, raw, malformed)
-            batch.append(data)
-            if len(batch) >= BATCH_SIZE:
-                flush_batch()
-        flush_batch()
+        logger.debug("Opening file for reading: %s", path)
+        on_batch = None
+        if progress is not None:
+            # fh.tell() недоступен во время итерации, позиция буфера — с точностью до его размера
+            on_batch = lambda lines, plugin_seconds: progress(fh.buffer.tell(), lines, plugin_seconds)
+        total, errors, phases = ingest_lines(db, run, fh, on_batch)
 
     run.status = "parsed"
-    print(f"Parsing completed for run_id: {run.id}, total: {total}, errors: {errors}, phases: {','.join(sorted(phases)) or 'n/a'}")
-    run.summary = f"lines={total}; malformed={errors}; phases={','.join(sorted(phases)) or 'n/a'}"
+    logger.info("Parsing completed for run_id: %s, %s", run.id, run_summary(total, errors, phases))
+    run.summary = run_summary(total, errors, phases)
     db.add(run)
     db.commit()
+    invalidate_run(run.id)
+
+
+def timeline_buckets(
+    db: Session,
+    run_id: int,
+    by: str = "tf_req_id",
+    filters: Optional[LogFilters] = None,
+) -> List[Tuple[str, datetime, datetime, int, int, int]]:
+    """Aggregate a run into (key, start, end, count, errors, malformed) spans, ordered by start."""
+    if by == "tf_req_id":
+        group_cols = [LogEntry.tf_req_id_id, LogEntry.tf_resource_type_id, LogEntry.phase_id, LogEntry.level_id]
+    elif by == "resource":
+        group_cols = [LogEntry.tf_resource_type_id, LogEntry.tf_resource_name]
+    else:
+        group_cols = [LogEntry.phase_id]
+
+    # GROUP BY по целочисленным ключам словаря, а не построчный обход в Python
+    stmt = (
+        select(
+            *group_cols,
+            func.min(LogEntry.timestamp),
+            func.max(LogEntry.timestamp),
+            func.count(),
+            func.sum(case((LogEntry.is_error.is_(True), 1), else_=0)),
+            func.sum(case((LogEntry.is_malformed.is_(True), 1), else_=0)),
+        )
+        .where(*run_criteria(db, run_id, filters))
+        .group_by(*group_cols)
+    )
+    rows = db.execute(stmt).all()
+
+    n = len(group_cols)
+    encoded = [i for i, col in enumerate(group_cols) if col is not LogEntry.tf_resource_name]
+    names = dictionary.decode_ids(db, (r[i] for r in rows for i in encoded))
+
+    def key_of(r) -> str:
+        if by == "tf_req_id":
+            req_id, res_type, phase, level = (names.get(r[i]) for i in range(4))
+            return timeline_key(by, req_id, res_type, None, phase, level)
+        if by == "resource":
+            return timeline_key(by, None, names.get(r[0]), r[1], None, None)
+        return timeline_key(by, None, None, None, names.get(r[0]), None)
+
+    buckets: Dict[str, Tuple[Optional[datetime], Optional[datetime], int, int, int]] = {}
+    for r in rows:
+        ts_min, ts_max, cnt, errs, bad = r[n:]
+        key = key_of(r)
+        start, end, count, errors, malformed = buckets.get(key, (None, None, 0, 0, 0))
+        if ts_min is not None:
+            start = ts_min if start is None else min(start, ts_min)
+            end = ts_max if end is None else max(end, ts_max)
+        buckets[key] = (start, end, count + cnt, errors + (errs or 0), malformed + (bad or 0))
+
+    items = []
+    for key, (start, end, count, errors, malformed) in buckets.items():
+        if start is None:
+            continue
+        items.append((key, start, end or start, count, errors, malformed))
+    items.sort(key=lambda i: (i[1], i[0]))
+    return items
@@ -0,0 +1,204 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from .models import Span, SpanIndexRun
+from .searchindex import invalidate_search_keys
+from .storage import dialect_insert, greatest, insert_ignore, insert_rows, least
+from .timeindex import EPOCH, ONE_MS, decoded_rows, text_value
+
+
+# Индекс вызовов и ресурсов запуска, пополняется при разборе (ingest_rows) рядом с индексом хронологии:
+# одна строка spans на tf_req_id и на ресурс (тип:имя) — первый/последний timestamp, длительность,
+# число строк и ошибок, id первой строки с ошибкой. "20 самых долгих вызовов" — проход по индексу.
+SPAN_KINDS = ("tf_req_id", "resource")
+SPAN_SORTS = {
+    "duration": Span.duration_ms,
+    "errors": Span.errors,
+    "lines": Span.lines,
+    "start": Span.start_ms,
+}
+
+
+def resource_key(tf_resource_type: Optional[str], tf_resource_name: Optional[str]) -> Optional[str]:
+    # как у /logs/groups?by=resource; строки без ресурса в индекс не попадают
+    if not tf_resource_type and not tf_resource_name:
+        return None
+    return f"{tf_resource_type or ''}:{tf_resource_name or ''}"
+
+
+def to_ms(ts: datetime) -> int:
+    return (ts - EPOCH) // ONE_MS
+
+
+def from_ms(ms: Optional[int]) -> Optional[datetime]:
+    return None if ms is None else EPOCH + ms * ONE_MS
+
+
+class SpanIndexer:
+    """Accumulates span rows for rows being ingested; flush() adds them to the stored index."""
+
+    def __init__(self, run_id: int, fresh: bool = False) -> None:
+        self.run_id = run_id
+        self.fresh = fresh  # у запуска ещё нет индекса: первая запись без ON CONFLICT
+        # (вид, ключ) -> [тип, имя, start_ms, end_ms, lines, errors, first_error_id]
+        self.spans: Dict[tuple, List[Any]] = {}
+
+    def add(self, rows: Iterable[Dict[str, Any]], first_id: int) -> None:
+        """Normalized rows with decoded key values; ``first_id`` is the LogEntry.id of the first row."""
+        spans = self.spans
+        for offset, r in enumerate(rows):
+            res_type, res_name = text_value(r.get("tf_resource_type")), text_value(r.get("tf_resource_name"))
+            keys = []
+            req_id = text_value(r.get("tf_req_id"))
+            if req_id:
+                keys.append(("tf_req_id", req_id))
+            res_key = resource_key(res_type, res_name)
+            if res_key is not None:
+                keys.append(("resource", res_key))
+            if not keys:
+                continue
+            ts = r.get("timestamp")
+            ms = to_ms(ts) if isinstance(ts, datetime) else None
+            error_id = (r.get("id") or first_id + offset) if r.get("is_error") else None
+            for key in keys:
+                s = spans.get(key)
+                if s is None:
+                    spans[key] = [res_type, res_name, ms, ms, 1, 1 if error_id else 0, error_id]
+                    continue
+                if s[0] is None and s[1] is None:
+                    s[0], s[1] = res_type, res_name
+                if ms is not None:
+                    if s[2] is None or ms < s[2]:
+                        s[2] = ms
+                    if s[3] is None or ms > s[3]:
+                        s[3] = ms
+                s[4] += 1
+                if error_id:
+                    s[5] += 1
+                    if s[6] is None:
+                        s[6] = error_id
+
+    def flush(self, db: Session) -> None:
+        if self.fresh:
+            # индекс строится с нуля и после flush полон: отметка пишется и для запуска без spans
+            db.execute(insert_ignore(db, SpanIndexRun).values(run_id=self.run_id))
+        if not self.spans:
+            self.fresh = False
+            return
+        invalidate_search_keys(db, self.run_id)
+        # по порядку ключей: вставка идёт в конец первичного ключа и индекса (kind, key, run_id)
+        rows = [
+            {"run_id": self.run_id, "kind": kind, "key": key, "tf_resource_type": res_type, "tf_resource_name": res_name,
+             "start_ms": start, "end_ms": end, "duration_ms": None if start is None else end - start,
+             "lines": lines, "errors": errors, "first_error_id": error_id}
+            for (kind, key), (res_type, res_name, start, end, lines, errors, error_id) in sorted(self.spans.items())
+        ]
+        if self.fresh:
+            insert_rows(db, Span.__table__, rows)
+        else:
+            _upsert_spans(db, rows)
+        self.fresh = False
+        self.spans = {}
+
+
+def _upsert_spans(db: Session, rows: List[Dict[str, Any]]) -> None:
+    t = Span.__table__
+    stmt = dialect_insert(db, t)
+    new = stmt.excluded
+    start = least(t.c.start_ms, new.start_ms)
+    end = greatest(t.c.end_ms, new.end_ms)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.run_id, t.c.kind, t.c["key"]],
+        set_={
+            # строки дописываются по порядку id: первые ресурс и ошибка — уже сохранённые
+            "tf_resource_type": func.coalesce(t.c.tf_resource_type, new.tf_resource_type),
+            "tf_resource_name": func.coalesce(t.c.tf_resource_name, new.tf_resource_name),
+            "start_ms": start,
+            "end_ms": end,
+            "duration_ms": end - start,
+            "lines": t.c.lines + new.lines,
+            "errors": t.c.errors + new.errors,
+            "first_error_id": func.coalesce(t.c.first_error_id, new.first_error_id),
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def has_span_index(db: Session, run_id: int) -> bool:
+    if db.execute(select(SpanIndexRun.run_id).where(SpanIndexRun.run_id == run_id)).first() is not None:
+        return True
+    # индекс, построенный до отметок span_index_runs, узнаётся по своим строкам
+    return db.execute(select(Span.run_id).where(Span.run_id == run_id).limit(1)).first() is not None
+
+
+def ensure_span_index(db: Session, run_id: int) -> None:
+    """Build the index for runs ingested before it existed (rows must be in log_entries)."""
+    if has_span_index(db, run_id):
+        return
+    indexer = SpanIndexer(run_id, fresh=True)
+    for rows in decoded_rows(db, run_id):
+        indexer.add(rows, rows[0]["id"])
+    indexer.flush(db)
+    db.commit()
+
+
+def drop_span_index(db: Session, run_id: int) -> None:
+    db.execute(delete(Span).where(Span.run_id == run_id))
+    db.execute(delete(SpanIndexRun).where(SpanIndexRun.run_id == run_id))
+    invalidate_search_keys(db, run_id)
+
+
+def query_spans(
+    db: Session,
+    run_id: int,
+    kind: str = "tf_req_id",
+    sort: str = "duration",
+    order: str = "desc",
+    q: Optional[str] = None,
+    tf_resource_type: Optional[str] = None,
+    min_duration_ms: Optional[int] = None,
+    errors_only: bool = False,
+    ts_from: Optional[datetime] = None,
+    ts_to: Optional[datetime] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """Spans of a run, sorted by ``sort`` (SPAN_SORTS) with the key as a tie-breaker."""
+    stmt = select(
+        Span.kind, Span.key, Span.tf_resource_type, Span.tf_resource_name, Span.start_ms, Span.end_ms,
+        Span.duration_ms, Span.lines, Span.errors, Span.first_error_id,
+    ).where(Span.run_id == run_id, Span.kind == kind)
+    if q:
+        stmt = stmt.where(Span.key.contains(q, autoescape=True))
+    if tf_resource_type:
+        stmt = stmt.where(Span.tf_resource_type == tf_resource_type)
+    if min_duration_ms is not None:
+        stmt = stmt.where(Span.duration_ms >= min_duration_ms)
+    if errors_only:
+        stmt = stmt.where(Span.errors > 0)
+    # вызов пересекается с окном
+    if ts_from is not None:
+        stmt = stmt.where(Span.end_ms >= to_ms(ts_from))
+    if ts_to is not None:
+        stmt = stmt.where(Span.start_ms <= to_ms(ts_to))
+    column = SPAN_SORTS.get(sort, Span.duration_ms)
+    if sort in ("duration", "start"):
+        # спаны без timestamp не имеют длительности и в такую сортировку не попадают
+        stmt = stmt.where(column.isnot(None))
+    # (run_id, kind, column, key) — индекс: top-N без сортировки всех спанов запуска
+    if order == "asc":
+        stmt = stmt.order_by(column.asc(), Span.key.asc())
+    else:
+        stmt = stmt.order_by(column.desc(), Span.key.desc())
+    rows = db.execute(stmt.limit(limit).offset(offset)).all()
+    return [
+        {
+            "kind": kind_, "key": key, "tf_resource_type": res_type, "tf_resource_name": res_name,
+            "start": from_ms(start), "end": from_ms(end), "duration_ms": duration,
+            "lines": lines, "errors": errors, "first_error_id": error_id,
+        }
+        for kind_, key, res_type, res_name, start, end, duration, lines, errors, error_id in rows
+    ]
@@ -0,0 +1,178 @@
+import logging
+import os
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import DateTime, case, delete, event, insert, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .models import LogEntry, run_id_range
+
+logger = logging.getLogger(__name__)
+
+
+# Операции, которые различаются между SQLite и PostgreSQL
+
+
+def is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def dialect_insert(db: Session, table):
+    """INSERT of the active dialect (on_conflict_do_nothing / on_conflict_do_update)."""
+    return (postgresql if is_postgres(db) else sqlite).insert(table)
+
+
+def insert_ignore(db: Session, model):
+    """INSERT ... ON CONFLICT DO NOTHING for the active dialect."""
+    return dialect_insert(db, model).on_conflict_do_nothing()
+
+
+def insert_ignore_tuples(db: Session, table, columns: List[str], rows: List[Tuple]) -> None:
+    """Driver-level executemany of plain tuples, for narrow tables with many rows per call."""
+    if not rows:
+        return
+    mark = "%s" if is_postgres(db) else "?"
+    sql = (
+        f"INSERT INTO {table.name} ({', '.join(columns)}) "
+        f"VALUES ({', '.join([mark] * len(columns))}) ON CONFLICT DO NOTHING"
+    )
+    db.connection().exec_driver_sql(sql, rows)
+
+
+def insert_rows(db: Session, table, rows: List[Dict[str, Any]]) -> None:
+    """insert_ignore_tuples for rows given as dicts; DateTime values are converted as SQLAlchemy would."""
+    if not rows:
+        return
+    columns = list(rows[0])
+    dialect = db.get_bind().dialect
+    convert = {}
+    for name in columns:
+        if isinstance(table.c[name].type, DateTime):
+            proc = table.c[name].type.dialect_impl(dialect).bind_processor(dialect)
+            if proc is not None:
+                convert[name] = proc
+    insert_ignore_tuples(db, table, columns, [
+        tuple(convert[c](r[c]) if c in convert and r[c] is not None else r[c] for c in columns) for r in rows
+    ])
+
+
+def least(a, b):
+    """Smaller of two values, NULL meaning "no value" (for ON CONFLICT DO UPDATE)."""
+    return case((b.is_(None), a), (a.is_(None), b), (b < a, b), else_=a)
+
+
+def greatest(a, b):
+    return case((b.is_(None), a), (a.is_(None), b), (b > a, b), else_=a)
+
+
+def partition_name(run_id: int) -> str:
+    return f"{LogEntry.__tablename__}_r{int(run_id)}"
+
+
+# DDL секций идёт отдельным соединением; ждать блокировку log_entries дольше этого — ошибка, а не
+# зависание (например, если транзакция вызывающего уже читала log_entries)
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "30s")
+
+
+def _ddl_connection(db: Session):
+    return db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def _partition_exists(conn, run_id: int) -> bool:
+    return conn.execute(text("SELECT to_regclass(:name)"), {"name": partition_name(run_id)}).scalar() is not None
+
+
+def prepare_run_partition(db: Session, run_id: int) -> None:
+    """On PostgreSQL every run gets its own range partition of log_entries.
+
+    CREATE TABLE ... PARTITION OF locks all of log_entries (ACCESS EXCLUSIVE), so a missing
+    partition is created on an autocommit connection of its own: the lock is held for the CREATE
+    only and the caller's transaction is left alone. If the caller then rolls back, an empty
+    partition stays; it is reused by the run or dropped with it. Call before writing the run's rows.
+    """
+    if not is_postgres(db):
+        return
+    lo, hi = run_id_range(run_id)
+    with _ddl_connection(db) as conn:
+        if _partition_exists(conn, run_id):
+            return
+        conn.execute(text(f"SET lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(run_id)} "
+            f"PARTITION OF {LogEntry.__tablename__} FOR VALUES FROM ({lo}) TO ({hi + 1})"
+        ))
+
+
+def drop_run_rows(db: Session, run_id: int, drop_partition: bool = False) -> None:
+    """Delete the rows of a run in the caller's transaction.
+
+    On PostgreSQL the run's partition is truncated (transactional, commits or rolls back with the
+    caller). With ``drop_partition`` the emptied partition is also detached and dropped once the
+    session commits: DETACH PARTITION ... CONCURRENTLY cannot run inside a transaction.
+    """
+    if is_postgres(db):
+        name = partition_name(run_id)
+        if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+            db.execute(text(f"TRUNCATE {name}"))
+        if drop_partition:
+            db.info.setdefault(_PENDING_DROPS, set()).add(name)
+        return
+    lo, hi = run_id_range(run_id)
+    # диапазон первичного ключа — строки запуска лежат подряд
+    db.execute(delete(LogEntry).where(LogEntry.id.between(lo, hi)))
+
+
+_PENDING_DROPS = "pending_partition_drops"
+
+
+def drop_partition(conn, name: str) -> None:
+    """Detach (or finish an interrupted detach of) a partition and drop it; ``conn`` is autocommit."""
+    # NULL — секции нет или она уже отсоединена, true — прерванный DETACH ... CONCURRENTLY
+    pending = conn.execute(
+        text("SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = to_regclass(:name)"), {"name": name}
+    ).scalar()
+    if pending is not None:
+        mode = "FINALIZE" if pending else "CONCURRENTLY"
+        conn.execute(text(f"ALTER TABLE {LogEntry.__tablename__} DETACH PARTITION {name} {mode}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_pending_partitions(db: Session) -> None:
+    names = db.info.pop(_PENDING_DROPS, None)
+    if not names:
+        return
+    try:
+        with _ddl_connection(db) as conn:
+            for name in sorted(names):
+                drop_partition(conn, name)
+    except Exception:
+        # строки уже удалены вместе с транзакцией; пустая секция только занимает место в каталоге
+        logger.exception("Could not drop partitions %s", sorted(names))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_pending_partitions(db: Session, _previous_transaction) -> None:
+    db.info.pop(_PENDING_DROPS, None)
+
+
+def _copy_entries(db: Session, rows: List[Dict[str, Any]]) -> None:
+    mapper_cols = LogEntry.__mapper__.columns
+    keys = list(rows[0])
+    columns = ", ".join(mapper_cols[k].name for k in keys)
+    driver_conn = db.connection().connection.driver_connection
+    with driver_conn.cursor() as cur:
+        with cur.copy(f"COPY {LogEntry.__tablename__} ({columns}) FROM STDIN") as copy:
+            for r in rows:
+                copy.write_row([r[k] for k in keys])
+
+
+def bulk_insert_entries(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Insert normalized rows (LogEntry attribute keys): COPY on PostgreSQL, executemany elsewhere."""
+    if not rows:
+        return
+    if is_postgres(db):
+        _copy_entries(db, rows)
+    else:
+        db.execute(insert(LogEntry), rows)
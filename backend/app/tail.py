@@ -0,0 +1,256 @@
+import io
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import events
+from .cache import invalidate_run
+from .database import DB_DIR, SessionLocal
+from .listing import rows_to_items, select_rows
+from .models import IngestCheckpoint, LogEntry, Run, run_id_range
+from .services import ingest_lines, next_entry_id, run_summary
+from .timeindex import TIMELINE_BYS, timeline_key
+
+logger = logging.getLogger(__name__)
+
+
+# Live tail: запуск пополняется по мере роста своего файла (stored_path). Файл дописывает
+# POST /live/{id}/append или внешний процесс (follow, только внутри TAIL_DIR).
+# Смещение в ingest_checkpoints коммитится в одной транзакции со строками —
+# после перезапуска разбор продолжается с того же байта, без повторов и пропусков.
+LIVE_STATUS = "live"
+LIVE_DIR = Path(os.getenv("LIVE_DIR") or DB_DIR / "uploads")
+TAIL_DIR = os.getenv("TAIL_DIR", "")  # пусто — follow выключен
+TAIL_POLL_SECONDS = float(os.getenv("TAIL_POLL_SECONDS", "1"))
+MAX_READ_BYTES = 8 * 1024 * 1024  # за один проход, остаток — следующим
+PUSH_MAX_ROWS = 1000  # больше — клиенту уходит reset, и он перечитывает /logs
+
+_locks: Dict[int, threading.Lock] = {}
+_followers: Dict[int, threading.Event] = {}
+_guard = threading.Lock()
+
+
+def _run_lock(run_id: int) -> threading.Lock:
+    with _guard:
+        return _locks.setdefault(run_id, threading.Lock())
+
+
+def start_live_run(db: Session, filename: str, path: Optional[Path] = None, follow: bool = False) -> Run:
+    """Create a run in status "live"; without ``path`` its file is created under LIVE_DIR."""
+    run = Run(filename=filename, stored_path=str(path or ""), status=LIVE_STATUS, summary=run_summary(0, 0, ()))
+    db.add(run)
+    db.flush()
+    if path is None:
+        LIVE_DIR.mkdir(parents=True, exist_ok=True)
+        path = LIVE_DIR / f"live_{run.id}_{Path(filename).name}"
+        path.write_bytes(b"")  # файл мог остаться от удалённого запуска с тем же id
+        run.stored_path = str(path)
+    db.add(IngestCheckpoint(run_id=run.id, offset=0, lines=0, malformed=0, phases="", follow=follow))
+    db.commit()
+    if follow:
+        start_follower(run.id)
+    return run
+
+
+def followable_path(path: str) -> Optional[Path]:
+    """Resolve a file to follow; only files inside TAIL_DIR are allowed."""
+    if not TAIL_DIR:
+        return None
+    root = Path(TAIL_DIR).resolve()
+    target = (root / path).resolve()
+    if not target.is_relative_to(root) or not target.is_file():
+        return None
+    return target
+
+
+def timeline_delta(items: List[Dict[str, Any]], by: str) -> List[Dict[str, Any]]:
+    """Timeline items (as in /timeline) for new rows only; the client merges them into its bars."""
+    buckets: Dict[str, Dict[str, Any]] = {}
+    for it in items:
+        key = timeline_key(by, it["tf_req_id"], it["tf_resource_type"], it["tf_resource_name"], it["phase"], it["level"])
+        b = buckets.get(key)
+        if b is None:
+            b = buckets[key] = {"key": key, "start": None, "end": None, "count": 0, "errors": 0, "malformed": 0}
+        ts = it["timestamp"]
+        if ts is not None:
+            b["start"] = ts if b["start"] is None else min(b["start"], ts)
+            b["end"] = ts if b["end"] is None else max(b["end"], ts)
+        b["count"] += 1
+        b["errors"] += bool(it["is_error"])
+        b["malformed"] += bool(it["is_malformed"])
+    return list(buckets.values())
+
+
+def rows_message(items: List[Dict[str, Any]], total: int) -> Dict[str, Any]:
+    return {
+        "type": "rows",
+        "last_id": items[-1]["id"],
+        "items": items,
+        "total": total,
+        "timeline": {by: timeline_delta(items, by) for by in TIMELINE_BYS},
+    }
+
+
+def _rows_after(db: Session, run_id: int, after_id: int, total: int) -> Optional[Dict[str, Any]]:
+    """rows message for rows of the run with id > after_id; RESET when there are too many."""
+    _lo, hi = run_id_range(run_id)
+    rows = db.execute(
+        select_rows(LogEntry.id.between(after_id + 1, hi)).order_by(LogEntry.id).limit(PUSH_MAX_ROWS + 1)
+    ).all()
+    if not rows:
+        return None
+    if len(rows) > PUSH_MAX_ROWS:
+        return events.RESET
+    return rows_message(rows_to_items(db, rows), total)
+
+
+def _read_lines(path: Path, offset: int, final: bool) -> bytes:
+    """Bytes from offset up to the end of the last complete line (``final``: up to EOF)."""
+    with path.open("rb") as fh:
+        fh.seek(offset)
+        data = fh.read(MAX_READ_BYTES)
+    if final and len(data) < MAX_READ_BYTES:
+        return data
+    end = data.rfind(b"\n")
+    if end < 0:
+        # строка длиннее MAX_READ_BYTES разбирается кусками (станет malformed), иначе хвост не сдвинется
+        return data if len(data) == MAX_READ_BYTES else b""
+    return data[: end + 1]
+
+
+def _catch_up(db: Session, run_id: int, final: bool) -> Optional[int]:
+    run = db.get(Run, run_id)
+    cp = db.get(IngestCheckpoint, run_id)
+    if run is None or cp is None or run.status != LIVE_STATUS:
+        return None
+    path = Path(run.stored_path)
+    added = 0
+    while path.exists() and path.stat().st_size > cp.offset:
+        chunk = _read_lines(path, cp.offset, final)
+        if not chunk:
+            break
+        first_id = next_entry_id(db, run_id)
+        # тот же построчный разбор, что и у загруженного файла (универсальные переводы строк)
+        text = io.TextIOWrapper(io.BytesIO(chunk), encoding="utf-8", errors="replace")
+        total, errors, phases = ingest_lines(db, run, text)
+        cp.offset += len(chunk)
+        cp.lines += total
+        cp.malformed += errors
+        cp.phases = ",".join(sorted(set(filter(None, cp.phases.split(","))) | phases))
+        run.summary = run_summary(cp.lines, cp.malformed, filter(None, cp.phases.split(",")))
+        db.commit()
+        invalidate_run(run_id)
+        added += total
+        if total and events.has_subscribers(run_id):
+            message = _rows_after(db, run_id, first_id - 1, cp.lines)
+            if message is not None:
+                events.publish(run_id, message)
+
+    if final:
+        run.status = "parsed"
+        cp.follow = False
+        db.commit()
+        invalidate_run(run_id)
+        events.publish(run_id, {"type": "done", "status": run.status, "summary": run.summary})
+    return added
+
+
+def catch_up(run_id: int, final: bool = False) -> Optional[int]:
+    """Parse lines appended since the checkpoint and push them to subscribers.
+
+    Returns the number of new lines, None when the run is not live. ``final`` also takes
+    a trailing line without newline and closes the run (status "parsed").
+    """
+    with _run_lock(run_id):
+        db = SessionLocal()
+        try:
+            return _catch_up(db, run_id, final)
+        finally:
+            db.close()
+
+
+def finish_live_run(run_id: int) -> Optional[int]:
+    stop_follower(run_id)
+    return catch_up(run_id, final=True)
+
+
+def progress(db: Session, run_id: int) -> Optional[Dict[str, Any]]:
+    run = db.get(Run, run_id)
+    if run is None:
+        return None
+    cp = db.get(IngestCheckpoint, run_id)
+    return {
+        "run_id": run.id,
+        "status": run.status,
+        "summary": run.summary,
+        "offset": cp.offset if cp else None,
+        "lines": cp.lines if cp else None,
+        "follow": bool(cp and cp.follow),
+    }
+
+
+def live_state(run_id: int, after_id: Optional[int] = None) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """(run status, rows message to replay after Last-Event-ID) for a new SSE subscriber."""
+    db = SessionLocal()
+    try:
+        run = db.get(Run, run_id)
+        if run is None:
+            return None, None
+        replay = None
+        lo, hi = run_id_range(run_id)
+        if after_id is not None and lo <= after_id <= hi:
+            cp = db.get(IngestCheckpoint, run_id)
+            replay = _rows_after(db, run_id, after_id, cp.lines if cp else 0)
+        return run.status, replay
+    finally:
+        db.close()
+
+
+def _follow(run_id: int, stop: threading.Event) -> None:
+    try:
+        while not stop.is_set():
+            try:
+                if catch_up(run_id) is None:
+                    break
+            except Exception:
+                # следующая попытка продолжит с сохранённого смещения
+                logger.exception("Live tail of run %s failed", run_id)
+            stop.wait(TAIL_POLL_SECONDS)
+    finally:
+        with _guard:
+            if _followers.get(run_id) is stop:
+                del _followers[run_id]
+
+
+def start_follower(run_id: int) -> None:
+    with _guard:
+        if run_id in _followers:
+            return
+        stop = _followers[run_id] = threading.Event()
+    threading.Thread(target=_follow, args=(run_id, stop), name=f"tail-{run_id}", daemon=True).start()
+
+
+def stop_follower(run_id: int) -> None:
+    with _guard:
+        stop = _followers.pop(run_id, None)
+    if stop is not None:
+        stop.set()
+
+
+def resume_live_runs(db: Session) -> None:
+    """Startup: parse what was appended while the server was down and restart followers."""
+    rows = db.execute(
+        select(Run.id, IngestCheckpoint.follow)
+        .join(IngestCheckpoint, IngestCheckpoint.run_id == Run.id)
+        .where(Run.status == LIVE_STATUS)
+    ).all()
+    for run_id, follow in rows:
+        if follow:
+            start_follower(run_id)
+        else:
+            catch_up(run_id)
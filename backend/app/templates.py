@@ -0,0 +1,229 @@
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from .models import ErrorRow, ErrorTemplate, LogEntry, run_id_range
+from .searchindex import invalidate_search_keys
+from .storage import dialect_insert, greatest, insert_rows, least
+from .timeindex import BUILD_CHUNK, run_error_count
+
+
+# Шаблоны сообщений об ошибках, пополняются при разборе (ingest_rows): упрощённый Drain —
+# переменные части (ARN, UUID, IP, id ресурсов, числа) маскируются, сообщения группируются
+# по числу токенов и первым токенам, внутри группы строка присоединяется к самому похожему
+# шаблону (доля совпавших токенов >= SIM_THRESHOLD), несовпавшие позиции становятся <*>.
+# Для каждой строки с ошибкой хранится id шаблона (error_rows), для шаблона — счётчики.
+PARAM = "<*>"
+PREFIX_TOKENS = 2  # глубина дерева Drain: группа = (число токенов, первые токены)
+SIM_THRESHOLD = 0.4
+MAX_MESSAGE_CHARS = 500  # шаблон строится по первой строке сообщения, не длиннее
+
+MASKS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), "<TS>"),
+    (re.compile(r"arn:[\w-]+:[^\s\"',]+"), "<ARN>"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<UUID>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?:/\d{1,2})?\b"), "<IP>"),
+    (re.compile(r"\b[a-z]{1,10}-[0-9a-f]{8,17}\b"), "<ID>"),  # i-0abc..., sg-..., vpc-...
+    (re.compile(r"\b0x[0-9a-fA-F]+\b|\b[0-9a-fA-F]{16,}\b"), "<HEX>"),
+    (re.compile(r"(?<![\w.<])[-+]?\d+(?:\.\d+)?(?:ms|s|m|h)?\b"), "<NUM>"),
+]
+
+
+def mask_message(message: str) -> List[str]:
+    """Tokens of the first line of a message with variable parts masked."""
+    text = message.strip().split("\n", 1)[0][:MAX_MESSAGE_CHARS]
+    for pattern, mask in MASKS:
+        text = pattern.sub(mask, text)
+    return text.split()
+
+
+def _has_digit(token: str) -> bool:
+    return any(c.isdigit() for c in token)
+
+
+class Drain:
+    """Streaming clustering of masked messages; cluster ids are stable, templates only generalize."""
+
+    def __init__(self) -> None:
+        self.templates: Dict[int, List[str]] = {}
+        self.groups: Dict[Tuple, List[int]] = {}
+
+    def _group(self, tokens: List[str]) -> Tuple:
+        prefix = tuple(PARAM if _has_digit(t) else t for t in tokens[:PREFIX_TOKENS])
+        return (len(tokens), prefix)
+
+    def load(self, template_id: int, template: str) -> None:
+        tokens = template.split()
+        self.templates[template_id] = tokens
+        self.groups.setdefault(self._group(tokens), []).append(template_id)
+
+    def match(self, tokens: List[str]) -> Optional[int]:
+        """Most similar template of the message's group, if similar enough (templates are not changed)."""
+        best, best_sim, best_params = None, -1.0, -1
+        for template_id in self.groups.get(self._group(tokens), ()):
+            template = self.templates[template_id]
+            same = params = 0
+            for t, m in zip(template, tokens):
+                if t == PARAM:
+                    params += 1
+                elif t == m:
+                    same += 1
+            sim = same / len(tokens) if tokens else 1.0
+            # при равной похожести — шаблон с большим числом <*> (как в Drain)
+            if sim > best_sim or (sim == best_sim and params > best_params):
+                best, best_sim, best_params = template_id, sim, params
+        return best if best is not None and best_sim >= SIM_THRESHOLD else None
+
+    def add(self, tokens: List[str]) -> int:
+        best = self.match(tokens)
+        if best is not None:
+            template = self.templates[best]
+            if template != tokens:
+                self.templates[best] = [t if t == m else PARAM for t, m in zip(template, tokens)]
+            return best
+        template_id = len(self.templates) + 1
+        self.templates[template_id] = list(tokens)
+        self.groups.setdefault(self._group(tokens), []).append(template_id)
+        return template_id
+
+    def template(self, template_id: int) -> str:
+        return " ".join(self.templates[template_id])
+
+
+class TemplateMiner:
+    """Assigns error rows being ingested to templates; flush() stores row ids and template counters."""
+
+    def __init__(self, run_id: int, fresh: bool = False) -> None:
+        self.run_id = run_id
+        self.fresh = fresh  # у запуска ещё нет шаблонов: первая запись без ON CONFLICT
+        self.drain = Drain()
+        # шаблон -> [count, first_seen, last_seen, first_entry_id]
+        self.stats: Dict[int, List[Any]] = {}
+        self.rows: List[Tuple[int, int, int]] = []
+
+    @classmethod
+    def load(cls, db: Session, run_id: int) -> "TemplateMiner":
+        """Miner that continues the stored templates of a run (live tail, appended files)."""
+        miner = cls(run_id)
+        for template_id, template in db.execute(
+            select(ErrorTemplate.template_id, ErrorTemplate.template).where(ErrorTemplate.run_id == run_id)
+        ):
+            miner.drain.load(template_id, template)
+        return miner
+
+    def add(self, rows: Iterable[Dict[str, Any]], first_id: int) -> None:
+        """Normalized rows (after plugins); ``first_id`` is the LogEntry.id of the first row."""
+        for offset, r in enumerate(rows):
+            if not r.get("is_error"):
+                continue
+            entry_id = r.get("id") or first_id + offset
+            template_id = self.drain.add(mask_message(str(r.get("message") or r.get("raw") or "")))
+            self.rows.append((self.run_id, entry_id, template_id))
+            ts = r.get("timestamp")
+            if not isinstance(ts, datetime):
+                ts = None
+            s = self.stats.get(template_id)
+            if s is None:
+                self.stats[template_id] = [1, ts, ts, entry_id]
+                continue
+            s[0] += 1
+            if ts is not None:
+                if s[1] is None or ts < s[1]:
+                    s[1] = ts
+                if s[2] is None or ts > s[2]:
+                    s[2] = ts
+
+    def flush(self, db: Session) -> None:
+        if not self.stats:
+            return
+        invalidate_search_keys(db, self.run_id)
+        rows = [
+            {"run_id": self.run_id, "template_id": template_id, "template": self.drain.template(template_id),
+             "count": count, "first_seen": first, "last_seen": last, "first_entry_id": entry_id}
+            for template_id, (count, first, last, entry_id) in self.stats.items()
+        ]
+        if self.fresh:
+            insert_rows(db, ErrorTemplate.__table__, rows)
+        else:
+            _upsert_templates(db, rows)
+        insert_rows(db, ErrorRow.__table__, [
+            {"run_id": run_id, "entry_id": entry_id, "template_id": template_id}
+            for run_id, entry_id, template_id in self.rows
+        ])
+        self.fresh = False
+        self.stats = {}
+        self.rows = []
+
+
+def _upsert_templates(db: Session, rows: List[Dict[str, Any]]) -> None:
+    t = ErrorTemplate.__table__
+    stmt = dialect_insert(db, t)
+    new = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.run_id, t.c.template_id],
+        set_={
+            # шаблон только обобщается: новый текст покрывает и прежние строки
+            "template": new.template,
+            "count": t.c["count"] + new["count"],
+            "first_seen": least(t.c.first_seen, new.first_seen),
+            "last_seen": greatest(t.c.last_seen, new.last_seen),
+            "first_entry_id": func.coalesce(t.c.first_entry_id, new.first_entry_id),
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def has_template_index(db: Session, run_id: int) -> bool:
+    return db.execute(select(ErrorTemplate.run_id).where(ErrorTemplate.run_id == run_id).limit(1)).first() is not None
+
+
+def ensure_template_index(db: Session, run_id: int) -> None:
+    """Mine templates of runs ingested before the index existed (rows must be in log_entries)."""
+    if has_template_index(db, run_id) or run_error_count(db, run_id) == 0:
+        # у запуска без ошибок шаблонов нет, строки не читаются
+        return
+    lo, hi = run_id_range(run_id)
+    stmt = (
+        select(LogEntry.id, LogEntry.timestamp, LogEntry.message, LogEntry.is_error)
+        .where(LogEntry.id.between(lo, hi), LogEntry.is_error.is_(True))
+        .order_by(LogEntry.id)
+    )
+    miner = TemplateMiner(run_id, fresh=True)
+    for chunk in db.execute(stmt.execution_options(yield_per=BUILD_CHUNK)).partitions():
+        miner.add([r._asdict() for r in chunk], 0)
+    miner.flush(db)
+    db.commit()
+
+
+def drop_template_index(db: Session, run_id: int) -> None:
+    db.execute(delete(ErrorRow).where(ErrorRow.run_id == run_id))
+    db.execute(delete(ErrorTemplate).where(ErrorTemplate.run_id == run_id))
+    invalidate_search_keys(db, run_id)
+
+
+def top_templates(db: Session, run_id: int, limit: int = 20, q: Optional[str] = None) -> Dict[str, Any]:
+    """Error templates of a run by row count (index on run_id, count)."""
+    stmt = select(
+        ErrorTemplate.template_id, ErrorTemplate.template, ErrorTemplate.count,
+        ErrorTemplate.first_seen, ErrorTemplate.last_seen, ErrorTemplate.first_entry_id,
+    ).where(ErrorTemplate.run_id == run_id)
+    if q:
+        stmt = stmt.where(ErrorTemplate.template.contains(q, autoescape=True))
+    rows = db.execute(
+        stmt.order_by(ErrorTemplate.count.desc(), ErrorTemplate.template_id.desc()).limit(limit)
+    ).all()
+    templates, errors = db.execute(
+        select(func.count(), func.coalesce(func.sum(ErrorTemplate.count), 0)).where(ErrorTemplate.run_id == run_id)
+    ).one()
+    return {
+        "errors": errors,
+        "templates": templates,
+        "items": [
+            {"template_id": template_id, "template": template, "count": count,
+             "first_seen": first, "last_seen": last, "first_entry_id": entry_id}
+            for template_id, template, count, first, last, entry_id in rows
+        ],
+    }
@@ -0,0 +1,313 @@
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from . import dictionary
+from .models import LogEntry, TimelineBucket, TimelineSpan, run_id_range
+from .storage import dialect_insert, greatest, insert_rows, least
+
+
+# Индекс хронологии запуска, пополняется при разборе (ingest_rows) и для live-запусков тоже:
+#  - timeline_buckets: число строк/ошибок по интервалам времени на LOD_LEVELS уровнях
+#    (LOD_BASE_MS, x4, x16, ...) — плотность для любого окна читается за один проход по PK;
+#  - timeline_spans: полосы /timeline для каждой группировки — top-N полос окна по индексу.
+# Запуски, разобранные до появления индекса, индексируются при первом обращении.
+TIMELINE_BYS = ("tf_req_id", "resource", "phase")
+LOD_BASE_MS = 100
+LOD_FACTOR = 4
+LOD_LEVELS = 10  # самый крупный интервал — 100 мс * 4**9 ≈ 7 ч
+LOD_WIDTHS = [LOD_BASE_MS * LOD_FACTOR ** level for level in range(LOD_LEVELS)]
+BUILD_CHUNK = 10_000
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MS = timedelta(milliseconds=1)
+
+
+def timeline_key(
+    by: str,
+    tf_req_id: Optional[str],
+    tf_resource_type: Optional[str],
+    tf_resource_name: Optional[str],
+    phase: Optional[str],
+    level: Optional[str],
+) -> str:
+    """Timeline bar key of a row (decoded values)."""
+    if by == "tf_req_id":
+        if tf_req_id:
+            return tf_req_id
+        # If no tf_req_id, try to use resource type or phase as fallback
+        if tf_resource_type:
+            return f"resource:{tf_resource_type}"
+        if phase:
+            return f"phase:{phase}"
+        if level:
+            return f"level:{level}"
+        return "general"
+    if by == "resource":
+        return f"{tf_resource_type or 'unknown_type'}:{tf_resource_name or 'unknown_name'}"
+    return phase or "unknown_phase"
+
+
+def text_value(value: Any) -> Optional[str]:
+    # как в dictionary.encode_rows: значения из JSON не обязательно строки
+    return str(value) if value else None
+
+
+def bucket_start(level: int, bucket: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=bucket * LOD_WIDTHS[level])
+
+
+class TimelineIndexer:
+    """Accumulates index rows for rows being ingested; flush() adds them to the stored index."""
+
+    def __init__(self, run_id: int, fresh: bool = False) -> None:
+        self.run_id = run_id
+        self.fresh = fresh  # у запуска ещё нет индекса: первая запись без ON CONFLICT
+        self.buckets: Dict[int, List[int]] = {}  # интервал нижнего уровня -> [count, errors, malformed]
+        self.spans: Dict[Tuple[str, str], List[Any]] = {}  # (группировка, ключ) -> [start, end, count, errors, malformed]
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Normalized rows with decoded key values (before dictionary.encode_rows)."""
+        buckets, spans = self.buckets, self.spans
+        for r in rows:
+            ts = r.get("timestamp")
+            if not isinstance(ts, datetime):
+                ts = None
+            err = 1 if r.get("is_error") else 0
+            bad = 1 if r.get("is_malformed") else 0
+            if ts is not None:
+                k = (ts - EPOCH) // ONE_MS // LOD_BASE_MS
+                b = buckets.get(k)
+                if b is None:
+                    buckets[k] = [1, err, bad]
+                else:
+                    b[0] += 1
+                    b[1] += err
+                    b[2] += bad
+            values = (
+                text_value(r.get("tf_req_id")), text_value(r.get("tf_resource_type")), text_value(r.get("tf_resource_name")),
+                text_value(r.get("phase")), text_value(r.get("level")),
+            )
+            for by in TIMELINE_BYS:
+                key = (by, timeline_key(by, *values))
+                s = spans.get(key)
+                if s is None:
+                    spans[key] = [ts, ts, 1, err, bad]
+                    continue
+                if ts is not None:
+                    if s[0] is None or ts < s[0]:
+                        s[0] = ts
+                    if s[1] is None or ts > s[1]:
+                        s[1] = ts
+                s[2] += 1
+                s[3] += err
+                s[4] += bad
+
+    def flush(self, db: Session) -> None:
+        if not self.buckets and not self.spans:
+            return
+        bucket_rows = []
+        level_buckets = self.buckets
+        for level in range(LOD_LEVELS):
+            if level:
+                # уровень собирается из предыдущего: интервалы вложены (ширина кратна LOD_FACTOR)
+                coarse: Dict[int, List[int]] = {}
+                for b, (cnt, err, bad) in level_buckets.items():
+                    c = coarse.setdefault(b // LOD_FACTOR, [0, 0, 0])
+                    c[0] += cnt
+                    c[1] += err
+                    c[2] += bad
+                level_buckets = coarse
+            bucket_rows.extend(
+                {"run_id": self.run_id, "level": level, "bucket": b, "count": cnt, "errors": err, "malformed": bad}
+                for b, (cnt, err, bad) in level_buckets.items()
+            )
+        span_rows = [
+            {"run_id": self.run_id, "kind": by, "key": key, "start_ts": start, "end_ts": end,
+             "count": cnt, "errors": err, "malformed": bad}
+            for (by, key), (start, end, cnt, err, bad) in self.spans.items()
+        ]
+        if self.fresh:
+            insert_rows(db, TimelineBucket.__table__, bucket_rows)
+            insert_rows(db, TimelineSpan.__table__, span_rows)
+        else:
+            _upsert_buckets(db, bucket_rows)
+            _upsert_spans(db, span_rows)
+        self.fresh = False
+        self.buckets = {}
+        self.spans = {}
+
+
+def _upsert_buckets(db: Session, rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    t = TimelineBucket.__table__
+    stmt = dialect_insert(db, t)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.run_id, t.c.level, t.c.bucket],
+        set_={
+            "count": t.c["count"] + stmt.excluded["count"],
+            "errors": t.c.errors + stmt.excluded.errors,
+            "malformed": t.c.malformed + stmt.excluded.malformed,
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def _upsert_spans(db: Session, rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    t = TimelineSpan.__table__
+    stmt = dialect_insert(db, t)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.run_id, t.c.kind, t.c["key"]],
+        set_={
+            "start_ts": least(t.c.start_ts, stmt.excluded.start_ts),
+            "end_ts": greatest(t.c.end_ts, stmt.excluded.end_ts),
+            "count": t.c["count"] + stmt.excluded["count"],
+            "errors": t.c.errors + stmt.excluded.errors,
+            "malformed": t.c.malformed + stmt.excluded.malformed,
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def has_timeline_index(db: Session, run_id: int) -> bool:
+    return db.execute(select(TimelineSpan.run_id).where(TimelineSpan.run_id == run_id).limit(1)).first() is not None
+
+
+def run_error_count(db: Session, run_id: int) -> Optional[int]:
+    """Error rows of the run from the index (every row has a phase bar); None if the run is not indexed."""
+    count = db.execute(
+        select(func.sum(TimelineSpan.errors)).where(TimelineSpan.run_id == run_id, TimelineSpan.kind == "phase")
+    ).scalar()
+    return None if count is None else int(count)
+
+
+def decoded_rows(db: Session, run_id: int) -> Iterator[List[Dict[str, Any]]]:
+    """Stored rows of a run in chunks, with key values decoded as ingest_rows sees them."""
+    lo, hi = run_id_range(run_id)
+    stmt = select(
+        LogEntry.id, LogEntry.timestamp, LogEntry.level_id, LogEntry.phase_id, LogEntry.tf_req_id_id,
+        LogEntry.tf_resource_type_id, LogEntry.tf_resource_name, LogEntry.is_error, LogEntry.is_malformed,
+    ).where(LogEntry.id.between(lo, hi)).order_by(LogEntry.id)
+    names: Dict[int, str] = {}
+    for chunk in db.execute(stmt.execution_options(yield_per=BUILD_CHUNK)).partitions():
+        names.update(dictionary.decode_ids(db, {i for r in chunk for i in r[2:6] if i not in names}))
+        yield [{
+            "id": entry_id, "timestamp": ts, "level": names.get(level), "phase": names.get(phase),
+            "tf_req_id": names.get(req), "tf_resource_type": names.get(res_type), "tf_resource_name": res_name,
+            "is_error": is_error, "is_malformed": is_malformed,
+        } for entry_id, ts, level, phase, req, res_type, res_name, is_error, is_malformed in chunk]
+
+
+def ensure_timeline_index(db: Session, run_id: int) -> None:
+    """Build the index for runs ingested before it existed (rows must be in log_entries)."""
+    if has_timeline_index(db, run_id):
+        return
+    indexer = TimelineIndexer(run_id, fresh=True)
+    for rows in decoded_rows(db, run_id):
+        indexer.add(rows)
+    indexer.flush(db)
+    db.commit()
+
+
+def drop_timeline_index(db: Session, run_id: int) -> None:
+    db.execute(delete(TimelineBucket).where(TimelineBucket.run_id == run_id))
+    db.execute(delete(TimelineSpan).where(TimelineSpan.run_id == run_id))
+
+
+_SPAN_COLUMNS = (
+    TimelineSpan.key, TimelineSpan.start, TimelineSpan.end,
+    TimelineSpan.count, TimelineSpan.errors, TimelineSpan.malformed,
+)
+
+
+def _span_item(row) -> Dict[str, Any]:
+    key, start, end, count, errors, malformed = row
+    return {"key": key, "start": start, "end": end or start, "count": count, "errors": errors, "malformed": malformed}
+
+
+def indexed_timeline(db: Session, run_id: int, by: str) -> List[Dict[str, Any]]:
+    """/timeline of the whole run from the index (same items and order as services.timeline_buckets)."""
+    spans = db.execute(
+        select(*_SPAN_COLUMNS).where(TimelineSpan.run_id == run_id, TimelineSpan.kind == by, TimelineSpan.start.isnot(None))
+    ).all()
+    items = [_span_item(s) for s in spans]
+    items.sort(key=lambda i: (i["start"], i["key"]))
+    return items
+
+
+def run_extent(db: Session, run_id: int) -> Optional[Tuple[datetime, datetime]]:
+    """Time range of the run rounded to LOD_BASE_MS: two seeks on the primary key of timeline_buckets."""
+    lo, hi = db.execute(
+        select(func.min(TimelineBucket.bucket), func.max(TimelineBucket.bucket))
+        .where(TimelineBucket.run_id == run_id, TimelineBucket.level == 0)
+    ).one()
+    if lo is None:
+        return None
+    return bucket_start(0, lo), bucket_start(0, hi + 1)
+
+
+def lod_timeline(
+    db: Session,
+    run_id: int,
+    by: str,
+    ts_from: Optional[datetime],
+    ts_to: Optional[datetime],
+    buckets: int,
+    top: int,
+) -> Dict[str, Any]:
+    """Zoomable timeline of a window: density in at most ``buckets`` intervals and the ``top`` spans
+    (errors, then line count) overlapping the window. Without a window — the whole run."""
+    extent = run_extent(db, run_id)
+    if extent is None:
+        return {"from": ts_from, "to": ts_to, "bucket_ms": None, "buckets": [], "items": [], "truncated": False}
+    ts_from = ts_from or extent[0]
+    ts_to = ts_to or extent[1]
+    if ts_to <= ts_from:
+        ts_to = ts_from + ONE_MS * LOD_BASE_MS
+    window_ms = (ts_to - ts_from) / ONE_MS
+
+    # самый подробный уровень, на котором окно укладывается в бюджет интервалов
+    level = next((lv for lv, w in enumerate(LOD_WIDTHS) if window_ms / w <= buckets), LOD_LEVELS - 1)
+    width = LOD_WIDTHS[level]
+    # окно длиннее бюджета и на верхнем уровне — соседние интервалы объединяются
+    merge = max(1, math.ceil(window_ms / width / buckets))
+    first = (ts_from - EPOCH) // ONE_MS // width
+    last = (ts_to - EPOCH) // ONE_MS // width
+    rows = db.execute(
+        select(TimelineBucket.bucket, TimelineBucket.count, TimelineBucket.errors, TimelineBucket.malformed)
+        .where(TimelineBucket.run_id == run_id, TimelineBucket.level == level, TimelineBucket.bucket.between(first, last))
+        .order_by(TimelineBucket.bucket)
+    ).all()
+    density: Dict[int, List[int]] = {}
+    for b, cnt, err, bad in rows:
+        d = density.setdefault(first + (b - first) // merge * merge, [0, 0, 0])
+        d[0] += cnt
+        d[1] += err
+        d[2] += bad
+
+    spans = db.execute(
+        select(*_SPAN_COLUMNS)
+        .where(
+            TimelineSpan.run_id == run_id, TimelineSpan.kind == by,
+            TimelineSpan.start <= ts_to, TimelineSpan.end >= ts_from,
+        )
+        .order_by(TimelineSpan.errors.desc(), TimelineSpan.count.desc(), TimelineSpan.key.desc())
+        .limit(top + 1)
+    ).all()
+    return {
+        "from": ts_from,
+        "to": ts_to,
+        "bucket_ms": width * merge,
+        "buckets": [
+            {"start": bucket_start(level, b), "count": cnt, "errors": err, "malformed": bad}
+            for b, (cnt, err, bad) in density.items()
+        ],
+        "items": [_span_item(s) for s in spans[:top]],
+        "truncated": len(spans) > top,
+    }
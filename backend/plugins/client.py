@@ -1,4 +1,5 @@
 import grpc
+from datetime import datetime
 from typing import List, Dict
 import sys
 import os
@@ -24,9 +25,22 @@ FilterRequest = getattr(LOGVIEWER_PB2, "FilterRequest")
 LogFilterStub = getattr(LOGVIEWER_PB2_GRPC, "LogFilterStub")
 
 
+def _iso(ts) -> str:
+    # в БД время хранится наивным UTC
+    if isinstance(ts, datetime):
+        return ts.isoformat() + "Z"
+    return ts or ""
+
+
+def _str(value) -> str:
+    # значения из JSON не обязательно строки (числовой level, tf_req_id)
+    return str(value) if value else ""
+
+
 class GrpcLogFilterClient:
-    def __init__(self, address: str) -> None:
+    def __init__(self, address: str, version: str = "") -> None:
         self.address = address
+        self.version = version
 
     def process_batch(self, items: List[Dict]) -> List[Dict]:
         if not items:
@@ -38,13 +52,13 @@ class GrpcLogFilterClient:
                     LogItem(
                         id=i.get("id", 0),
                         run_id=i.get("run_id", 0),
-                        timestamp=(i.get("timestamp") or ""),
-                        level=i.get("level") or "",
-                        phase=i.get("phase") or "",
-                        tf_req_id=i.get("tf_req_id") or "",
-                        tf_resource_type=i.get("tf_resource_type") or "",
-                        tf_resource_name=i.get("tf_resource_name") or "",
-                        message=i.get("message") or "",
+                        timestamp=_iso(i.get("timestamp")),
+                        level=_str(i.get("level")),
+                        phase=_str(i.get("phase")),
+                        tf_req_id=_str(i.get("tf_req_id")),
+                        tf_resource_type=_str(i.get("tf_resource_type")),
+                        tf_resource_name=_str(i.get("tf_resource_name")),
+                        message=_str(i.get("message")),
                         is_error=bool(i.get("is_error")),
                         is_malformed=bool(i.get("is_malformed")),
                         raw_json=i.get("json_str") or "",
@@ -7,9 +7,16 @@ from .client import GrpcLogFilterClient
 def get_registered_plugins() -> List[GrpcLogFilterClient]:
     # Читаем список адресов плагинов из переменной окружения, через запятую
     # Например: PLUGINS=plugin1:50051,plugin2:50052
+    # После @ — версия плагина (необязательно): PLUGINS=plugin1:50051@2. Цепочка записывается
+    # для каждого запуска, по ней видно, какие запуски нужно перегнать (/runs/{id}/reprocess)
     env = os.getenv("PLUGINS", "").strip()
     if not env:
         return []
-    return [GrpcLogFilterClient(addr.strip()) for addr in env.split(",") if addr.strip()]
+    plugins = []
+    for entry in env.split(","):
+        addr, _, version = entry.strip().partition("@")
+        if addr.strip():
+            plugins.append(GrpcLogFilterClient(addr.strip(), version.strip()))
+    return plugins
 
 
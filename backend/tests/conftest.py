@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+import pytest
+
+# отдельные SQLite-база и каталог данных на прогон тестов; задаются до импорта backend.app.database
+_tmp = tempfile.mkdtemp(prefix="logviewer-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.sqlite3")
+os.environ.setdefault("STORAGE_DIR", f"{_tmp}/storage")
+os.environ.setdefault("PLUGINS", "")
+
+from backend.app import archive, tail  # noqa: E402
+from backend.app.database import SessionLocal, init_db  # noqa: E402
+from backend.app.models import Run  # noqa: E402
+from backend.app.routers import uploads  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _schema():
+    init_db()
+
+
+@pytest.fixture(autouse=True)
+def _storage(tmp_path, monkeypatch):
+    # файлы, которые пишут тесты, не попадают в backend/storage
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", tmp_path / "uploads")
+    monkeypatch.setattr(uploads, "UPLOAD_IMPORT_DIR", tmp_path / "imports")
+    monkeypatch.setattr(tail, "LIVE_DIR", tmp_path / "live")
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path / "archive")
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+@pytest.fixture
+def make_run(db):
+    def make(filename: str = "test.jsonl", status: str = "parsed") -> Run:
+        run = Run(filename=filename, stored_path="", status=status)
+        db.add(run)
+        db.commit()
+        return run
+
+    return make
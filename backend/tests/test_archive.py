@@ -0,0 +1,89 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pyarrow.parquet as pq
+from sqlalchemy import Column, select
+
+from backend.app import archive, services, storage
+from backend.app.database import SessionLocal
+from backend.app.models import LogEntry, Run
+
+LINES = [
+    '{"@timestamp":"2024-05-01T10:00:00.000000Z","@level":"info","@message":"one","tf_req_id":"r1"}',
+    '{"@level":"error","@message":"two","extra":{"a":1}}',
+    "not json",
+]
+_columns = [col for _key, col in LogEntry.__mapper__.columns.items() if isinstance(col, Column)]
+
+
+def _parsed_run(db, make_run):
+    run = make_run(status="parsing")
+    services.ingest_lines(db, run, LINES)
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def _rows(db, run_id):
+    return db.execute(select(*_columns).where(LogEntry.run_id == run_id).order_by(LogEntry.id)).all()
+
+
+def test_archive_is_parquet_and_round_trips(db, make_run):
+    run = _parsed_run(db, make_run)
+    before = _rows(db, run.id)
+
+    path = archive.archive_run(db, run)
+    assert path.suffix == ".parquet" and pq.ParquetFile(path).metadata.num_rows == len(LINES)
+    assert pq.ParquetFile(path).metadata.row_group(0).column(0).compression == "ZSTD"
+    assert _rows(db, run.id) == []
+
+    archive.ensure_hydrated(db, run.id)
+    db.refresh(run)
+    assert run.status == "parsed" and run.archived_path is None and not path.exists()
+    assert _rows(db, run.id) == before
+
+
+def test_legacy_gzip_archive_rehydrates(db, make_run, tmp_path):
+    run = _parsed_run(db, make_run)
+    before = _rows(db, run.id)
+    # прежний формат: gzip JSONL, в строке — колоночный сегмент
+    path = tmp_path / f"run_{run.id}.jsonl.gz"
+    keys = [key for key, col in LogEntry.__mapper__.columns.items() if isinstance(col, Column)]
+    segment = {key: [v.isoformat() if isinstance(v, datetime) else v for v in values] for key, values in zip(keys, zip(*before))}
+    with gzip.open(path, "wt", encoding="utf-8") as fh:
+        fh.write(json.dumps(segment) + "\n")
+    storage.drop_run_rows(db, run.id)
+    run.archived_path, run.status = str(path), "archived"
+    db.commit()
+
+    archive.ensure_hydrated(db, run.id)
+    assert _rows(db, run.id) == before
+
+
+def test_archive_skips_run_changed_meanwhile(db, make_run):
+    run = _parsed_run(db, make_run)
+    other = SessionLocal()
+    try:
+        other.get(Run, run.id).status = "reprocessing"
+        other.commit()
+    finally:
+        other.close()
+
+    # объект в сессии ещё "parsed", проверка идёт по строке в БД
+    assert archive.archive_run(db, run) is None
+    db.refresh(run)
+    assert run.status == "reprocessing" and run.archived_path is None and len(_rows(db, run.id)) == len(LINES)
+
+
+def test_archive_expired_runs(db, make_run):
+    old = _parsed_run(db, make_run)
+    old.created_at = datetime.utcnow() - timedelta(days=10)
+    young = _parsed_run(db, make_run)
+    db.commit()
+
+    archived = archive.archive_expired_runs(db, 5)
+    assert old.id in archived and young.id not in archived
+    db.refresh(old)
+    db.refresh(young)
+    assert old.status == "archived" and young.status == "parsed"
@@ -0,0 +1,52 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from backend.app import services
+from backend.app.cache import bump_run_version, run_version
+from backend.app.main import app
+from backend.app.models import LogEntry
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def run(db, make_run):
+    run = make_run(status="parsing")
+    services.ingest_lines(db, run, ['{"level":"info","msg":"one"}', '{"level":"info","msg":"two"}'])
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def test_ingest_bumps_version(db, run):
+    assert run_version(db, run.id) == 1
+    services.ingest_lines(db, run, ['{"level":"info","msg":"three"}'])
+    db.commit()
+    assert run_version(db, run.id) == 2
+
+
+def test_etag_follows_run_version(client, db, run):
+    url = f"/api/logs/?run_id={run.id}"
+    first = client.get(url)
+    etag = first.headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    # другая реплика изменила строки: локальный кэш этого процесса не сброшен, версия в БД — новая
+    db.execute(update(LogEntry).where(LogEntry.run_id == run.id).values(message_text="changed"))
+    bump_run_version(db, run.id)
+    db.commit()
+
+    second = client.get(url, headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert second.headers["etag"] != etag
+    assert [i["message"] for i in second.json()["items"]] == ["changed", "changed"]
+
+
+def test_delete_drops_version(client, db, run):
+    assert client.delete(f"/api/runs/{run.id}").status_code == 200
+    assert run_version(db, run.id) == 0
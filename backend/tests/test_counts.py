@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from backend.app import counts, services
+from backend.app.filters import LogFilters, run_criteria
+
+
+@pytest.fixture
+def small_windows(monkeypatch):
+    # 4 окна по 8 строк: порог выборки — 320 строк вместо 160 000
+    monkeypatch.setattr(counts, "ESTIMATE_WINDOWS", 4)
+    monkeypatch.setattr(counts, "ESTIMATE_WINDOW_ROWS", 8)
+    monkeypatch.setattr(counts, "ESTIMATE_MIN_ROWS", 10 * 4 * 8)
+
+
+def _run(db, make_run, rows):
+    run = make_run(status="parsing")
+    # каждая четвёртая строка — ошибка
+    lines = [json.dumps({"@level": "error" if i % 4 == 0 else "info", "@message": f"line {i}"}) for i in range(rows)]
+    services.ingest_lines(db, run, lines)
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def _count(db, run, strategy, **filters):
+    f = LogFilters(**filters)
+    return counts.count_logs(db, run.id, run_criteria(db, run.id, f), f, strategy)
+
+
+def test_threshold_default():
+    assert counts.ESTIMATE_MIN_ROWS == 160_000
+
+
+def test_small_run_is_counted_exactly(db, make_run, small_windows):
+    run = _run(db, make_run, 319)
+    assert _count(db, run, "estimate", level="error") == (80, False)
+
+
+def test_large_run_is_estimated(db, make_run, small_windows):
+    run = _run(db, make_run, 320)
+    assert _count(db, run, "estimate", level="error") == (80, True)
+    run = _run(db, make_run, 400)
+    total, is_estimate = _count(db, run, "estimate", level="error")
+    assert is_estimate and total == 100  # доля ошибок в окнах та же, что во всём запуске
+    assert _count(db, run, "exact", level="error") == (100, False)
+
+
+def test_unfiltered_total_from_id_range(db, make_run, small_windows):
+    run = _run(db, make_run, 450)
+    assert _count(db, run, "estimate") == (450, False)
+    assert _count(db, make_run(), "estimate", level="error") == (0, False)
+
+
+def test_cached_count(db, make_run):
+    run = _run(db, make_run, 20)
+    assert _count(db, run, "cached", level="error") == (5, False)
+    assert _count(db, run, "cached", level="info") == (15, False)
@@ -0,0 +1,34 @@
+import uuid
+
+from sqlalchemy import event, false, select
+
+from backend.app import dictionary
+from backend.app.database import engine
+from backend.app.models import LogEntry
+
+
+def test_filter_in_resolves_values_in_one_query(db, monkeypatch):
+    tag = uuid.uuid4().hex[:8]
+    ids = dictionary.encode_values(db, "tf_req_id", [f"a-{tag}", f"b-{tag}", f"c-{tag}"])
+    db.commit()
+    monkeypatch.setattr(dictionary, "_cache", {})  # как после перезапуска: кэш пуст
+
+    executed = []
+
+    def capture(_conn, _cursor, statement, *_args):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        clause = dictionary.filter_in(db, "tf_req_id", [f"a-{tag}", f"b-{tag}", f"missing-{tag}", ""])
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert len(executed) == 1
+    assert sorted(clause.right.value) == sorted([ids[f"a-{tag}"], ids[f"b-{tag}"]])
+    assert db.execute(select(LogEntry.id).where(clause)).all() == []
+
+
+def test_filter_in_unknown_values(db):
+    assert dictionary.filter_in(db, "phase", [f"none-{uuid.uuid4().hex}"]) is false()
+    assert dictionary.filter_in(db, "phase", ["", None]) is false()
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import services
+from backend.app.database import SessionLocal, get_db
+from backend.app.main import app
+
+
+def _strict_db():
+    # сессия запроса, которая после закрытия get_db больше не выполняет запросов
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+        def closed(*args, **kwargs):
+            raise AssertionError("request session used after get_db closed it")
+
+        db.execute = closed
+        db.connection = closed
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_db] = _strict_db
+    try:
+        with TestClient(app) as c:
+            yield c
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.fixture
+def run(db, make_run):
+    run = make_run(status="parsing")
+    services.ingest_lines(db, run, [
+        '{"level":"info","msg":"start","tf_req_id":"req-1"}',
+        '{"level":"error","msg":"failed to create","tf_req_id":"req-1"}',
+    ])
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def test_jsonl_export_streams_with_own_session(client, run):
+    for url in (f"/api/export/jsonl?run_id={run.id}", f"/api/export/jsonl_by_keys?run_id={run.id}&keys=req-1"):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert [json.loads(line)["message"] for line in response.text.splitlines()] == ["start", "failed to create"]
+
+
+def test_search_streams_with_own_session(client, run):
+    response = client.get("/api/search/?tf_req_id=req-1")
+    assert response.status_code == 200
+    messages = [json.loads(line) for line in response.text.splitlines()]
+    assert messages[-1]["type"] == "done"
+    assert run.id in [m["run_id"] for m in messages if m["type"] == "run"]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_export_streams_with_own_session(client, run, fmt):
+    pytest.importorskip("pyarrow")
+    response = client.get(f"/api/export/{fmt}?run_id={run.id}")
+    assert response.status_code == 200
+    assert response.content
+
+
+def test_columnar_export_of_several_batches_reads_back(client, db, make_run):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    from backend.app.exporter import EXPORT_BATCH_ROWS
+
+    rows = 2 * EXPORT_BATCH_ROWS + 100
+    run = make_run(status="parsing")
+    # значения словарных колонок меняются от пачки к пачке: словари пачек различаются
+    services.ingest_lines(db, run, (
+        json.dumps({"@level": "error" if i >= EXPORT_BATCH_ROWS else "info", "@message": f"line {i}",
+                    "tf_req_id": f"req-{i // 1000}", "tf_resource_type": "aws_vpc" if i % 2 else None})
+        for i in range(rows)
+    ))
+    run.status = "parsed"
+    db.commit()
+
+    for fmt in ("parquet", "arrow"):
+        response = client.get(f"/api/export/{fmt}?run_id={run.id}")
+        assert response.status_code == 200
+        if fmt == "parquet":
+            assert pq.ParquetFile(pa.BufferReader(response.content)).num_row_groups == 3
+            table = pq.read_table(pa.BufferReader(response.content))
+        else:
+            stream = pa.ipc.open_stream(response.content)
+            table = stream.read_all()
+            # словари пачек дописываются дельтами, без замены
+            assert stream.stats.num_record_batches == 3
+            assert stream.stats.num_dictionary_deltas > 0 and stream.stats.num_replaced_dictionaries == 0
+        assert table.num_rows == rows
+        assert table.column("level").to_pylist() == ["info"] * EXPORT_BATCH_ROWS + ["error"] * (rows - EXPORT_BATCH_ROWS)
+        assert table.column("tf_req_id").to_pylist() == [f"req-{i // 1000}" for i in range(rows)]
+        assert table.column("tf_resource_type").to_pylist()[:3] == [None, "aws_vpc", None]
+        assert table.column("message").to_pylist()[-1] == f"line {rows - 1}"
@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import jobs
+from backend.app.main import app
+from backend.app.routers import jobs as jobs_router
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(jobs_router, "STREAM_SECONDS", 0.3)
+    monkeypatch.setattr(jobs_router, "KEEPALIVE_SECONDS", 0.1)
+    with TestClient(app) as c:
+        yield c
+
+
+def _events(text):
+    out = []
+    for frame in text.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines() if line.startswith(("event: ", "data: ")))
+        if "event" in lines:
+            out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+
+def test_subscription_does_not_register_job(client):
+    response = client.get("/api/jobs/nobody-uploads-this/events")
+    assert response.status_code == 200
+    events = _events(response.text)
+    assert events[0][0] == "snapshot" and events[0][1]["status"] == "pending"
+    assert jobs.get_job("nobody-uploads-this") is None
+    assert client.get("/api/jobs/nobody-uploads-this").status_code == 404
+
+
+def test_subscribe_before_upload_gets_progress(client, monkeypatch):
+    monkeypatch.setattr(jobs_router, "STREAM_SECONDS", 10)
+    received = {}
+
+    def listen():
+        received["text"] = client.get("/api/jobs/early-sub/events").text
+
+    listener = threading.Thread(target=listen)
+    listener.start()
+    time.sleep(0.3)
+    upload = client.post(
+        "/api/uploads/file?job_id=early-sub",
+        files={"file": ("early.jsonl", b'{"level":"info","msg":"hello"}\n', "application/json")},
+    )
+    listener.join(15)
+    assert upload.status_code == 200
+    events = _events(received["text"])
+    assert events[0][1]["status"] == "pending"
+    assert events[-1][0] == "done" and events[-1][1]["lines"] == 1
+
+
+def test_unfinished_jobs_are_never_evicted(monkeypatch):
+    monkeypatch.setattr(jobs, "_jobs", OrderedDict())
+    monkeypatch.setattr(jobs, "JOBS_KEPT", 3)
+    running = [jobs.create_job("upload") for _ in range(5)]
+    assert all(jobs.get_job(j.id) is j for j in running)
+
+    for j in running[:2]:
+        j.finish("done")
+    extra = jobs.create_job("upload")
+    kept = [j.id for j in jobs.list_jobs()]
+    # 4 незавершённые остаются, сверх JOBS_KEPT вытеснены только завершённые
+    assert set(kept) == {j.id for j in running[2:]} | {extra.id}
+
+
+def test_job_id_of_unfinished_job_is_not_reused(client):
+    running = jobs.get_or_create("busy-job", "upload")
+    try:
+        response = client.post(
+            "/api/uploads/file?job_id=busy-job",
+            files={"file": ("second.jsonl", b'{"level":"info","msg":"second"}\n', "application/json")},
+        )
+        assert response.status_code == 409
+        assert jobs.get_job("busy-job") is running and running.files == {}
+    finally:
+        running.finish("done")
+
+    # завершённая задача освобождает id
+    response = client.post(
+        "/api/uploads/file?job_id=busy-job",
+        files={"file": ("third.jsonl", b'{"level":"info","msg":"third"}\n', "application/json")},
+    )
+    assert response.status_code == 200 and jobs.get_job("busy-job") is not running
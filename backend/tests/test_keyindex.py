@@ -0,0 +1,61 @@
+import json
+
+from sqlalchemy import false, func, select
+from sqlalchemy.sql import Select
+
+from backend.app import keyindex, services
+from backend.app.models import LogEntry, RunKey
+
+REQ_IDS = ["req-077-a", "req-177-b", "req-077-a", "REQ-0770-C", "other-1"]
+
+
+def _run(db, make_run, req_ids, resource_type="aws_instance"):
+    run = make_run(status="parsing")
+    lines = [json.dumps({"msg": "x", "tf_req_id": r, "tf_resource_type": resource_type}) for r in req_ids]
+    services.ingest_lines(db, run, lines)
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def _matched(db, run_id, clause):
+    stmt = select(LogEntry.tf_req_id).where(LogEntry.run_id == run_id, clause).order_by(LogEntry.id)
+    return db.execute(stmt).scalars().all()
+
+
+def test_fragment_matches_like_substring(db, make_run):
+    run = _run(db, make_run, REQ_IDS)
+    _run(db, make_run, ["req-077-z"])  # ключи другого запуска не попадают в IN
+
+    clause = keyindex.partial_key_filter(db, run.id, "tf_req_id", "077")
+    assert len(clause.right.value) == 2
+    assert _matched(db, run.id, clause) == ["req-077-a", "req-077-a", "REQ-0770-C"]
+
+
+def test_short_fragment_scans_run_keys(db, make_run):
+    run = _run(db, make_run, REQ_IDS)
+    assert _matched(db, run.id, keyindex.partial_key_filter(db, run.id, "tf_req_id", "-1")) == ["req-177-b", "other-1"]
+    assert _matched(db, run.id, keyindex.partial_key_filter(db, run.id, "tf_resource_type", "aw")) == REQ_IDS
+
+
+def test_no_match_is_false(db, make_run):
+    run = _run(db, make_run, REQ_IDS)
+    assert keyindex.partial_key_filter(db, run.id, "tf_req_id", "nothing-like-this") is false()
+
+
+def test_many_matches_fall_back_to_subquery(db, make_run, monkeypatch):
+    run = _run(db, make_run, REQ_IDS)
+    monkeypatch.setattr(keyindex, "MAX_IN_IDS", 1)
+    clause = keyindex.partial_key_filter(db, run.id, "tf_req_id", "req")
+    # больше MAX_IN_IDS совпадений — IN по подзапросу, те же строки
+    assert isinstance(clause.right.element, Select)
+    assert _matched(db, run.id, clause) == REQ_IDS[:4]
+
+
+def test_index_is_built_for_old_runs(db, make_run):
+    run = _run(db, make_run, REQ_IDS)
+    keyindex.drop_run_keys(db, run.id)
+    db.commit()
+    assert _matched(db, run.id, keyindex.partial_key_filter(db, run.id, "tf_req_id", "177")) == ["req-177-b"]
+    count = db.execute(select(func.count()).select_from(RunKey).where(RunKey.run_id == run.id)).scalar()
+    assert count == len(set(REQ_IDS)) + 1
@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import create_engine, inspect, select, text
+
+from backend.app import dictionary
+from backend.app.database import Base, SessionLocal
+from backend.app.listing import rows_to_items, select_rows
+from backend.app.migrate import SchemaError, check_schema, migrate_legacy_rows, prepare_legacy_schema
+from backend.app.models import LogEntry, Run
+
+# схема исходной версии (baseline): строки level/phase/... прямо в log_entries
+BASELINE = [
+    "CREATE TABLE runs (id INTEGER PRIMARY KEY, filename VARCHAR(512) NOT NULL, stored_path VARCHAR(1024) NOT NULL, "
+    "created_at DATETIME NOT NULL, status VARCHAR(64), summary TEXT)",
+    "CREATE INDEX ix_runs_status ON runs (status)",
+    "CREATE TABLE log_entries (id INTEGER PRIMARY KEY, run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE, "
+    "raw TEXT NOT NULL, json_str TEXT, timestamp DATETIME, level VARCHAR(32), phase VARCHAR(32), tf_req_id VARCHAR(128), "
+    "tf_resource_type VARCHAR(128), tf_resource_name VARCHAR(256), message TEXT, is_error BOOLEAN, is_malformed BOOLEAN)",
+    "CREATE INDEX ix_log_entries_timestamp ON log_entries (timestamp)",
+    "CREATE INDEX ix_log_entries_level ON log_entries (level)",
+]
+LINES = [
+    '{"@timestamp":"2024-05-01T10:00:00Z","@level":"info","@message":"plan started","tf_req_id":"r1"}',
+    '{"@timestamp":"2024-05-01T10:00:01Z","@level":"error","@message":"boom","tf_req_id":"r1"}',
+    "not json",
+]
+
+
+@pytest.fixture
+def baseline(tmp_path, monkeypatch):
+    # отдельная база: кэш словаря не должен смешивать её id с основной тестовой
+    monkeypatch.setattr(dictionary, "_cache", {})
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.sqlite3'}", future=True)
+    with engine.begin() as conn:
+        for ddl in BASELINE:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO runs VALUES (1, 'a.jsonl', '', '2024-05-01 10:00:00', 'parsed', 'lines=3')"))
+        for i, raw in enumerate(LINES, 1):
+            conn.execute(text("INSERT INTO log_entries (id, run_id, raw) VALUES (:id, 1, :raw)"), {"id": i, "raw": raw})
+    yield engine
+    engine.dispose()
+
+
+def _upgrade(engine):
+    prepare_legacy_schema(engine)
+    Base.metadata.create_all(bind=engine)
+    migrate_legacy_rows(engine)
+    check_schema(engine)
+
+
+def test_baseline_database_is_migrated(baseline):
+    _upgrade(baseline)
+    assert "log_entries_v0" not in inspect(baseline).get_table_names()
+
+    db = SessionLocal(bind=baseline)
+    try:
+        run = db.get(Run, 1)
+        assert run.status == "parsed" and run.archived_path is None
+        rows = db.execute(select_rows(LogEntry.run_id == 1).order_by(LogEntry.id)).all()
+        items = rows_to_items(db, rows)
+        assert [i["level"] for i in items] == ["info", "error", None]
+        assert [i["tf_req_id"] for i in items] == ["r1", "r1", None]
+        assert items[2]["is_malformed"]
+    finally:
+        db.close()
+
+    # повторный старт ничего не меняет
+    _upgrade(baseline)
+
+
+def test_interrupted_migration_resumes(baseline):
+    prepare_legacy_schema(baseline)
+    Base.metadata.create_all(bind=baseline)
+    with baseline.begin() as conn:
+        conn.execute(text("INSERT INTO runs (id, filename, stored_path, created_at, status) VALUES (2, 'b', '', '2024-05-02', 'parsed')"))
+        conn.execute(text("INSERT INTO log_entries_v0 (id, run_id, raw) VALUES (10, 2, '{\"@message\":\"second\"}')"))
+
+    migrate_legacy_rows(baseline)
+    with baseline.connect() as conn:
+        counts = dict(conn.execute(text("SELECT run_id, count(*) FROM log_entries GROUP BY run_id")).all())
+    assert counts == {1: len(LINES), 2: 1}
+
+
+def test_unknown_outdated_schema_fails_clearly(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.sqlite3'}", future=True)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dict_values (id INTEGER PRIMARY KEY, value VARCHAR(256) NOT NULL)"))
+    Base.metadata.create_all(bind=engine)
+    with pytest.raises(SchemaError, match=r"dict_values \(kind\)"):
+        check_schema(engine)
+    engine.dispose()
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+from sqlalchemy import event, select
+
+from backend.app import services
+from backend.app.database import engine
+from backend.app.listing import select_rows
+from backend.app.models import LogEntry
+from backend.app.pairs import expand_pairs
+
+
+@pytest.fixture
+def run(db, make_run):
+    run = make_run(status="parsing")
+    # три вызова вперемешку, по 30 строк, время растёт с каждой строкой
+    lines = [
+        json.dumps({"@timestamp": f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}Z", "tf_req_id": f"req-{i % 3}", "msg": f"line {i}"})
+        for i in range(90)
+    ]
+    services.ingest_lines(db, run, lines)
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def _page(db, run_id, offset, size):
+    stmt = select_rows(LogEntry.run_id == run_id).order_by(LogEntry.timestamp, LogEntry.id).offset(offset).limit(size)
+    return db.execute(stmt).all()
+
+
+@pytest.mark.parametrize("budget", [0, 1, 5, 10, 17, 40])
+def test_pairs_stay_within_budget(db, run, budget):
+    base = _page(db, run.id, 40, 6)
+    extra, truncated = expand_pairs(db, run.id, base, "tf_req_id", per_key=10, budget=budget)
+    assert len(extra) <= budget
+    assert not {r.id for r in extra} & {r.id for r in base}
+    # каждый вызов страницы мог бы дать по 10 строк с каждой стороны — обрезанные ключи помечены
+    assert len(truncated) == 3
+
+
+def test_budget_cut_on_second_side_marks_key(db, run):
+    base = _page(db, run.id, 40, 1)
+    key = db.execute(select(LogEntry.tf_req_id).where(LogEntry.id == base[0].id)).scalar()
+    extra, truncated = expand_pairs(db, run.id, base, "tf_req_id", per_key=10, budget=15)
+    assert len(extra) == 15
+    assert truncated == [key]
+
+
+def test_pairs_complete_when_budget_allows(db, run):
+    base = _page(db, run.id, 40, 1)
+    extra, truncated = expand_pairs(db, run.id, base, "tf_req_id", per_key=100, budget=1000)
+    assert len(extra) == 29 and truncated == []
+
+
+def test_all_keys_in_one_query(db, run):
+    base = _page(db, run.id, 40, 6)
+    executed = []
+
+    def capture(_conn, _cursor, statement, *_args):
+        if "log_entries" in statement:
+            executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        extra, truncated = expand_pairs(db, run.id, base, "tf_req_id", per_key=5, budget=1000)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert len(executed) == 1 and "row_number() OVER" in executed[0]
+    # три ключа, у каждого по 5 строк с каждой стороны окна
+    assert len(extra) == 30 and len(truncated) == 3
+
+
+def test_nearest_partners_on_each_side(db, run):
+    base = _page(db, run.id, 45, 1)
+    key_id = base[0].tf_req_id_id
+    extra, _truncated = expand_pairs(db, run.id, base, "tf_req_id", per_key=2, budget=1000)
+    ordered = db.execute(
+        select(LogEntry.id).where(LogEntry.run_id == run.id, LogEntry.tf_req_id_id == key_id).order_by(LogEntry.timestamp)
+    ).scalars().all()
+    at = ordered.index(base[0].id)
+    assert sorted(r.id for r in extra) == sorted(ordered[at - 2 : at] + ordered[at + 1 : at + 3])
+
+
+def test_pairs_by_resource(db, make_run):
+    run = make_run(status="parsing")
+    lines = [
+        json.dumps({"@timestamp": f"2025-01-01T00:00:{i:02d}Z", "tf_resource_type": "aws_vpc", "tf_resource_name": f"r{i % 2}"})
+        for i in range(10)
+    ]
+    services.ingest_lines(db, run, lines)
+    db.commit()
+    base = _page(db, run.id, 0, 1)
+    extra, truncated = expand_pairs(db, run.id, base, "resource", per_key=10, budget=100)
+    assert len(extra) == 4 and truncated == []
+    assert {r.tf_resource_name for r in extra} == {"r0"}
@@ -0,0 +1,160 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import reprocess, services
+from backend.app.cache import run_version
+from backend.app.database import SessionLocal
+from backend.app.main import app
+from backend.app.models import LogEntry, Run, RunLease
+
+LINES = [f'{{"level":"info","msg":"line {i}"}}' for i in range(5)]
+
+
+class UpperPlugin:
+    address = "upper:1"
+    version = "1"
+
+    def process_batch(self, items):
+        return [dict(item, message=item["message"].upper()) for item in items]
+
+
+class BrokenPlugin:
+    address = "broken:1"
+    version = "1"
+
+    def process_batch(self, items):
+        raise RuntimeError("plugin is down")
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def parsed_run(db, make_run):
+    run = make_run(status="parsing")
+    services.ingest_lines(db, run, LINES)
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def _messages(db, run_id):
+    return [m for (m,) in db.query(LogEntry.message).filter(LogEntry.run_id == run_id).order_by(LogEntry.id)]
+
+
+def _wait(client, job_id):
+    for _ in range(100):
+        job = client.get(f"/api/jobs/{job_id}").json()
+        if job["status"] in ("done", "error"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("reprocess job did not finish")
+
+
+def test_changes_are_written_per_batch(db, parsed_run, monkeypatch):
+    monkeypatch.setattr(reprocess, "BUILD_CHUNK", 2)
+    monkeypatch.setattr(reprocess, "get_registered_plugins", lambda: [UpperPlugin()])
+    written = []
+    write = reprocess._write_changes
+    monkeypatch.setattr(reprocess, "_write_changes", lambda s, changes: (
+        written.append(sum(len(p) for p in changes.values())), write(s, changes)
+    ))
+    version = run_version(db, parsed_run.id)
+
+    result = reprocess.reprocess_run(db, parsed_run.id)
+
+    assert result["changed"] == 5 and written == [2, 2, 1]
+    assert _messages(db, parsed_run.id) == [f"LINE {i}" for i in range(5)]
+    assert run_version(db, parsed_run.id) > version
+
+
+def test_reprocess_job_releases_run(client, db, parsed_run):
+    response = client.post(f"/api/runs/{parsed_run.id}/reprocess")
+    assert response.status_code == 200
+    assert _wait(client, response.json()["job_id"])["status"] == "done"
+    db.refresh(parsed_run)
+    assert parsed_run.status == "parsed"
+
+
+def test_failed_reprocess_rolls_back_and_releases_run(client, db, parsed_run, monkeypatch):
+    monkeypatch.setattr(reprocess, "get_registered_plugins", lambda: [BrokenPlugin()])
+    response = client.post(f"/api/runs/{parsed_run.id}/reprocess")
+    assert _wait(client, response.json()["job_id"])["status"] == "error"
+    db.refresh(parsed_run)
+    assert parsed_run.status == "parsed"
+    assert _messages(db, parsed_run.id) == [f"line {i}" for i in range(5)]
+
+
+def test_run_being_reprocessed_is_locked(client, db, parsed_run):
+    parsed_run.status = reprocess.REPROCESS_STATUS
+    db.commit()
+
+    assert client.delete(f"/api/runs/{parsed_run.id}").status_code == 409
+    assert client.post(f"/api/runs/archive?run_id={parsed_run.id}").status_code == 409
+    assert client.post("/api/runs/clear").status_code == 409
+    assert client.post(f"/api/runs/{parsed_run.id}/reprocess").status_code == 409
+    db.refresh(parsed_run)
+    assert parsed_run.status == reprocess.REPROCESS_STATUS and _messages(db, parsed_run.id)
+
+    reprocess.release_interrupted_runs(db)
+    db.refresh(parsed_run)
+    assert parsed_run.status == "parsed"
+
+
+def test_batches_commit_as_they_go(db, parsed_run, monkeypatch):
+    monkeypatch.setattr(reprocess, "BUILD_CHUNK", 2)
+    monkeypatch.setattr(reprocess, "get_registered_plugins", lambda: [UpperPlugin()])
+    seen = []
+    write = reprocess._write_changes
+
+    def spy(s, changes):
+        # другая сессия видит уже записанные пачки: блокировка записи не держится весь прогон
+        other = SessionLocal()
+        try:
+            seen.append(_messages(other, parsed_run.id))
+        finally:
+            other.close()
+        write(s, changes)
+
+    monkeypatch.setattr(reprocess, "_write_changes", spy)
+    reprocess.reprocess_run(db, parsed_run.id)
+    assert seen[1][:2] == ["LINE 0", "LINE 1"] and seen[1][2:] == ["line 2", "line 3", "line 4"]
+
+
+def _lease(db, run, owner, age_seconds):
+    run.status = reprocess.REPROCESS_STATUS
+    db.add(RunLease(run_id=run.id, owner=owner, heartbeat_at=datetime.utcnow() - timedelta(seconds=age_seconds)))
+    db.commit()
+
+
+def test_live_lease_of_another_replica_is_kept(client, db, parsed_run):
+    _lease(db, parsed_run, "other-replica", 0)
+
+    assert reprocess.release_interrupted_runs(db) == []
+    assert client.post(f"/api/runs/{parsed_run.id}/reprocess").status_code == 409
+    db.refresh(parsed_run)
+    assert parsed_run.status == reprocess.REPROCESS_STATUS
+
+
+def test_expired_lease_is_released(db, parsed_run):
+    _lease(db, parsed_run, "other-replica", reprocess.LEASE_SECONDS + 1)
+
+    assert reprocess.release_interrupted_runs(db) == [parsed_run.id]
+    db.refresh(parsed_run)
+    assert parsed_run.status == "parsed" and db.get(RunLease, parsed_run.id) is None
+
+
+def test_expired_lease_is_taken_over(client, db, parsed_run):
+    _lease(db, parsed_run, "other-replica", reprocess.LEASE_SECONDS + 1)
+
+    response = client.post(f"/api/runs/{parsed_run.id}/reprocess")
+    assert response.status_code == 200
+    assert _wait(client, response.json()["job_id"])["status"] == "done"
+    db.expire_all()
+    assert db.get(Run, parsed_run.id).status == "parsed" and db.get(RunLease, parsed_run.id) is None
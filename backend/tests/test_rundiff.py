@@ -0,0 +1,70 @@
+import json
+
+from backend.app import services
+from backend.app.rundiff import diff_keys, diff_templates
+
+BASE = {
+    "aws_vpc:main": (0, 1000, 5, 0),
+    "aws_subnet:a": (1000, 3000, 4, 0),
+    "aws_subnet:b": (1000, 2000, 4, 0),
+    "aws_iam_role:gone": (0, 500, 2, 0),
+}
+RUN = {
+    "aws_vpc:main": (0, 1200, 5, 0),  # +200 мс — ниже порога
+    "aws_subnet:a": (1000, 9000, 4, 0),  # +6 с
+    "aws_subnet:b": (1000, 2000, 6, 1),  # ошибка
+    "aws_instance:web": (2000, 2500, 3, 1),
+    "aws_instance:db": (2000, 8000, 3, 0),
+}
+
+
+def test_added_removed_and_changed_keys():
+    diff = diff_keys(BASE, RUN, min_delta_ms=1000, limit=10)
+    assert diff["counts"] == {"added": 2, "removed": 1, "changed": 2, "unchanged": 1}
+    # сначала ошибки, затем длительность
+    assert [i["key"] for i in diff["added"]] == ["aws_instance:web", "aws_instance:db"]
+    assert [i["key"] for i in diff["removed"]] == ["aws_iam_role:gone"]
+    assert [c["key"] for c in diff["changed"]] == ["aws_subnet:b", "aws_subnet:a"]
+    a = diff["changed"][1]
+    assert a["duration_delta_ms"] == 6000 and a["base"]["duration_ms"] == 2000 and a["run"]["duration_ms"] == 8000
+    assert diff["changed"][0]["errors_delta"] == 1 and diff["changed"][0]["lines_delta"] == 2
+    assert not diff["truncated"]
+
+
+def test_lists_keep_the_top_keys():
+    diff = diff_keys(BASE, RUN, min_delta_ms=100, limit=1)
+    assert diff["counts"]["changed"] == 3
+    assert [i["key"] for i in diff["added"]] == ["aws_instance:web"]
+    assert [c["key"] for c in diff["changed"]] == ["aws_subnet:b"]
+    assert diff["truncated"]
+
+
+def test_keys_without_times():
+    diff = diff_keys({"x:y": (None, None, 1, 0)}, {"x:y": (0, 5000, 1, 0)}, min_delta_ms=1000, limit=10)
+    assert diff["counts"]["unchanged"] == 1 and diff["changed"] == []
+
+
+def _run(db, make_run, messages):
+    run = make_run(status="parsing")
+    services.ingest_lines(db, run, [json.dumps({"@level": "error", "@message": m}) for m in messages])
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def test_new_and_resolved_error_templates(db, make_run):
+    base = _run(db, make_run, [
+        "Error: creating EC2 Instance i-0abc1234def567890: timeout after 30s",
+        "Error: reading S3 Bucket policy: AccessDenied",
+    ])
+    run = _run(db, make_run, [
+        # тот же шаблон с другими значениями — не новая ошибка
+        "Error: creating EC2 Instance i-0fff1234def567890: timeout after 90s",
+        "Error: creating EC2 Instance i-0eee1234def567890: timeout after 10s",
+        "Error: deleting security group: DependencyViolation",
+    ])
+    diff = diff_templates(db, base.id, run.id, limit=10)
+    assert diff["counts"] == {"new": 1, "resolved": 1, "base": 2, "run": 2}
+    assert diff["new"][0]["template"] == "Error: deleting security group: DependencyViolation"
+    assert diff["resolved"][0]["template"] == "Error: reading S3 Bucket policy: AccessDenied"
+    assert diff_templates(db, run.id, run.id, limit=10)["counts"]["new"] == 0
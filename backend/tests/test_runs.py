@@ -0,0 +1,41 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.mark.parametrize("status", ["uploaded", "parsing", "live", "error"])
+def test_archive_rejects_unparsed_run(client, db, make_run, status):
+    run = make_run(status=status)
+    response = client.post(f"/api/runs/archive?run_id={run.id}")
+    assert response.status_code == 409
+    db.refresh(run)
+    assert run.status == status and run.archived_path is None
+
+
+def test_archive_unknown_run(client):
+    assert client.post("/api/runs/archive?run_id=999999").status_code == 404
+
+
+def test_archive_and_rehydrate_parsed_run(client, db, make_run):
+    from backend.app import services
+
+    run = make_run(status="parsing")
+    services.ingest_lines(db, run, ['{"level":"info","msg":"one"}', '{"level":"error","msg":"two"}'])
+    run.status = "parsed"
+    db.commit()
+
+    assert client.post(f"/api/runs/archive?run_id={run.id}").json() == {"archived": [run.id]}
+    db.refresh(run)
+    assert run.status == "archived" and run.archived_path
+
+    page = client.get(f"/api/logs/?run_id={run.id}").json()
+    assert [i["message"] for i in page["items"]] == ["one", "two"]
+    db.refresh(run)
+    assert run.status == "parsed" and run.archived_path is None
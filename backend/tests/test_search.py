@@ -0,0 +1,106 @@
+import json
+import uuid
+
+from sqlalchemy import event
+
+from backend.app import services
+from backend.app.database import engine
+from backend.app.search import SearchQuery, search_runs
+from backend.app.searchindex import runs_with_key
+
+
+def _line(resource=None, req=None, error=None, msg="ok"):
+    obj = {"@level": "error" if error else "info", "@message": error or msg}
+    if resource:
+        obj["tf_resource_type"], _, obj["tf_resource_name"] = resource.partition(":")
+    if req:
+        obj["tf_req_id"] = req
+    return json.dumps(obj)
+
+
+def _run(db, make_run, lines):
+    run = make_run(status="parsing")
+    services.ingest_lines(db, run, lines)
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def _search(db, **criteria):
+    messages = list(search_runs(db, SearchQuery(limit=1000, **criteria)))
+    return {m["run_id"]: m["matches"] for m in messages if m["type"] == "run"}, messages[-1]
+
+
+def test_runs_are_pruned_by_key(db, make_run):
+    tag = uuid.uuid4().hex[:8]
+    hit = _run(db, make_run, [_line(resource=f"aws_instance:web_{tag}", req=f"req-{tag}")])
+    other = _run(db, make_run, [_line(resource=f"aws_instance:db_{tag}", req=f"other-{tag}")])
+
+    found, done = _search(db, resource=f"web_{tag}")
+    assert hit.id in found and other.id not in found
+    assert found[hit.id]["resource"][0]["key"] == f"aws_instance:web_{tag}"
+    assert done["pruned"] >= 1
+
+    found, _done = _search(db, tf_req_id=f"req-{tag}", resource=f"aws_instance:web_{tag}")
+    assert set(found) & {hit.id, other.id} == {hit.id}
+    assert runs_with_key(db, "tf_req_id", tag) >= {hit.id, other.id}
+
+
+def test_error_templates_are_indexed(db, make_run):
+    tag = uuid.uuid4().hex[:8]
+    hit = _run(db, make_run, [_line(error=f"Error: subnet{tag} not found")])
+    clean = _run(db, make_run, [_line(msg=f"subnet{tag} created")])
+
+    found, _done = _search(db, error=f"subnet{tag}")
+    assert hit.id in found and clean.id not in found
+
+
+def test_short_fragment_falls_back_to_dictionary_scan(db, make_run):
+    tag = uuid.uuid4().hex[:8]
+    run = _run(db, make_run, [_line(resource=f"aws_s3_bucket:{tag}")])
+    _search(db, resource=tag)  # ключи запуска заносятся в индекс
+    assert run.id in runs_with_key(db, "resource", tag[:2])
+
+
+def test_appended_keys_are_found(db, make_run):
+    tag = uuid.uuid4().hex[:8]
+    run = _run(db, make_run, [_line(resource=f"aws_vpc:main_{tag}")])
+    assert run.id in _search(db, resource=f"main_{tag}")[0]
+
+    # дозапись (как live tail) меняет spans — ключи запуска заносятся заново
+    services.ingest_lines(db, run, [_line(resource=f"aws_vpc:late_{tag}")])
+    db.commit()
+    assert run.id in _search(db, resource=f"late_{tag}")[0]
+
+
+def test_key_lookup_uses_trigram_index(db, make_run):
+    tag = uuid.uuid4().hex[:8]
+    _run(db, make_run, [_line(resource=f"aws_instance:idx_{tag}")])
+    _search(db, resource=f"idx_{tag}")
+
+    executed = []
+
+    def capture(_conn, _cursor, statement, parameters, _context, _executemany):
+        if "run_search_keys" in statement:
+            executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        runs_with_key(db, "resource", f"idx_{tag}")
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    statement, parameters = executed[-1]
+    plan = " | ".join(row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+    # словарь — через FTS5, запуски — по первичному ключу; ни spans, ни шаблоны не читаются
+    assert "VIRTUAL TABLE INDEX" in plan
+    assert "SCAN search_keys " not in plan and "SCAN run_search_keys" not in plan
+    assert "sqlite_autoindex_search_keys" not in plan  # не перебор всех ключей данного вида
+    assert "spans" not in statement and "error_templates" not in statement
+
+
+def test_text_only_query(db, make_run):
+    tag = uuid.uuid4().hex[:8]
+    run = _run(db, make_run, [_line(msg=f"timeout {tag}")])
+    found, _done = _search(db, text=f"timeout {tag}")
+    assert found[run.id]["text"][0]["message"] == f"timeout {tag}"
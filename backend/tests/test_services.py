@@ -0,0 +1,70 @@
+import json
+
+from sqlalchemy import select
+
+from backend.app import services
+from backend.app.filters import LogFilters, run_criteria
+from backend.app.listing import attach_json, json_text
+from backend.app.models import LogEntry
+
+
+LINES = [
+    '{"msg": "caf\\u00e9 ready",  "level":"info"}',
+    '{"level":"error","msg":"boom"}',
+    'garbage {"msg":"salvaged"} tail',
+]
+
+
+class RewritingPlugin:
+    address = "test:1"
+    version = "1"
+
+    def process_batch(self, rows):
+        out = []
+        for row in rows:
+            item = {"id": row["id"], "json_str": row["json_str"]}
+            if "boom" in row["raw"]:
+                item["json_str"] = json.dumps({"msg": "rewritten"})
+            out.append(item)
+        return out
+
+
+def _ingest(db, run, lines):
+    services.ingest_lines(db, run, lines)
+    db.commit()
+    return db.execute(
+        select(LogEntry.id, LogEntry.raw, LogEntry.json_extra).where(LogEntry.run_id == run.id).order_by(LogEntry.id)
+    ).all()
+
+
+def test_json_str_derived_from_raw_without_plugins(db, make_run):
+    rows = _ingest(db, make_run(), LINES)
+    ok, error, malformed = rows
+    assert ok.json_extra is None and error.json_extra is None
+    # json_str по требованию — то же, что парсер записал бы в колонку
+    assert json_text(ok.raw, ok.json_extra) == json.dumps(json.loads(LINES[0]), ensure_ascii=False)
+    assert malformed.json_extra == json.dumps({"msg": "salvaged"})
+
+    items = [{"id": r.id} for r in rows]
+    attach_json(db, items)
+    assert [i["json"] for i in items] == [json.loads(LINES[0]), json.loads(LINES[1]), {"msg": "salvaged"}]
+
+
+def test_plugin_json_kept_only_when_rewritten(db, make_run, monkeypatch):
+    monkeypatch.setattr(services, "get_registered_plugins", lambda: [RewritingPlugin()])
+    ok, error, malformed = _ingest(db, make_run(), LINES)
+    assert ok.json_extra is None
+    assert error.json_extra == json.dumps({"msg": "rewritten"})
+    assert malformed.json_extra == json.dumps({"msg": "salvaged"})
+
+
+def test_search_matches_line_as_written(db, make_run):
+    run = make_run()
+    _ingest(db, run, LINES)
+
+    def found(text):
+        return db.execute(select(LogEntry.id).where(*run_criteria(db, run.id, LogFilters(search=text)))).all()
+
+    assert len(found('"level":"error"')) == 1
+    # пересериализованный вид (с пробелом после двоеточия) не хранится
+    assert found('"level": "error"') == []
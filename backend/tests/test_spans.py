@@ -0,0 +1,59 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+
+from backend.app import services, spans
+from backend.app.main import app
+from backend.app.models import SpanIndexRun
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def _ingest(db, run, lines):
+    services.ingest_lines(db, run, lines)
+    run.status = "parsed"
+    db.commit()
+
+
+def _no_rescan(monkeypatch):
+    def rescan(*args, **kwargs):
+        raise AssertionError("span index rebuilt from log_entries")
+
+    monkeypatch.setattr(spans, "decoded_rows", rescan)
+
+
+def test_run_without_keys_is_indexed_at_ingest(client, db, make_run, monkeypatch):
+    run = make_run(status="parsing")
+    _ingest(db, run, ['{"level":"info","msg":"no request id here"}'])
+    assert spans.has_span_index(db, run.id)
+
+    _no_rescan(monkeypatch)
+    for _ in range(2):
+        response = client.get(f"/api/spans/?run_id={run.id}")
+        assert response.status_code == 200
+        assert response.json()["items"] == []
+
+
+def test_unindexed_run_is_built_once(db, make_run, monkeypatch):
+    run = make_run(status="parsing")
+    _ingest(db, run, ['{"level":"info","msg":"plain"}'])
+    spans.drop_span_index(db, run.id)
+    db.commit()
+    assert not spans.has_span_index(db, run.id)
+
+    spans.ensure_span_index(db, run.id)
+    assert spans.has_span_index(db, run.id)
+    _no_rescan(monkeypatch)
+    spans.ensure_span_index(db, run.id)
+
+
+def test_index_built_before_markers_is_recognized(db, make_run):
+    run = make_run(status="parsing")
+    _ingest(db, run, ['{"level":"info","tf_req_id":"req-1","msg":"call"}'])
+    db.execute(delete(SpanIndexRun).where(SpanIndexRun.run_id == run.id))
+    db.commit()
+    assert spans.has_span_index(db, run.id)
@@ -0,0 +1,209 @@
+import importlib.util
+import os
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import services, storage
+from backend.app.database import Base
+from backend.app.models import LogEntry, Run
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeConnection:
+    def __init__(self, log, scalar):
+        self.log = log
+        self.scalar = scalar
+
+    def execution_options(self, **options):
+        self.log.append(("options", options))
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, stmt, params=None):
+        self.log.append(("autocommit", str(stmt)))
+        return FakeResult(self.scalar)
+
+
+class FakePostgresSession:
+    """Stand-in for a PostgreSQL session: records statements and commits, answers catalog queries."""
+
+    def __init__(self, scalar=None):
+        self.log = []
+        self.info = {}
+        self.engine = SimpleNamespace(
+            dialect=SimpleNamespace(name="postgresql"), connect=lambda: FakeConnection(self.log, scalar)
+        )
+        self.scalar = scalar
+
+    def get_bind(self):
+        return self.engine
+
+    def execute(self, stmt, params=None):
+        self.log.append(("session", str(stmt)))
+        return FakeResult(self.scalar)
+
+    def commit(self):
+        self.log.append(("commit", None))
+
+
+def _statements(db, where):
+    return [sql for kind, sql in db.log if kind == where]
+
+
+def test_new_partition_created_outside_caller_transaction():
+    db = FakePostgresSession(scalar=None)
+    storage.prepare_run_partition(db, 7)
+    lo, hi = storage.run_id_range(7)
+    # транзакцию вызывающего не трогаем: ни запросов в ней, ни фиксации
+    assert _statements(db, "session") == [] and ("commit", None) not in db.log
+    assert ("options", {"isolation_level": "AUTOCOMMIT"}) in db.log
+    check, timeout, create = _statements(db, "autocommit")
+    assert check.startswith("SELECT to_regclass") and timeout.startswith("SET lock_timeout")
+    assert create.startswith("CREATE TABLE IF NOT EXISTS log_entries_r7 PARTITION OF log_entries")
+    assert f"FROM ({lo}) TO ({hi + 1})" in create
+
+
+def test_existing_partition_is_not_recreated():
+    db = FakePostgresSession(scalar="log_entries_r7")
+    storage.prepare_run_partition(db, 7)
+    assert [sql.split()[0] for sql in _statements(db, "autocommit")] == ["SELECT"]
+
+
+def test_drop_truncates_in_caller_transaction():
+    db = FakePostgresSession(scalar="log_entries_r7")
+    storage.drop_run_rows(db, 7, drop_partition=True)
+    assert _statements(db, "session")[-1] == "TRUNCATE log_entries_r7"
+    assert _statements(db, "autocommit") == [] and ("commit", None) not in db.log
+    # отсоединение и DROP — только после фиксации транзакции
+    assert db.info[storage._PENDING_DROPS] == {"log_entries_r7"}
+
+
+def test_archive_keeps_partition():
+    db = FakePostgresSession(scalar="log_entries_r7")
+    storage.drop_run_rows(db, 7)
+    assert storage._PENDING_DROPS not in db.info
+
+
+@pytest.mark.parametrize("pending, mode", [(False, "CONCURRENTLY"), (True, "FINALIZE")])
+def test_partition_dropped_after_commit(pending, mode):
+    db = FakePostgresSession(scalar=pending)
+    db.info[storage._PENDING_DROPS] = {"log_entries_r7"}
+    storage._drop_pending_partitions(db)
+    assert _statements(db, "autocommit")[1:] == [
+        f"ALTER TABLE log_entries DETACH PARTITION log_entries_r7 {mode}",
+        "DROP TABLE IF EXISTS log_entries_r7",
+    ]
+    assert storage._PENDING_DROPS not in db.info
+
+
+def test_drop_of_detached_or_missing_partition():
+    db = FakePostgresSession(scalar=None)
+    storage.drop_partition(db.engine.connect(), "log_entries_r7")
+    assert _statements(db, "autocommit")[1:] == ["DROP TABLE IF EXISTS log_entries_r7"]
+
+
+# Настоящий PostgreSQL: docker-compose --profile postgres up -d db и TEST_POSTGRES_URL
+PG_URL = os.getenv("TEST_POSTGRES_URL", "")
+postgres = pytest.mark.skipif(
+    not PG_URL or importlib.util.find_spec("psycopg") is None, reason="TEST_POSTGRES_URL is not set"
+)
+
+
+@pytest.fixture(scope="module")
+def pg_sessions():
+    engine = create_engine(PG_URL, future=True)
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine, autoflush=False, future=True)
+    engine.dispose()
+
+
+@pytest.fixture
+def pg(pg_sessions):
+    db = pg_sessions()
+    runs = []
+
+    def make_run(lines):
+        run = Run(filename="pg.jsonl", stored_path="", status="parsing")
+        db.add(run)
+        db.commit()
+        runs.append(run.id)
+        services.ingest_lines(db, run, lines)
+        db.commit()
+        return run
+
+    yield db, make_run
+    db.rollback()
+    for run_id in runs:
+        run = db.get(Run, run_id)
+        if run is not None:
+            services.drop_run(db, run)
+    db.commit()
+    db.close()
+
+
+def _partition(db, run_id):
+    return db.execute(text("SELECT to_regclass(:name)"), {"name": storage.partition_name(run_id)}).scalar()
+
+
+def _count(db, run_id):
+    return db.execute(select(func.count()).select_from(LogEntry).where(LogEntry.run_id == run_id)).scalar()
+
+
+@postgres
+def test_pg_partition_does_not_commit_caller_work(pg, pg_sessions):
+    db, _make_run = pg
+    run = Run(filename="pending.jsonl", stored_path="", status="parsing")
+    db.add(run)
+    db.flush()
+    storage.prepare_run_partition(db, run.id)
+    other = pg_sessions()
+    try:
+        assert _partition(other, run.id) is not None
+        assert other.get(Run, run.id) is None
+    finally:
+        other.close()
+    db.rollback()
+
+
+@postgres
+def test_pg_drop_run_is_atomic(pg):
+    db, make_run = pg
+    run = make_run(['{"level":"info","msg":"one"}', '{"level":"error","msg":"two"}'])
+    assert _partition(db, run.id) is not None and _count(db, run.id) == 2
+
+    services.drop_run(db, run)
+    db.rollback()
+    assert db.get(Run, run.id) is not None and _count(db, run.id) == 2
+
+    services.drop_run(db, db.get(Run, run.id))
+    db.commit()
+    assert db.get(Run, run.id) is None and _partition(db, run.id) is None
+
+
+@postgres
+def test_pg_archive_and_rehydrate(pg):
+    from backend.app import archive
+
+    db, make_run = pg
+    run = make_run(['{"level":"info","msg":"one"}'])
+    run.status = "parsed"
+    db.commit()
+    archive.archive_run(db, run)
+    assert _count(db, run.id) == 0 and _partition(db, run.id) is not None
+    archive.ensure_hydrated(db, run.id)
+    assert _count(db, run.id) == 1
@@ -0,0 +1,76 @@
+import json
+
+from sqlalchemy import select
+
+from backend.app import services
+from backend.app.models import ErrorRow
+from backend.app.templates import PARAM, Drain, mask_message, top_templates
+
+
+def _error(message):
+    return json.dumps({"@level": "error", "@message": message})
+
+
+def _run(db, make_run, lines):
+    run = make_run(status="parsing")
+    services.ingest_lines(db, run, lines)
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def test_variable_parts_are_masked():
+    tokens = mask_message(
+        "creating arn:aws:iam::123456789012:role/x on i-0abc1234def567890 at 10.0.1.5/24 took 35s\nsecond line"
+    )
+    assert tokens == ["creating", "<ARN>", "on", "<ID>", "at", "<IP>", "took", "<NUM>"]
+
+
+def test_similar_messages_share_a_cluster():
+    drain = Drain()
+    a = drain.add("error waiting for subnet to become available".split())
+    b = drain.add("error waiting for vpc to become available".split())
+    c = drain.add("access denied".split())
+    assert a == b != c
+    assert drain.template(a) == f"error waiting for {PARAM} to become available"
+    # match не меняет шаблоны
+    assert drain.match("error waiting for igw to become ready".split()) == a
+    assert drain.template(a) == f"error waiting for {PARAM} to become available"
+    # другое число токенов — другая группа
+    assert drain.add("error waiting for subnet".split()) not in (a, c)
+
+
+def test_templates_of_a_run(db, make_run):
+    run = _run(db, make_run, [
+        _error("Error: creating EC2 Instance i-0abc1234def567890: timeout after 30s"),
+        _error("Error: creating EC2 Instance i-0fff1234def567890: timeout after 45s"),
+        _error("Error: reading S3 Bucket policy: AccessDenied"),
+        json.dumps({"@level": "info", "@message": "Apply complete"}),
+    ])
+    result = top_templates(db, run.id)
+    assert result["errors"] == 3 and result["templates"] == 2
+    assert [(i["template"], i["count"]) for i in result["items"]] == [
+        ("Error: creating EC2 Instance <ID>: timeout after <NUM>", 2),
+        ("Error: reading S3 Bucket policy: AccessDenied", 1),
+    ]
+    assert top_templates(db, run.id, q="S3")["items"][0]["count"] == 1
+
+
+def test_appended_errors_continue_stored_templates(db, make_run):
+    run = _run(db, make_run, [_error("Error: reading S3 Bucket policy: AccessDenied")])
+    first = top_templates(db, run.id)["items"][0]
+
+    # дозапись (live tail): TemplateMiner.load продолжает шаблоны запуска, id не меняются
+    services.ingest_lines(db, run, [
+        _error("Error: reading S3 Bucket acl: AccessDenied"),
+        _error("Error: timeout"),
+    ])
+    db.commit()
+    items = {i["template_id"]: i for i in top_templates(db, run.id)["items"]}
+    assert items[first["template_id"]]["template"] == f"Error: reading S3 Bucket {PARAM} AccessDenied"
+    assert items[first["template_id"]]["count"] == 2
+    assert items[first["template_id"]]["first_entry_id"] == first["first_entry_id"]
+    assert len(items) == 2 and {i["count"] for i in items.values()} == {2, 1}
+
+    rows = db.execute(select(ErrorRow.template_id).where(ErrorRow.run_id == run.id).order_by(ErrorRow.entry_id)).scalars()
+    assert list(rows)[:2] == [first["template_id"]] * 2
@@ -0,0 +1,75 @@
+import json
+from datetime import datetime, timedelta
+
+from backend.app import services
+from backend.app.timeindex import LOD_BASE_MS, LOD_FACTOR, LOD_WIDTHS, lod_timeline, run_extent
+
+T0 = datetime(2025, 1, 1)
+
+
+def _line(ms, req="req-1", level="info"):
+    ts = (T0 + timedelta(milliseconds=ms)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    return json.dumps({"@timestamp": ts, "@level": level, "@message": "x", "tf_req_id": req})
+
+
+def _run(db, make_run, lines):
+    run = make_run(status="parsing")
+    services.ingest_lines(db, run, lines)
+    run.status = "parsed"
+    db.commit()
+    return run
+
+
+def _window(db, run, seconds, buckets, by="tf_req_id", top=10):
+    return lod_timeline(db, run.id, by, T0, T0 + timedelta(seconds=seconds), buckets, top)
+
+
+def test_finest_level_that_fits_the_budget(db, make_run):
+    # по строке каждые 250 мс в течение 10 с, ошибка каждая десятая
+    run = _run(db, make_run, [_line(i * 250, level="error" if i % 10 == 0 else "info") for i in range(40)])
+    # границы округлены до LOD_BASE_MS: последняя строка (9750 мс) — в интервале [9700, 9800)
+    assert run_extent(db, run.id) == (T0, T0 + timedelta(milliseconds=9800))
+
+    fine = _window(db, run, 1, buckets=100)
+    assert fine["bucket_ms"] == LOD_BASE_MS
+    assert [b["start"] for b in fine["buckets"]] == [T0 + timedelta(milliseconds=ms) for ms in (0, 200, 500, 700, 1000)]
+
+    # 10 с в 20 интервалов: 100 мс и 400 мс дают больше 20, берётся 1600 мс
+    coarse = _window(db, run, 10, buckets=20)
+    assert coarse["bucket_ms"] == LOD_BASE_MS * LOD_FACTOR ** 2 == LOD_WIDTHS[2]
+    assert len(coarse["buckets"]) <= 20
+    assert sum(b["count"] for b in coarse["buckets"]) == 40
+    assert sum(b["errors"] for b in coarse["buckets"]) == 4
+
+
+def test_window_beyond_top_level_merges_buckets(db, make_run):
+    hour = 3_600_000
+    run = _run(db, make_run, [_line(h * hour) for h in range(100)])
+    result = _window(db, run, 100 * 3600, buckets=2)
+    top = LOD_WIDTHS[-1]
+    merge = -(-100 * hour // top // 2)  # ceil(окно / ширина / бюджет)
+    assert result["bucket_ms"] == top * merge
+    assert len(result["buckets"]) <= 2
+    assert sum(b["count"] for b in result["buckets"]) == 100
+
+
+def test_appended_rows_update_the_index(db, make_run):
+    run = _run(db, make_run, [_line(0), _line(50)])
+    services.ingest_lines(db, run, [_line(10, level="error"), _line(150, req="req-2")])
+    db.commit()
+
+    result = _window(db, run, 1, buckets=100)
+    assert [(b["count"], b["errors"]) for b in result["buckets"]] == [(3, 1), (1, 0)]
+    assert [(i["key"], i["count"]) for i in result["items"]] == [("req-1", 3), ("req-2", 1)]
+
+
+def test_top_spans_of_the_window(db, make_run):
+    lines = [_line(i * 10, req=f"req-{i % 5}", level="error" if i % 5 == 3 else "info") for i in range(50)]
+    run = _run(db, make_run, lines)
+    result = _window(db, run, 1, buckets=10, top=2)
+    # ошибки первыми, затем число строк
+    assert result["items"][0]["key"] == "req-3" and result["items"][0]["errors"] == 10
+    assert len(result["items"]) == 2 and result["truncated"]
+
+    later = lod_timeline(db, run.id, "tf_req_id", T0 + timedelta(seconds=5), T0 + timedelta(seconds=6), 10, 10)
+    assert later["items"] == [] and later["buckets"] == []
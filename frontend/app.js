@@ -99,6 +99,7 @@
 
   let currentRunId = null;
   let page = 1;
+  const runStatuses = new Map(); // run_id -> status из списка запусков
   let pageSize = 50;
 
   const readKey = (id) => `read-${id}`;
@@ -226,6 +227,7 @@
       
       // Add runs
       filteredRuns.forEach(run => {
+        runStatuses.set(run.id, run.status);
         const li = document.createElement('li');
         const isPinned = pinnedFiles.has(run.id);
         
@@ -238,6 +240,7 @@
           <span class="pin file-pin" data-id="${run.id}" title="${isPinned ? 'Открепить файл' : 'Закрепить файл'}">
             ${isPinned ? '📌 открепить' : '📍 закрепить'}
           </span>
+          <span class="pin file-delete" data-id="${run.id}" title="Удалить запуск">🗑 удалить</span>
         `;
         
         if (isPinned) {
@@ -268,6 +271,32 @@
         };
       });
     
+      // Per-run delete
+      qsa('.file-delete', ul).forEach(btn => {
+        btn.onclick = async (e) => {
+          e.stopPropagation();
+          const fileId = Number(btn.dataset.id);
+          if (!confirm(`Удалить запуск #${fileId} и все его логи?`)) {
+            return;
+          }
+          try {
+            const r = await fetch(`${api()}/runs/${fileId}`, { method: 'DELETE' });
+            if (!r.ok) {
+              throw new Error(`Ошибка HTTP: ${r.status} ${r.statusText}`);
+            }
+            if (currentRunId === fileId) {
+              currentRunId = null;
+              stopLiveTail();
+            }
+            showNotification(`✓ Запуск #${fileId} удалён`, 'success');
+            loadRuns(runsPage, runsPageSize);
+          } catch (err) {
+            console.error('Ошибка удаления запуска:', err);
+            showNotification(`✗ Ошибка удаления: ${err.message}`, 'error');
+          }
+        };
+      });
+
       // Event listeners are set up once in init() function
     
       // Page size and navigation event listeners are set up once in init()
@@ -289,6 +318,7 @@
           }
         } catch { }
         renderLogs();
+        startLiveTail();
       });
       
       // Store current page for future reference
@@ -315,6 +345,10 @@
     }
     const submitBtn = qs('#upload-form button[type="submit"]');
     const resultDiv = qs('#upload-result');
+    const jobId = newJobId();
+    const job = followJob(jobId, (j) => {
+      if (j.status === 'running') resultDiv.textContent = `Разбор: ${jobProgressText(j)}`;
+    });
 
     try {
       submitBtn.disabled = true;
@@ -332,7 +366,7 @@
       fd.append('file', f);
 
       console.log('Sending file upload request...');
-      const r = await fetch(`${api()}/uploads/file`, { method: 'POST', body: fd });
+      const r = await fetch(`${api()}/uploads/file?job_id=${jobId}`, { method: 'POST', body: fd });
       console.log('File upload request sent.');
 
       if (!r.ok) {
@@ -382,6 +416,7 @@
       // Show error notification toast
       showNotification(`❌ Ошибка загрузки файла: ${e.message}`, 'error');
     } finally {
+      job.close();
       submitBtn.disabled = false;
       submitBtn.textContent = 'Загрузить';
     }
@@ -412,6 +447,39 @@
     }
   }
 
+  // Прогресс разбора приходит событиями GET /jobs/{id}/events — без опроса и псевдо-прогресса
+  function newJobId() {
+    return Date.now().toString(36) + Math.random().toString(36).slice(2, 10);
+  }
+
+  // onProgress вызывается на snapshot/progress/done; done — промис с итогом задачи
+  function followJob(jobId, onProgress) {
+    const src = new EventSource(`${api()}/jobs/${encodeURIComponent(jobId)}/events`);
+    const update = (e) => onProgress(JSON.parse(e.data));
+    src.addEventListener('snapshot', update);
+    src.addEventListener('progress', update);
+    const done = new Promise((resolve) => {
+      src.addEventListener('done', (e) => {
+        src.close();
+        const data = JSON.parse(e.data);
+        onProgress(data);
+        resolve(data);
+      });
+    });
+    return { done, close: () => src.close() };
+  }
+
+  function jobPercent(job) {
+    return job.bytes_total ? Math.min(100, Math.floor(100 * job.bytes_done / job.bytes_total)) : 0;
+  }
+
+  function jobProgressText(job) {
+    const ms = Object.values(job.plugin_ms || {}).reduce((a, b) => a + b, 0);
+    const plugins = ms && job.batches ? ` · плагины ${(ms / job.batches).toFixed(1)} мс/пачка` : '';
+    const current = job.current ? ` · ${job.current}` : '';
+    return `${jobPercent(job)}% · ${job.lines} строк${current}${plugins}`;
+  }
+
 async function selectAndImportDirectory() {
     // Создаем input элемент для выбора файлов
     const fileInput = document.createElement('input');
@@ -458,12 +526,13 @@ async function importDirectoryFiles(selectedFiles) {
     report.innerHTML = '';
     hideBtn.style.display = 'none';
 
-    // показываем псевдо-прогресс пока идёт запрос
-    let pct = 5;
-    const timer = setInterval(() => {
-        pct = Math.min(95, pct + 3);
-        bar.style.width = pct + '%';
-    }, 300);
+    // прогресс разбора по байтам всех файлов; до начала разбора браузер ещё отправляет файлы
+    const jobId = newJobId();
+    const job = followJob(jobId, (j) => {
+        if (j.status !== 'running') return;
+        bar.style.width = Math.max(5, jobPercent(j)) + '%';
+        status.textContent = `Разбор: ${jobProgressText(j)}`;
+    });
 
     try {
         const formData = new FormData();
@@ -473,7 +542,7 @@ async function importDirectoryFiles(selectedFiles) {
             formData.append('files', file);
         });
 
-        const r = await fetch(`${api()}/uploads/import`, {
+        const r = await fetch(`${api()}/uploads/import?job_id=${jobId}`, {
             method: 'POST',
             body: formData
         });
@@ -483,7 +552,6 @@ async function importDirectoryFiles(selectedFiles) {
         }
 
         const data = await r.json();
-        clearInterval(timer);
         bar.style.width = '100%';
         status.textContent = `✓ Импорт завершён: всего ${data.count}, ok=${data.ok}, errors=${data.errors}`;
         status.style.color = '#10b981';
@@ -505,7 +573,6 @@ async function importDirectoryFiles(selectedFiles) {
         await loadRuns();
     } catch (e) {
         console.error('Import error:', e);
-        clearInterval(timer);
         status.textContent = `✗ Ошибка импорта: ${e.message}`;
         status.style.color = '#ef4444';
         bar.style.width = '100%';
@@ -513,11 +580,66 @@ async function importDirectoryFiles(selectedFiles) {
         // Показываем уведомление об ошибке
         showNotification(`❌ Ошибка импорта: ${e.message}`, 'error');
     } finally {
+        job.close();
         importBtn.disabled = false;
         importBtn.textContent = 'Импортировать каталог';
     }
 }
 
+// Импорт каталога IMPORT_DIR на сервере (POST /import/scan), прогресс — событиями задачи
+async function importServerDirectory() {
+    const btn = qs('#btn-server-import');
+    const box = qs('#import-progress');
+    const bar = qs('#import-bar');
+    const status = qs('#import-status');
+    const report = qs('#import-report');
+    const hideBtn = qs('#btn-hide-report');
+
+    btn.disabled = true;
+    try {
+        const r = await fetch(`${api()}/import/scan`, { method: 'POST' });
+        if (!r.ok) {
+            const err = await r.json().catch(() => ({}));
+            throw new Error(err.detail || `Ошибка HTTP: ${r.status} ${r.statusText}`);
+        }
+        const started = await r.json();
+        box.style.display = 'block';
+        bar.style.width = '5%';
+        status.textContent = 'Поиск новых файлов...';
+        status.style.color = '#9ca3af';
+        report.innerHTML = '';
+        hideBtn.style.display = 'none';
+
+        const data = await followJob(started.job_id, (j) => {
+            if (j.status !== 'running') return;
+            bar.style.width = Math.max(5, jobPercent(j)) + '%';
+            status.textContent = `Импорт IMPORT_DIR: ${jobProgressText(j)}`;
+        }).done;
+        bar.style.width = '100%';
+        const counts = data.counts || {};
+        if (data.status === 'error') {
+            status.textContent = `✗ Ошибка импорта: ${data.error}`;
+            status.style.color = '#ef4444';
+        } else {
+            status.textContent = `✓ Импорт завершён: новых ${counts.done || 0}, пропущено ${counts.skipped || 0}, ошибок ${counts.error || 0}`;
+            status.style.color = '#10b981';
+        }
+        report.innerHTML = (data.files || []).map(f => {
+            const color = f.status === 'error' ? '#ef4444' : (f.status === 'done' ? '#10b981' : '#9ca3af');
+            const msg = f.error || f.reason || f.summary || '';
+            return `<div style="padding:4px 0;border-bottom:1px solid #1f2937"><span style="color:${color}">[${f.status.toUpperCase()}]</span> ${f.path} ${f.run_id ? `(#${f.run_id})` : ''} — ${msg}</div>`;
+        }).join('');
+        hideBtn.style.display = 'inline-block';
+        hideBtn.onclick = () => { box.style.display = 'none'; };
+        await loadRuns();
+    } catch (e) {
+        console.error('Server import error:', e);
+        showNotification(`❌ Ошибка импорта: ${e.message}`, 'error');
+    } finally {
+        btn.disabled = false;
+    }
+}
+
   function getFilters() {
     const tf_req_id = qs('#f-req').value.trim() || '';
     const tf_resource_type = qs('#f-type').value.trim() || '';
@@ -534,7 +656,7 @@ async function importDirectoryFiles(selectedFiles) {
     const f = getFilters();
     const includePairs = qs('#include-pairs')?.checked ? 'true' : 'false';
     const pairBy = qs('#pair-by')?.value || 'tf_req_id';
-    const params = new URLSearchParams({ run_id: String(currentRunId), page: String(page), page_size: String(pageSize), include_pairs: includePairs, pair_by: pairBy });
+    const params = new URLSearchParams({ run_id: String(currentRunId), page: String(page), page_size: String(pageSize), include_pairs: includePairs, pair_by: pairBy, count: 'estimate' });
     Object.entries(f).forEach(([k, v]) => { if (v) params.set(k, v); });
     const r = await fetch(`${api()}/logs/?${params.toString()}`);
     return r.json();
@@ -553,20 +675,36 @@ async function importDirectoryFiles(selectedFiles) {
     return `<span class="badge ${cls}">${level}</span>`;
   }
 
-  function renderJsonCell(cell, txt) {
-    const wrapper = document.createElement('div');
-    const toggle = document.createElement('span');
-    toggle.className = 'json-toggle';
-    toggle.textContent = 'развернуть';
-    const pre = document.createElement('pre');
-    pre.style.display = 'none';
+  function fillJsonPre(pre, txt) {
     try {
       const obj = typeof txt === 'string' ? JSON.parse(txt) : txt;
       pre.textContent = JSON.stringify(obj, null, 2);
     } catch {
       pre.textContent = String(txt || '');
     }
-    toggle.onclick = () => {
+  }
+
+  // JSON строки не приходит в списке /logs — загружаем его при первом разворачивании
+  function renderJsonCell(cell, txt, entryId) {
+    const wrapper = document.createElement('div');
+    const toggle = document.createElement('span');
+    toggle.className = 'json-toggle';
+    toggle.textContent = 'развернуть';
+    const pre = document.createElement('pre');
+    pre.style.display = 'none';
+    let loaded = txt != null || entryId == null;
+    if (loaded) fillJsonPre(pre, txt || {});
+    toggle.onclick = async () => {
+      if (!loaded) {
+        loaded = true;
+        pre.textContent = '...';
+        try {
+          const r = await fetch(`${api()}/logs/${entryId}`);
+          fillJsonPre(pre, r.ok ? (await r.json()).json : `HTTP ${r.status}`);
+        } catch (e) {
+          pre.textContent = String(e);
+        }
+      }
       pre.style.display = pre.style.display === 'none' ? 'block' : 'none';
       toggle.textContent = pre.style.display === 'none' ? 'развернуть' : 'свернуть';
     };
@@ -575,17 +713,60 @@ async function importDirectoryFiles(selectedFiles) {
     cell.appendChild(wrapper);
   }
 
-  async function renderTimeline(items) {
+  // Окно масштабируемой хронологии (/timeline/lod): { runId, by, from, to } в мс, null — весь запуск
+  let timelineZoom = null;
+  let timelineZoomTimer = null;
+  const TIMELINE_TOP = 200; // полос в окне, остальные видны только в полосе плотности
+  const TIMELINE_MIN_WINDOW_MS = 200;
+
+  // timestamp в API — naive UTC, на странице он читается как локальное время; обратно — так же
+  const naiveIso = (ms) => new Date(ms - new Date(ms).getTimezoneOffset() * 60000).toISOString().slice(0, -1);
+
+  function zoomTimeline(runId, by, from, to) {
+    timelineZoom = { runId, by, from, to: Math.max(to, from + TIMELINE_MIN_WINDOW_MS) };
+    clearTimeout(timelineZoomTimer);
+    timelineZoomTimer = setTimeout(() => { if (currentRunId === runId) renderTimeline([]); }, 150);
+  }
+
+  async function renderTimeline(items, liveBars = null) {
     const host = qs('#timeline');
-    host.innerHTML = '';
-    if (!currentRunId) return;
+    if (!currentRunId) {
+      host.innerHTML = '';
+      return;
+    }
     
     // Запрашиваем агрегированную хронологию
+    const runId = currentRunId;
     const by = qs('#timeline-group')?.value || 'tf_req_id';
-    const params = new URLSearchParams({ run_id: String(currentRunId), by });
-    const r = await fetch(`${api()}/timeline/?${params.toString()}`);
-    const data = await r.json();
-    const bars = data.items || [];
+    const width = Math.max(800, host.clientWidth || 800);
+    const labelWidth = 200; // Увеличенная ширина для меток
+    const chartWidth = width - labelWidth - 20;
+    let bars = liveBars;
+    let lod = null;
+    if (!bars && runStatuses.get(runId) !== 'live') {
+      // плотность по интервалам и самые заметные полосы видимого окна, а не весь запуск
+      const params = new URLSearchParams({ run_id: String(runId), by, buckets: String(Math.floor(chartWidth / 4)), top: String(TIMELINE_TOP) });
+      if (timelineZoom && timelineZoom.runId === runId && timelineZoom.by === by) {
+        params.set('ts_from', naiveIso(timelineZoom.from));
+        params.set('ts_to', naiveIso(timelineZoom.to));
+      } else {
+        timelineZoom = null;
+      }
+      const r = await fetch(`${api()}/timeline/lod?${params.toString()}`);
+      lod = await r.json();
+      bars = lod.items || [];
+    } else if (!bars) {
+      // live: полные полосы, дальше их дополняют события /live/{id}/events
+      const params = new URLSearchParams({ run_id: String(runId), by });
+      const r = await fetch(`${api()}/timeline/?${params.toString()}`);
+      const data = await r.json();
+      bars = data.items || [];
+      timelineBars = { runId, by, bars: bars.map(b => ({ ...b })) };
+    }
+    host.innerHTML = '';
+    host.onwheel = null;
+    host.onmousedown = null;
+    host.ondblclick = null;
     if (!bars.length) {
       host.innerHTML = '<div style="padding: 20px; text-align: center; color: #9ca3af;">Нет данных для отображения</div>';
       return;
@@ -594,15 +775,20 @@ async function importDirectoryFiles(selectedFiles) {
     // Сортируем элементы по количеству сообщений (показываем самые важные сверху)
     bars.sort((a, b) => b.count - a.count);
     
-    const ts = bars.flatMap(i => [new Date(i.start).getTime(), new Date(i.end).getTime()]);
-    const min = Math.min(...ts), max = Math.max(...ts);
-    const width = Math.max(800, host.clientWidth || 800);
+    let min, max;
+    if (lod && lod.from) {
+      min = new Date(lod.from).getTime();
+      max = new Date(lod.to).getTime();
+    } else {
+      const ts = bars.flatMap(i => [new Date(i.start).getTime(), new Date(i.end).getTime()]);
+      min = Math.min(...ts);
+      max = Math.max(...ts);
+    }
     const dur = Math.max(1, max - min);
     
-    const labelWidth = 200; // Увеличенная ширина для меток
-    const chartWidth = width - labelWidth - 20;
     const yStep = 28; // Увеличенная высота строк
-    const headerHeight = 40;
+    const densityHeight = lod ? 28 : 0;
+    const headerHeight = 40 + densityHeight;
     
     // Создаем контейнер с заголовком
     const header = document.createElement('div');
@@ -626,7 +812,7 @@ async function importDirectoryFiles(selectedFiles) {
     timeScale.style.cssText = `
       position: absolute;
       left: ${labelWidth}px;
-      top: ${headerHeight - 20}px;
+      top: ${headerHeight - densityHeight - 20}px;
       width: ${chartWidth}px;
       height: 20px;
       border-bottom: 1px solid #374151;
@@ -666,16 +852,65 @@ async function importDirectoryFiles(selectedFiles) {
     }
     
     header.innerHTML = `Временная диаграмма (${bars.length} элементов, длительность: ${Math.round(dur/1000)}с)`;
+    if (lod) {
+      header.style.height = `${headerHeight - densityHeight}px`;
+      header.innerHTML = `Временная диаграмма (${lod.truncated ? `${bars.length} самых заметных полос` : `${bars.length} элементов`}, окно: ${Math.round(dur/1000)}с; колесо — масштаб, перетаскивание — сдвиг, двойной клик — весь запуск)`;
+    }
     host.appendChild(header);
     host.appendChild(timeScale);
+
+    if (lod) {
+      // полоса плотности: все строки окна по интервалам bucket_ms, красным — интервалы с ошибками
+      const maxCount = Math.max(1, ...lod.buckets.map(b => b.count));
+      const bucketWidth = Math.max(1, lod.bucket_ms / dur * chartWidth);
+      lod.buckets.forEach(b => {
+        const x = (new Date(b.start).getTime() - min) / dur * chartWidth;
+        if (x + bucketWidth < 0 || x > chartWidth) return;
+        const h = Math.max(2, Math.round(b.count / maxCount * (densityHeight - 6)));
+        const cell = document.createElement('div');
+        cell.style.cssText = `
+          position: absolute;
+          left: ${labelWidth + Math.max(0, x)}px;
+          top: ${headerHeight - h - 2}px;
+          width: ${Math.max(1, Math.min(bucketWidth, chartWidth - x) - (bucketWidth > 3 ? 1 : 0))}px;
+          height: ${h}px;
+          background: ${b.errors ? '#ef4444' : '#3b82f6'};
+          opacity: 0.8;
+        `;
+        cell.title = `${new Date(b.start).toLocaleTimeString()}\nСообщений: ${b.count}\nОшибок: ${b.errors}`;
+        host.appendChild(cell);
+      });
+
+      const msAt = (clientX) => min + (clientX - host.getBoundingClientRect().left - labelWidth) / chartWidth * dur;
+      host.onwheel = (e) => {
+        e.preventDefault();
+        const at = Math.min(max, Math.max(min, msAt(e.clientX)));
+        const k = e.deltaY < 0 ? 0.5 : 2;
+        zoomTimeline(runId, by, at - (at - min) * k, at + (max - at) * k);
+      };
+      host.onmousedown = (e) => {
+        const startX = e.clientX;
+        const onUp = (ev) => {
+          document.removeEventListener('mouseup', onUp);
+          const shift = (startX - ev.clientX) / chartWidth * dur;
+          if (Math.abs(ev.clientX - startX) > 3) zoomTimeline(runId, by, min + shift, max + shift);
+        };
+        document.addEventListener('mouseup', onUp);
+      };
+      host.ondblclick = () => {
+        timelineZoom = null;
+        renderTimeline([]);
+      };
+    }
     
     // Обновляем высоту контейнера
     host.style.height = `${Math.max(240, headerHeight + bars.length * yStep + 20)}px`;
     
     bars.forEach((b, index) => {
       const lane = index;
-      const x1 = Math.floor((new Date(b.start).getTime() - min) / dur * chartWidth) + labelWidth;
-      const x2 = Math.floor((new Date(b.end).getTime() - min) / dur * chartWidth) + labelWidth;
+      // полосы, выходящие за окно, обрезаются по его краям
+      const x1 = Math.floor(Math.max(0, (new Date(b.start).getTime() - min) / dur) * chartWidth) + labelWidth;
+      const x2 = Math.floor(Math.min(1, (new Date(b.end).getTime() - min) / dur) * chartWidth) + labelWidth;
       const y = headerHeight + lane * yStep + 8;
       
       // Создаем контейнер для строки
@@ -806,11 +1041,92 @@ async function importDirectoryFiles(selectedFiles) {
     host.appendChild(legend);
   }
 
+  // Live tail: для запусков в статусе live новые строки и дельты таймлайна приходят по SSE
+  let liveSource = null;
+  let timelineBars = null; // { runId, by, bars } последнего запроса /timeline
+  let timelineRedraw = null;
+
+  function stopLiveTail() {
+    if (liveSource) {
+      liveSource.close();
+      liveSource = null;
+    }
+  }
+
+  function startLiveTail() {
+    stopLiveTail();
+    if (!currentRunId || runStatuses.get(currentRunId) !== 'live') return;
+    const runId = currentRunId;
+    const by = qs('#timeline-group')?.value || 'tf_req_id';
+    const src = new EventSource(`${api()}/live/${runId}/events?by=${encodeURIComponent(by)}`);
+    liveSource = src;
+    src.addEventListener('rows', (e) => {
+      if (currentRunId !== runId) return;
+      const data = JSON.parse(e.data);
+      appendLiveRows(data.items, data.total);
+      mergeTimeline(runId, by, data.timeline);
+    });
+    // клиент отстал больше, чем сервер держит в буфере — перечитываем целиком
+    src.addEventListener('reset', () => {
+      if (currentRunId !== runId) return;
+      renderLogs();
+      renderTimeline([]);
+    });
+    src.addEventListener('done', () => {
+      stopLiveTail();
+      runStatuses.set(runId, 'parsed');
+      showNotification(`✓ Запуск #${runId} разобран полностью`, 'success');
+      loadRuns(runsPage, runsPageSize);
+      if (currentRunId === runId) {
+        renderLogs();
+        renderTimeline([]);
+      }
+    });
+  }
+
+  function appendLiveRows(items, total) {
+    const tbody = qs('#logs-table tbody');
+    // дописываем только на неполную последнюю страницу без группировки и фильтров
+    const filtered = Object.values(getFilters()).some(Boolean);
+    const room = pageSize - tbody.children.length;
+    if (!qs('#group-rows')?.checked && !filtered && room > 0) {
+      items.slice(0, room).forEach(it => appendRow(tbody, it));
+    }
+    qs('#page-info').textContent = `page ${page}, size ${pageSize}, total ${total} (live)`;
+  }
+
+  function mergeTimeline(runId, by, delta) {
+    if (!timelineBars || timelineBars.runId !== runId || timelineBars.by !== by) return;
+    const bars = timelineBars.bars;
+    const byKey = new Map(bars.map(b => [b.key, b]));
+    delta.forEach(d => {
+      const b = byKey.get(d.key);
+      if (!b) {
+        if (d.start) bars.push({ ...d, end: d.end || d.start });
+        return;
+      }
+      if (d.start && d.start < b.start) b.start = d.start;
+      if (d.end && d.end > b.end) b.end = d.end;
+      b.count += d.count;
+      b.errors += d.errors;
+      b.malformed += d.malformed;
+    });
+    // перерисовка не чаще раза в секунду
+    if (!timelineRedraw) {
+      timelineRedraw = setTimeout(() => {
+        timelineRedraw = null;
+        if (currentRunId === runId) renderTimeline([], timelineBars.bars.map(b => ({ ...b })));
+      }, 1000);
+    }
+  }
+
   async function renderLogs() {
     console.log('[RENDER DEBUG] ========== renderLogs() called ==========');
     const data = await fetchLogs();
-    const extras = data.extras ? ` (+${data.extras} доп.)` : '';
-    qs('#page-info').textContent = `page ${page}, size ${pageSize}, total ${data.total}${extras}`;
+    const cut = (data.truncated_keys || []).length ? `, пары обрезаны: ${data.truncated_keys.length}` : '';
+    const extras = data.extras ? ` (+${data.extras} доп.${cut})` : '';
+    const total = data.is_estimate ? `≈${data.total}` : data.total;
+    qs('#page-info').textContent = `page ${page}, size ${pageSize}, total ${total}${extras}`;
     const tbody = qs('#logs-table tbody');
     tbody.innerHTML = '';
     const groupOn = qs('#group-rows')?.checked;
@@ -1086,7 +1402,7 @@ async function importDirectoryFiles(selectedFiles) {
       <td></td>
     `;
     const cell = tr.children[7];
-    renderJsonCell(cell, it.data_json || {});
+    renderJsonCell(cell, it.json, it.id);
     tbody.appendChild(tr);
     return tr;
   }
@@ -1145,6 +1461,7 @@ async function importDirectoryFiles(selectedFiles) {
     // сохранять маску при изменении
     qs('#import-pattern').onchange = () => { try { localStorage.setItem('import-pattern', (qs('#import-pattern').value || '*').trim()); } catch { } };
     qs('#btn-import').onclick = () => selectAndImportDirectory();
+    qs('#btn-server-import').onclick = () => importServerDirectory();
     
     // Add event listener for the clear history button
     qs('#clear-history').onclick = () => clearHistory();
@@ -1181,7 +1498,7 @@ async function importDirectoryFiles(selectedFiles) {
     qs('#prev-page').onclick = () => { if (page > 1) { page--; renderLogs(); } };
     qs('#next-page').onclick = () => { page++; renderLogs(); };
     qs('#export-jsonl').onclick = () => { if (currentRunId) { window.open(`${api()}/export/jsonl?run_id=${currentRunId}`, '_blank'); } };
-    qs('#timeline-group').onchange = () => renderTimeline([]);
+    qs('#timeline-group').onchange = () => { renderTimeline([]); startLiveTail(); };
     qs('#export-timeline-json').onclick = () => { if (currentRunId) { const by = qs('#timeline-group').value; window.open(`${api()}/export/timeline.json?run_id=${currentRunId}&by=${by}`, '_blank'); } };
     qs('#export-timeline-csv').onclick = () => { if (currentRunId) { const by = qs('#timeline-group').value; window.open(`${api()}/export/timeline.csv?run_id=${currentRunId}&by=${by}`, '_blank'); } };
     qs('#export-timeline-image').onclick = () => exportTimelineAsImage();